@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+
+# Admission control of routes with `admission` option, enforced before any check of the request:
+#   1. Token bucket rate limit of each client, excess requests get 429
+#   2. Max concurrent in-flight requests of the route, requests wait for a slot until the queue deadline, then get 503
+#
+# Usage:
+#   route.yaml:
+#     createOrder:
+#       method   : post
+#       url      : /orders
+#       admission:
+#         maxConcurrent: 20    # In-flight requests of the route, in all processes
+#         queueTimeout : 500   # Milliseconds waiting in queue (including `X-Request-Start`), then 503
+#         rate         : 5     # Requests per second of each client
+#         burst        : 10
+#         clientKey    : ip    # `ip` or `header:<Header name>`
+#
+#   # State shared by processes on the same host
+#   route_loader = RouteLoader(admission_backend=SQLiteAdmissionBackend('/dev/shm/routeloader_admission.db'))
+
+from collections import OrderedDict
+import threading
+import asyncio
+import binascii
+import logging
+import sqlite3
+import math
+import time
+import os
+
+from flask import request
+
+from pt_dcxt.common import SQLiteBackend, get_route_name
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETRY_AFTER = 1
+
+# Slots of crashed processes are freed after this many seconds,
+# slots of in-flight requests are renewed by SQLiteAdmissionBackend every `lease time * RENEW_RATIO`
+DEFAULT_LEASE_TIME = 60
+RENEW_RATIO        = 1 / 3.0
+
+# Token buckets kept by MemoryAdmissionBackend
+DEFAULT_MAX_BUCKETS = 100000
+
+# Idle token buckets are removed by SQLiteAdmissionBackend at most once per interval
+PRUNE_INTERVAL = 60
+
+# Polling interval waiting for a slot, in seconds
+MIN_POLL_INTERVAL = 0.002
+MAX_POLL_INTERVAL = 0.02
+
+ADMISSION_OPTIONS = ('maxConcurrent', 'queueTimeout', 'rate', 'burst', 'clientKey', 'retryAfter', 'leaseTime')
+
+def gen_slot_id():
+    return binascii.hexlify(os.urandom(8)).decode('ascii')
+
+async def call_inline(func, *args):
+    # Default of `RouteAdmission.acquire_async()`, in-process backends do not block
+    return func(*args)
+
+def refill_bucket(tokens, updated_at, now, rate, burst):
+    # Returns (tokens after taking one or current tokens, seconds to wait, 0 when taken)
+    if tokens is None:
+        tokens = burst
+    else:
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+
+    if tokens >= 1:
+        return tokens - 1, 0
+
+    return tokens, (1 - tokens) / rate
+
+def parse_request_start(value):
+    # `X-Request-Start` set by proxies: `t=<seconds>` (nginx `t=${msec}`), milliseconds or microseconds.
+    # Returns seconds since epoch, or `None`
+    if not value:
+        return None
+
+    if value.startswith('t='):
+        value = value[2:]
+
+    try:
+        t = float(value)
+    except ValueError:
+        return None
+
+    if t > 1e14:
+        return t / 1e6
+    elif t > 1e11:
+        return t / 1e3
+
+    return t
+
+# Admission backends:
+#   acquire_slot(route_name, max_concurrent, lease_time) -> slot ID, or `None` when all slots are taken.
+#                                                           Called repeatedly while waiting for a slot
+#   release_slot(route_name, slot_id)
+#   take_token(bucket_key, rate, burst)                   -> 0 when taken, or seconds to wait
+class MemoryAdmissionBackend(object):
+    # State of current process, limits are per process
+    def __init__(self, max_buckets=None):
+        super(MemoryAdmissionBackend, self).__init__()
+
+        self.max_buckets = max_buckets or DEFAULT_MAX_BUCKETS
+
+        self._lock = threading.Lock()
+
+        # Route name -> in-flight requests
+        self._in_flight = {}
+        # Bucket key -> (tokens, updated at), least recently used first
+        self._buckets = OrderedDict()
+
+    def acquire_slot(self, route_name, max_concurrent, lease_time=None):
+        with self._lock:
+            in_flight = self._in_flight.get(route_name, 0)
+            if in_flight >= max_concurrent:
+                return None
+
+            self._in_flight[route_name] = in_flight + 1
+
+        return route_name
+
+    def release_slot(self, route_name, slot_id):
+        with self._lock:
+            self._in_flight[route_name] = max(self._in_flight.get(route_name, 0) - 1, 0)
+
+    def take_token(self, bucket_key, rate, burst):
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(bucket_key, (None, None))
+            tokens, wait = refill_bucket(tokens, updated_at, now, rate, burst)
+            self._buckets[bucket_key] = (tokens, now)
+
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+
+        return wait
+
+class SQLiteTransaction(object):
+    # `BEGIN IMMEDIATE` takes the write lock first, so that read-modify-write is atomic between processes
+    def __init__(self, conn):
+        super(SQLiteTransaction, self).__init__()
+
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.conn.execute('ROLLBACK' if exc_type is not None else 'COMMIT')
+
+class SQLiteAdmissionBackend(SQLiteBackend):
+    # State shared by processes on the same host, stored in a SQLite file.
+    # Put the file on a memory file system (e.g. `/dev/shm`), the state is not worth persisting.
+    # Transactions are started explicitly
+    isolation_level = None
+    pragmas         = ('PRAGMA synchronous = OFF',)
+
+    def __init__(self, db_path):
+        super(SQLiteAdmissionBackend, self).__init__(db_path)
+
+        self._last_prune = 0
+
+        # (route name, slot ID) -> lease time, slots of in-flight requests of current process
+        self._held_slots = {}
+        self._held_lock  = threading.Lock()
+
+        # Renewed by a daemon thread, at a fraction of the shortest lease time
+        self._renew_interval = DEFAULT_LEASE_TIME * RENEW_RATIO
+        self._renew_event    = threading.Event()
+        self._renew_pid      = None
+
+        conn = self.get_conn()
+        conn.execute('PRAGMA journal_mode = WAL')
+        with self.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS admission_slots (
+                    route_name TEXT NOT NULL,
+                    slot_id    TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (route_name, slot_id)
+                )''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS admission_buckets (
+                    bucket_key TEXT NOT NULL PRIMARY KEY,
+                    tokens     REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )''')
+
+    def transaction(self):
+        return SQLiteTransaction(self.get_conn())
+
+    def count_slots(self, conn, route_name, now):
+        return conn.execute('SELECT COUNT(*) FROM admission_slots WHERE route_name = ? AND expires_at > ?', (route_name, now)).fetchone()[0]
+
+    def acquire_slot(self, route_name, max_concurrent, lease_time=None):
+        lease_time = lease_time or DEFAULT_LEASE_TIME
+
+        # Read without the write lock first (WAL readers do not block writers),
+        # so that queued requests polling a full route do not serialize all processes on the write lock
+        now = time.time()
+        if self.count_slots(self.get_conn(), route_name, now) >= max_concurrent:
+            return None
+
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM admission_slots WHERE route_name = ? AND expires_at <= ?', (route_name, now))
+
+            if self.count_slots(conn, route_name, now) >= max_concurrent:
+                return None
+
+            slot_id = gen_slot_id()
+            conn.execute('INSERT INTO admission_slots VALUES (?, ?, ?)', (route_name, slot_id, now + lease_time))
+
+        with self._held_lock:
+            self._held_slots[(route_name, slot_id)] = lease_time
+
+        self.start_renewing(lease_time)
+        return slot_id
+
+    def release_slot(self, route_name, slot_id):
+        with self._held_lock:
+            self._held_slots.pop((route_name, slot_id), None)
+
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM admission_slots WHERE route_name = ? AND slot_id = ?', (route_name, slot_id))
+
+    def renew_slots(self):
+        # Extends leases of in-flight requests, so that long requests keep their slots
+        with self._held_lock:
+            held_slots = list(self._held_slots.items())
+
+        if not held_slots:
+            return
+
+        now = time.time()
+        with self.transaction() as conn:
+            conn.executemany('UPDATE admission_slots SET expires_at = ? WHERE route_name = ? AND slot_id = ?',
+                [(now + lease_time, route_name, slot_id) for (route_name, slot_id), lease_time in held_slots])
+
+    def renew_forever(self):
+        while True:
+            self._renew_event.wait(self._renew_interval)
+            self._renew_event.clear()
+
+            try:
+                self.renew_slots()
+            except sqlite3.Error as e:
+                # e.g. locked for too long, retried at the next interval
+                logger.warning('Failed to renew admission slots: %s', e)
+
+    def start_renewing(self, lease_time):
+        # Started in each process by the first slot acquired, threads do not survive fork
+        if lease_time * RENEW_RATIO < self._renew_interval:
+            self._renew_interval = lease_time * RENEW_RATIO
+            self._renew_event.set()
+
+        pid = os.getpid()
+        if self._renew_pid == pid:
+            return
+
+        with self._held_lock:
+            if self._renew_pid == pid:
+                return
+
+            self._renew_pid = pid
+
+        renew_thread = threading.Thread(target=self.renew_forever, name='admission-renew')
+        renew_thread.daemon = True
+        renew_thread.start()
+
+    def take_token(self, bucket_key, rate, burst):
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute('SELECT tokens, updated_at FROM admission_buckets WHERE bucket_key = ?', (bucket_key,)).fetchone()
+            tokens, wait = refill_bucket(row and row[0], row and row[1], now, rate, burst)
+            conn.execute('INSERT OR REPLACE INTO admission_buckets VALUES (?, ?, ?)', (bucket_key, tokens, now))
+
+            # Idle buckets are full again, the same as removed
+            if now - self._last_prune >= PRUNE_INTERVAL:
+                self._last_prune = now
+                conn.execute('DELETE FROM admission_buckets WHERE updated_at <= ?', (now - PRUNE_INTERVAL,))
+
+        return wait
+
+class RouteAdmission(object):
+    # Compiled `admission` option of a route
+    def __init__(self, config, backend):
+        super(RouteAdmission, self).__init__()
+
+        options = config['admission']
+        for k in options:
+            if k not in ADMISSION_OPTIONS:
+                raise ValueError('Unknown admission option `{}`'.format(k))
+
+        self.route_name = get_route_name(config)
+        self.backend    = backend
+
+        self.max_concurrent = options.get('maxConcurrent')
+        self.queue_timeout  = options.get('queueTimeout')
+        self.rate           = options.get('rate')
+        self.burst          = options.get('burst') or max(self.rate or 1, 1)
+        self.retry_after    = options.get('retryAfter', DEFAULT_RETRY_AFTER)
+        self.lease_time     = options.get('leaseTime', DEFAULT_LEASE_TIME)
+
+        client_key = options.get('clientKey') or 'ip'
+        if client_key != 'ip' and not client_key.startswith('header:'):
+            raise ValueError('Unknown admission client key `{}`, should be `ip` or `header:<Header name>`'.format(client_key))
+
+        self.client_key = client_key
+
+    def get_client_key(self, req):
+        if self.client_key == 'ip':
+            return req.remote_addr or ''
+
+        return req.headers.get(self.client_key[7:]) or ''
+
+    def get_queue_deadline(self, req):
+        # Time already queued before the app (e.g. in proxy or server backlog) counts
+        now = time.time()
+        request_start = parse_request_start(req.headers.get('X-Request-Start'))
+        if request_start is None or request_start > now:
+            request_start = now
+
+        return request_start + self.queue_timeout / 1000.0
+
+    def acquire_slot(self):
+        # Returns slot ID, or `None` when all slots are taken
+        return self.backend.acquire_slot(self.route_name, self.max_concurrent, self.lease_time)
+
+    def get_poll_intervals(self, deadline):
+        # Yields seconds to wait before trying again, until the queue deadline is over
+        if deadline is None:
+            return
+
+        poll_interval = MIN_POLL_INTERVAL
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+
+            yield min(poll_interval, remaining)
+            poll_interval = min(poll_interval * 2, MAX_POLL_INTERVAL)
+
+    def wait_for_slot(self, deadline):
+        # Returns slot ID, or `None` when the queue deadline is over
+        slot_id = self.acquire_slot()
+        if slot_id is None:
+            for wait in self.get_poll_intervals(deadline):
+                time.sleep(wait)
+                slot_id = self.acquire_slot()
+                if slot_id is not None:
+                    break
+
+        return slot_id
+
+    async def wait_for_slot_async(self, deadline, call):
+        # Waits without blocking the event loop
+        slot_id = await call(self.acquire_slot)
+        if slot_id is None:
+            for wait in self.get_poll_intervals(deadline):
+                await asyncio.sleep(wait)
+                slot_id = await call(self.acquire_slot)
+                if slot_id is not None:
+                    break
+
+        return slot_id
+
+    def admit(self, req):
+        # Checks before waiting for a slot.
+        # Returns (queue deadline or `None`, None), or (None, failure)
+        deadline = None
+        if self.queue_timeout:
+            # Clients of requests queued too long have probably given up
+            deadline = self.get_queue_deadline(req)
+            if deadline <= time.time():
+                return None, (503, self.retry_after, self.route_name, '$queueTimeout', self.queue_timeout)
+
+        if self.rate:
+            wait = self.backend.take_token('{}|{}'.format(self.route_name, self.get_client_key(req)), self.rate, self.burst)
+            if wait > 0:
+                return None, (429, int(math.ceil(wait)), self.route_name, '$rate', self.rate)
+
+        return deadline, None
+
+    def get_slot_result(self, slot_id):
+        if slot_id is None:
+            checker_name, checker_option = '$maxConcurrent', self.max_concurrent
+            if self.queue_timeout:
+                checker_name, checker_option = '$queueTimeout', self.queue_timeout
+
+            return None, (503, self.retry_after, self.route_name, checker_name, checker_option)
+
+        return slot_id, None
+
+    def acquire(self, req=None):
+        # Returns (slot ID or `None`, None), or (None, (status code, retry after, field name, checker name, checker option)).
+        # `req` is the Flask request by default
+        if req is None:
+            req = request
+
+        deadline, failure = self.admit(req)
+        if failure is not None or not self.max_concurrent:
+            return None, failure
+
+        return self.get_slot_result(self.wait_for_slot(deadline))
+
+    async def acquire_async(self, req, call=None):
+        # The same as `acquire()`, for AsyncRouteLoader (`req` is the Quart request).
+        # Backend calls are made by `await call(func, *args)`, e.g. in a thread pool for blocking backends
+        call = call or call_inline
+
+        deadline, failure = await call(self.admit, req)
+        if failure is not None or not self.max_concurrent:
+            return None, failure
+
+        return self.get_slot_result(await self.wait_for_slot_async(deadline, call))
+
+    def release(self, slot_id):
+        if slot_id is not None:
+            self.backend.release_slot(self.route_name, slot_id)
@@ -0,0 +1,493 @@
+# -*- coding: utf-8 -*-
+
+# RouteLoader for Quart (ASGI), with `async def` handlers and middlewares.
+# Route configs, check failure responses and API Documents are the same as RouteLoader.
+#
+# Usage:
+#   route_loader = AsyncRouteLoader()
+#
+#   @route_loader.route(app, ROUTE['app']['doPost'])
+#   async def do_post():
+#       return jsonify(await call_backend(g.body))
+
+from functools import wraps, partial
+from collections import OrderedDict
+import contextvars
+import asyncio
+import inspect
+import os
+
+from jinja2 import Environment, FileSystemLoader
+from quart import Blueprint, Response, request, g, abort, make_response, url_for
+from quart.utils import run_sync
+from quart.wrappers.response import DataBody
+from werkzeug.exceptions import HTTPException
+
+from pt_dcxt.jsoncodec import JSON_DECODE_ERRORS
+from pt_dcxt.routeloader import RouteLoader, create_admission_failure, create_overloaded_failure, \
+    normalize_middlewares, get_middleware_name, create_server_timing, has_request_body, timer
+from pt_dcxt.responsecache import MemoryCacheBackend, get_cache_key, create_cache_entry
+from pt_dcxt.responsebody import split_handler_result
+from pt_dcxt.signin import MemorySessionBackend
+from pt_dcxt.admission import MemoryAdmissionBackend, call_inline
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+# Bodies larger than this are parsed and checked in a thread pool, not blocking the event loop
+DEFAULT_OFFLOAD_BODY_SIZE = 64 * 1024
+
+def is_async_callable(func):
+    return inspect.iscoroutinefunction(func) or inspect.iscoroutinefunction(getattr(func, '__call__', None))
+
+async def call_middleware(func, *args):
+    # Sync middlewares are expected to be quick, and run in the event loop
+    ret = func(*args)
+    if inspect.isawaitable(ret):
+        ret = await ret
+
+    return ret
+
+def add_timing(name, elapsed):
+    route_timings = g.route_timings
+    route_timings[name] = route_timings.get(name, 0) + elapsed
+
+def record_timing(name, start):
+    add_timing(name, timer() - start)
+
+def is_data_response(response):
+    # Not a streamed or file response
+    return isinstance(response.response, DataBody)
+
+def is_blocking_backend(backend):
+    # In-process backends are quick, others (e.g. SQLite) may wait for I/O and file locks
+    return not isinstance(backend, (MemoryCacheBackend, MemorySessionBackend, MemoryAdmissionBackend))
+
+async def read_request_data(max_body_size=None):
+    # Async version of `routeloader.read_request_data()`.
+    # Returns `None` when the body is over `max_body_size`
+    if max_body_size is None:
+        return await request.get_data()
+
+    data = bytearray()
+    async for chunk in request.body:
+        data.extend(chunk)
+        if len(data) > max_body_size:
+            return None
+
+    return bytes(data)
+
+def parse_and_check_body(json_codec, checker, data):
+    # Returns (body, check result, parsing time, checking time), check result is `None` when the body is not valid JSON
+    start = timer()
+    try:
+        body = json_codec.loads(data)
+    except JSON_DECODE_ERRORS as e:
+        return None, None, timer() - start, 0
+    parsed = timer()
+
+    ret = checker.check(body)
+    return body, ret, parsed - start, timer() - parsed
+
+def wrap_async_middleware(middleware, next_stage, config):
+    # Same as `wrap_middleware()`, `before`/`after`/middleware functions can be sync or async
+    if hasattr(middleware, 'before') or hasattr(middleware, 'after'):
+        before = getattr(middleware, 'before', None)
+        after  = getattr(middleware, 'after', None)
+    else:
+        before = middleware
+        after  = None
+
+    name = 'middleware.' + get_middleware_name(middleware)
+
+    async def middleware_stage(*args, **kwargs):
+        if before is not None:
+            start = timer()
+            try:
+                ret = await call_middleware(before, config)
+            finally:
+                record_timing(name, start)
+
+            # Short-circuit
+            if ret is not None:
+                return ret
+
+        response = await next_stage(*args, **kwargs)
+
+        if after is not None:
+            start = timer()
+            try:
+                response = await make_response(response)
+                ret = await call_middleware(after, config, response)
+            finally:
+                record_timing(name + '.after', start)
+
+            # Replace response
+            if ret is not None:
+                response = ret
+
+        return response
+
+    return middleware_stage
+
+def wrap_async_response_body(response_body, handler):
+    # Same as `ResponseBody.wrap()`
+    @wraps(handler)
+    async def serialized_handler(*args, **kwargs):
+        ret = await handler(*args, **kwargs)
+
+        data, rest = split_handler_result(ret)
+        if isinstance(data, (dict, list)):
+            body, failure = response_body.dump_data(data, g.route_timings)
+            if failure is not None:
+                g.route_response_failure = failure
+
+            response = await make_response(body, *rest)
+            response.mimetype = 'application/json'
+            return response
+
+        # Responses made by handler (e.g. `jsonify()`) are only checked
+        if response_body.should_validate():
+            response = await make_response(ret)
+            if response.is_json and is_data_response(response):
+                data = await response.get_json(silent=True)
+                if data is not None:
+                    failure = response_body.validate(data, g.route_timings)
+                    if failure is not None:
+                        g.route_response_failure = failure
+
+            return response
+
+        return ret
+
+    return serialized_handler
+
+async def make_cached_response(response_cache, entry, hit):
+    response = Response(entry['body'], entry['status'])
+    response.headers.clear()
+    for k, v in entry['headers']:
+        response.headers.add(k, v)
+
+    response.set_etag(entry['etag'])
+    response.last_modified = entry['lastModified']
+    response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    if response_cache.vary_headers:
+        response.vary.update(response_cache.vary_headers)
+
+    await response.make_conditional(request)
+    return response
+
+def wrap_async_response_cache(response_cache, handler, call):
+    # Same as `ResponseCache.wrap()`, the cache backend is called by `await call(func, *args)`
+    @wraps(handler)
+    async def cached_handler(*args, **kwargs):
+        session_token_hash = None
+        if response_cache.require_sign_in:
+            # Not cached when sign-in is not enforced, the response may be of any user
+            session_token_hash = g.get('session_token_hash')
+            if session_token_hash is None:
+                return await handler(*args, **kwargs)
+
+        key = get_cache_key(kwargs, response_cache.vary_headers, session_token_hash, request)
+
+        entry = await call(response_cache.backend.get, response_cache.route_name, key)
+        if entry is not None:
+            return await make_cached_response(response_cache, entry, hit=True)
+
+        response = await make_response(await handler(*args, **kwargs))
+        if response.status_code != 200 or not is_data_response(response) or 'Set-Cookie' in response.headers:
+            return response
+
+        entry = create_cache_entry(response, await response.get_data())
+        await call(response_cache.backend.set, response_cache.route_name, key, entry, response_cache.ttl, response_cache.max_entries)
+        return await make_cached_response(response_cache, entry, hit=False)
+
+    return cached_handler
+
+def compose_async_middleware_chain(middlewares, handler, config):
+    # Sync handlers run in a thread, not blocking the event loop
+    if not is_async_callable(handler):
+        handler = run_sync(handler)
+
+    async def handler_stage(*args, **kwargs):
+        start = timer()
+        try:
+            return await handler(*args, **kwargs)
+        finally:
+            record_timing('handler', start)
+
+    chain = handler_stage
+    for middleware in reversed(middlewares):
+        chain = wrap_async_middleware(middleware, chain, config)
+
+    return chain
+
+class AsyncRouteLoader(RouteLoader):
+    # Checks, sign-in, admission, `cache` and `responseBody` are the same as RouteLoader.
+    # Not supported: `streamBody` (bodies are always buffered, and then checked), the batch route, the profiler and `warm_up()`
+    def __init__(self, middlewares=None, json_codec=None, server_timing=False, cache_backend=None, route_manifest=None,
+            budget=None, response_sample_rate=0.0, paging_secret=None, admission_backend=None,
+            offload_body_size=DEFAULT_OFFLOAD_BODY_SIZE, executor=None):
+        super(AsyncRouteLoader, self).__init__(
+            middlewares=middlewares,
+            json_codec=json_codec,
+            server_timing=server_timing,
+            cache_backend=cache_backend,
+            route_manifest=route_manifest,
+            budget=budget,
+            response_sample_rate=response_sample_rate,
+            paging_secret=paging_secret,
+            admission_backend=admission_backend)
+
+        # Bodies over `offload_body_size` bytes are parsed and checked in `executor`
+        # (`None` for the default executor of the event loop)
+        self.offload_body_size = offload_body_size
+        self.executor          = executor
+
+        # API Documents are rendered synchronously, and then cached
+        self.doc_jinja_env = Environment(loader=FileSystemLoader(os.path.join(basedir, 'templates')))
+
+    async def run_in_executor(self, func, *args):
+        # In a copy of current context, like `run_sync()`, so that `request` and `g` are available
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(contextvars.copy_context().run, func, *args))
+
+    def get_backend_call(self, backend):
+        # `await call(func, *args)` for calls of the backend, blocking backends are called in `executor`
+        if is_blocking_backend(backend):
+            return self.run_in_executor
+
+        return call_inline
+
+    def make_json_response(self, data, status_code=200):
+        return Response(self.json_codec.dumps(data), status_code, mimetype='application/json')
+
+    def make_check_failure_response(self, ret, status_code=400, headers=None):
+        # Failure is kept for metrics
+        g.route_check_failure = ret
+        response = self.make_json_response(ret, status_code)
+        if headers:
+            response.headers.update(headers)
+
+        return response
+
+    def compile_route(self, config, handler, middlewares=None):
+        route = self.create_route(config, handler, middlewares)
+
+        # Bodies are buffered, and then checked by the same checker
+        route['checkers'].pop('bodyStream', None)
+
+        # Sync handlers run in a thread, not blocking the event loop
+        handler_stage = handler
+        if not is_async_callable(handler_stage):
+            handler_stage = run_sync(handler_stage)
+
+        if route['responseBody']:
+            handler_stage = wrap_async_response_body(route['responseBody'], handler_stage)
+        if route['cache']:
+            handler_stage = wrap_async_response_cache(route['cache'], handler_stage, self.get_backend_call(route['cache'].backend))
+
+        route['chain'] = compose_async_middleware_chain(self.middlewares + normalize_middlewares(middlewares), handler_stage, config)
+        return route
+
+    def route(self, quart_app_or_blueprint, config, middlewares=None, **options):
+        def decorator(handler):
+            if isinstance(quart_app_or_blueprint, Blueprint):
+                config['prefix'] = quart_app_or_blueprint.url_prefix
+
+            route_index = len(self._ROUTES)
+            self._ROUTES.append(self.compile_route(config, handler, middlewares))
+            self._routes_version += 1
+
+            # Options for original Quart route options
+            rule     = config['url']
+            endpoint = options.pop('endpoint', None)
+            options['methods'] = [config['method']]
+
+            async def handle_request(route, *args, **kwargs):
+                checkers      = route['checkers']
+                chain         = route['chain']
+                max_body_size = route['maxBodySize']
+
+                ### Admission: checks before reading any byte of body ###
+                # Sessions not cached are verified by the session backend without blocking the event loop
+                verified = None
+                sign_in = self.sign_in
+                if sign_in is not None and route['requireSignIn']:
+                    start = timer()
+                    token = sign_in.get_token(request)
+                    verified = token, await sign_in.verify_async(token, self.get_backend_call(sign_in.backend))
+                    record_timing('check.signIn', start)
+
+                g_values, failure = self.check_request(route, request, kwargs, g.route_timings, verified)
+                if failure is not None:
+                    abort(self.make_check_failure_response(*failure))
+
+                for k, v in g_values.items():
+                    setattr(g, k, v)
+
+                ### Body ###
+                incomming_body = None
+
+                # Check body
+                if checkers.get('body'):
+                    start = timer()
+                    incomming_data = await read_request_data(max_body_size)
+                    record_timing('body.read', start)
+                    if incomming_data is None:
+                        ret = create_admission_failure('Content-Length', None, '$maxBodySize', max_body_size)
+                        abort(self.make_check_failure_response(ret, 413))
+
+                    if incomming_data:
+                        parse_and_check = partial(parse_and_check_body, self.json_codec, checkers['body'], incomming_data)
+                        if self.offload_body_size is not None and len(incomming_data) >= self.offload_body_size:
+                            incomming_body, ret, parse_elapsed, check_elapsed = await self.run_in_executor(parse_and_check)
+                        else:
+                            incomming_body, ret, parse_elapsed, check_elapsed = parse_and_check()
+
+                        add_timing('body.parse', parse_elapsed)
+                        if ret is None:
+                            ret = 'Invalid JSON string'
+                            abort(self.make_check_failure_response(ret, 400))
+
+                        add_timing('check.body', check_elapsed)
+                        if not ret.get('isValid'):
+                            # !! Change check failure response here
+                            abort(self.make_check_failure_response(ret, 400))
+
+                # Limit body size of routes without body checking
+                elif max_body_size is not None and has_request_body(request):
+                    if await read_request_data(max_body_size) is None:
+                        ret = create_admission_failure('Content-Length', None, '$maxBodySize', max_body_size)
+                        abort(self.make_check_failure_response(ret, 413))
+
+                # Parsed and checked payloads for handler
+                g.query = request.args
+                g.body  = incomming_body
+
+                # Run middlewares and handler
+                ret = await chain(*args, **kwargs)
+
+                if self.server_timing:
+                    ret = await make_response(ret)
+                    ret.headers['Server-Timing'] = create_server_timing(g.route_timings)
+
+                return ret
+
+            async def admit_request(route, *args, **kwargs):
+                admission = route['admission']
+                if admission is None:
+                    return await handle_request(route, *args, **kwargs)
+
+                # Waiting for a slot does not block the event loop, a slot is held until the handler returns
+                start = timer()
+                call = self.get_backend_call(admission.backend)
+                slot_id, failure = await admission.acquire_async(request, call)
+                record_timing('admission', start)
+                if failure is not None:
+                    abort(self.make_check_failure_response(*create_overloaded_failure(failure)))
+
+                try:
+                    return await handle_request(route, *args, **kwargs)
+                finally:
+                    await call(admission.release, slot_id)
+
+            @wraps(handler)
+            async def wrapped_handler(*args, **kwargs):
+                # The same compiled route is used during the whole request
+                route = self._ROUTES[route_index]
+
+                g.route_timings          = OrderedDict()
+                g.route_check_failure    = None
+                g.route_response_failure = None
+
+                metrics = self.metrics
+                if metrics is None:
+                    return await admit_request(route, *args, **kwargs)
+
+                start = timer()
+                status_code = 500
+                try:
+                    ret = await make_response(await admit_request(route, *args, **kwargs))
+                    status_code = ret.status_code
+                    return ret
+
+                except HTTPException as e:
+                    status_code = e.response.status_code if e.response is not None else e.code
+                    raise
+
+                finally:
+                    record_timing('total', start)
+                    metrics.observe_request(route['config'], g.route_timings, status_code, g.route_check_failure,
+                        g.route_response_failure)
+
+            return quart_app_or_blueprint.add_url_rule(rule, endpoint, wrapped_handler, **options)
+
+        return decorator
+
+    def get_doc_page_data(self):
+        page_data = super(AsyncRouteLoader, self).get_doc_page_data()
+        page_data['static_url'] = lambda filename: url_for('static', filename=filename)
+        return page_data
+
+    def render_doc(self):
+        page_data = self.get_doc_page_data()
+        return self.doc_jinja_env.get_template('api_doc.html').render(**page_data)
+
+    def render_doc_fragment(self, api_doc_id, doc_route):
+        c = doc_route['route']['config']
+
+        page_data = self.get_doc_page_data()
+        page_data.update({
+            'c'         : c,
+            'api_id'    : doc_route['apiId'],
+            'api_doc_id': api_doc_id,
+            'api_url'   : (c.get('prefix') or '') + c.get('url', ''),
+        })
+        return self.doc_jinja_env.get_template('api_doc_route.html').render(**page_data)
+
+    async def make_doc_response(self, doc_cache_entry):
+        if request.accept_encodings['gzip']:
+            response = Response(doc_cache_entry['gzip'], mimetype='text/html')
+            response.headers['Content-Encoding'] = 'gzip'
+            response.set_etag(doc_cache_entry['etag'] + '-gzip')
+        else:
+            response = Response(doc_cache_entry['html'], mimetype='text/html')
+            response.set_etag(doc_cache_entry['etag'])
+
+        response.headers['Vary'] = 'Accept-Encoding'
+        # Always revalidate by ETag
+        response.cache_control.no_cache = True
+
+        await response.make_conditional(request)
+        return response
+
+    async def doc_handler(self):
+        return await self.make_doc_response(self.get_doc_page())
+
+    async def doc_route_handler(self, api_doc_id):
+        if request.args.get('format') == 'json':
+            doc_route = self.get_doc_routes().get(api_doc_id)
+            if doc_route is None:
+                abort(404)
+
+            return self.make_json_response(self.get_doc_route_data(api_doc_id, doc_route))
+
+        doc_fragment = self.get_doc_fragment(api_doc_id)
+        if doc_fragment is None:
+            abort(404)
+
+        return await self.make_doc_response(doc_fragment)
+
+    async def metrics_handler(self):
+        return Response(self.metrics.export(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    # Sub-requests of the batch route are dispatched through the WSGI app, and cProfile can not follow coroutines
+    # across `await`, so these are rejected when created instead of registering routes that do not work
+    def create_batch(self, *args, **kwargs):
+        raise NotImplementedError('Batch route is not supported by AsyncRouteLoader, use `RouteLoader`')
+
+    def create_profiler(self, *args, **kwargs):
+        raise NotImplementedError('Profiler is not supported by AsyncRouteLoader, use `RouteLoader`')
+
+    def warm_up(self, *args, **kwargs):
+        raise NotImplementedError('Use `RouteLoader` with a pre-forking WSGI server to warm up')
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+# Batch route: several API calls in one HTTP request.
+# Each sub-request is dispatched in process through the WSGI app, so that it runs the same checks,
+# middlewares and handler (and is measured by metrics) as a standalone request.
+#
+# Usage:
+#   route_loader.create_batch(app, '/batch', max_items=10, max_concurrency=4)
+#
+#   POST /batch
+#   {"requests": [
+#     {"method": "get" , "url": "/menu", "query": {"canteenId": "1"}},
+#     {"method": "post", "url": "/cart", "body": {"dishId": 1}}
+#   ]}
+#
+#   {"results": [
+#     {"status": 200, "headers": {...}, "body": {...}},
+#     {"status": 400, "headers": {...}, "body": {"isValid": false, ...}}
+#   ]}
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import OrderedDict
+from urllib.parse import urlsplit
+import contextvars
+
+from flask import request, g, current_app
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+
+from pt_dcxt.objectchecker import ObjectChecker, ObjectCheckerException, create_check_result
+
+DEFAULT_BATCH_MAX_ITEMS     = 20
+DEFAULT_BATCH_CONCURRENCY   = 4
+DEFAULT_BATCH_WORKERS       = 16
+DEFAULT_BATCH_MAX_BODY_SIZE = 1024 * 1024
+
+BATCH_METHODS = ['get', 'post', 'put', 'delete']
+
+# Methods are accepted in both cases, e.g. `get` and `GET`
+BATCH_METHOD_OPTIONS = BATCH_METHODS + [m.upper() for m in BATCH_METHODS]
+
+# Headers of the batch request not passed to sub-requests
+UNINHERITED_HEADERS = ('content-type', 'content-length', 'transfer-encoding')
+
+# Headers of sub-responses not returned
+UNRETURNED_HEADERS = ('content-length',)
+
+def create_batch_config(rule, max_items):
+    config = OrderedDict([
+        ('showInDoc'  , True),
+        ('name'       , 'Batch requests'),
+        ('desc'       , 'Run several API calls in one request. '
+                        'Each sub-request is checked and handled the same as a standalone request, '
+                        'with the headers (e.g. `Authorization`, `Cookie`) of this request. '
+                        'Results are in the same order as `requests`.'),
+        ('method'     , 'post'),
+        ('url'        , rule),
+        ('response'   , 'json'),
+        ('maxBodySize', DEFAULT_BATCH_MAX_BODY_SIZE),
+        ('body', OrderedDict([
+            ('requests', OrderedDict([
+                ('$desc'      , 'Sub-requests'),
+                ('$isRequired', True),
+                ('$minLength' , 1),
+                ('$maxLength' , max_items),
+                ('$', OrderedDict([
+                    ('method', {
+                        '$desc'      : 'HTTP method',
+                        '$isRequired': True,
+                        '$type'      : 'enum',
+                        '$in'        : BATCH_METHOD_OPTIONS,
+                    }),
+                    ('url', {
+                        '$desc'      : 'URL path of the API, e.g. `/menu`',
+                        '$isRequired': True,
+                        '$type'      : 'string',
+                        '$minLength' : 1,
+                    }),
+                    ('query', {
+                        '$desc': 'Query params',
+                        '$type': 'json',
+                    }),
+                    ('headers', {
+                        '$desc': 'Extra headers',
+                        '$type': 'json',
+                    }),
+                    ('body', {
+                        '$desc': 'JSON body',
+                        '$type': 'any',
+                    }),
+                ])),
+            ])),
+        ])),
+    ])
+    return config
+
+def create_error_result(status_code, message):
+    ret = OrderedDict([
+        ('status' , status_code),
+        ('headers', {}),
+        ('body'   , message),
+    ])
+    return ret
+
+class Batch(object):
+    def __init__(self, route_loader, config, max_concurrency=None, workers=None):
+        super(Batch, self).__init__()
+
+        self.route_loader    = route_loader
+        self.config          = config
+        self.max_concurrency = max_concurrency or DEFAULT_BATCH_CONCURRENCY
+
+        # Shared by all batch requests, `max_concurrency` sub-requests of each batch request run at the same time
+        self.executor = ThreadPoolExecutor(max_workers=workers or DEFAULT_BATCH_WORKERS)
+
+    def get_headers(self, item):
+        # Sub-requests are made by the same client
+        headers = [(k, v) for k, v in request.headers.items() if k.lower() not in UNINHERITED_HEADERS]
+        for k, v in (item.get('headers') or {}).items():
+            headers = [(_k, _v) for _k, _v in headers if _k.lower() != k.lower()]
+            headers.append((k, str(v)))
+
+        return headers
+
+    def create_environ(self, item):
+        # Returns WSGI environ of the sub-request, or an error result
+        url = urlsplit(item['url'])
+        if url.scheme or url.netloc or not url.path.startswith('/'):
+            return None, create_error_result(400, 'Sub-request `url` should be a path, e.g. `/menu`')
+
+        builder = EnvironBuilder(
+            path=url.path,
+            method=item['method'].upper(),
+            headers=self.get_headers(item),
+            query_string=[(k, str(v)) for k, v in (item.get('query') or {}).items()] or None,
+            json=item['body'] if item.get('body') is not None else None,
+            environ_base={
+                'REMOTE_ADDR': request.remote_addr,
+            })
+
+        environ = builder.get_environ()
+        if url.query:
+            environ['QUERY_STRING'] = '&'.join(q for q in (url.query, environ.get('QUERY_STRING')) if q)
+
+        return environ, None
+
+    def check_route(self, app, environ):
+        # Only routes of the RouteLoader, and not the batch route itself
+        try:
+            rule, _ = app.url_map.bind_to_environ(environ).match(return_rule=True)
+        except HTTPException as e:
+            return create_error_result(e.code, e.description)
+
+        view_func = app.view_functions.get(rule.endpoint)
+        batch_rule = (self.config.get('prefix') or '') + self.config['url']
+        if getattr(view_func, 'route_loader', None) is not self.route_loader or rule.rule == batch_rule:
+            return create_error_result(404, 'Sub-request `url` is not an API of the batch route')
+
+        return None
+
+    def dispatch(self, app, environ):
+        # Runs without the batch request context (e.g. in the executor)
+        error_result = self.check_route(app, environ)
+        if error_result is not None:
+            return error_result
+
+        # `wsgi_app()` pushes its own app context when there is none. Run in an empty context,
+        # so that sub-requests dispatched in the batch request thread do not share its `g` either
+        response = contextvars.Context().run(app.response_class.from_app, app.wsgi_app, environ, buffered=True)
+
+        body = response.get_data()
+        if response.is_json:
+            try:
+                body = self.route_loader.json_codec.loads(body)
+            except Exception as e:
+                body = body.decode('utf-8', 'replace')
+        else:
+            body = body.decode('utf-8', 'replace')
+
+        ret = OrderedDict([
+            ('status' , response.status_code),
+            ('headers', dict((k, v) for k, v in response.headers.items() if k.lower() not in UNRETURNED_HEADERS)),
+            ('body'   , body),
+        ])
+        return ret
+
+    def run(self, items):
+        app = current_app._get_current_object()
+
+        # Environs are built from the batch request in this thread, and then dispatched
+        results  = [None] * len(items)
+        environs = []
+        for i, item in enumerate(items):
+            environ, error_result = self.create_environ(item)
+            if error_result is not None:
+                results[i] = error_result
+            else:
+                environs.append((i, environ))
+
+        if self.max_concurrency <= 1 or len(environs) <= 1:
+            for i, environ in environs:
+                results[i] = self.dispatch(app, environ)
+
+            return results
+
+        # At most `max_concurrency` sub-requests in the executor
+        environs.reverse()
+        pending = {}
+        while environs or pending:
+            while environs and len(pending) < self.max_concurrency:
+                i, environ = environs.pop()
+                pending[self.executor.submit(self.dispatch, app, environ)] = i
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+
+        return results
+
+    def handler(self):
+        # Body is already checked by the batch route config, except a request without body
+        if g.body is None:
+            error = ObjectCheckerException(type_='missing', field_name='requests')
+            ret = create_check_result(error, ObjectChecker().message_template)
+            return self.route_loader.make_check_failure_response(ret, 400)
+
+        return self.route_loader.make_json_response({'results': self.run(g.body['requests'])})
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+# Microbenchmarks of ObjectChecker, RouteLoader request overhead and API Document rendering.
+# Results are written as JSON, so that they can be compared between commits.
+#
+# Usage:
+#   python -m pt_dcxt.benchmark [--output benchmark.json] [--compare baseline.json] [--quick]
+
+from collections import OrderedDict
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+from flask import Flask, request, jsonify
+
+from pt_dcxt.routeloader import RouteLoader, flatten_param_config, gen_param_sample, timer, \
+    QUERY_CUSTOM_DIRECTIVES, BODY_CUSTOM_DIRECTIVES
+from pt_dcxt.objectchecker import ObjectChecker
+from pt_dcxt.routemanifest import load_route_manifest
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+ARRAY_SIZES = (10, 100, 1000, 10000)
+
+# Each repeat runs at least this long
+MIN_REPEAT_TIME = 0.2
+
+def autorange(func, min_time):
+    # Number of calls to run at least `min_time` seconds, like `timeit.Timer.autorange()`
+    number = 1
+    while True:
+        start = timer()
+        for _ in range(number):
+            func()
+        elapsed = timer() - start
+
+        if elapsed >= min_time:
+            return number
+
+        number *= 10 if elapsed < min_time / 10 else 2
+
+def run_benchmark(name, func, repeat=5, min_time=MIN_REPEAT_TIME):
+    number = autorange(func, min_time)
+
+    times = []
+    for _ in range(repeat):
+        start = timer()
+        for _ in range(number):
+            func()
+        times.append((timer() - start) / number)
+
+    times.sort()
+    result = OrderedDict([
+        ('name'        , name),
+        ('number'      , number),
+        ('repeat'      , repeat),
+        ('best'        , times[0]),
+        ('median'      , times[len(times) // 2]),
+        ('mean'        , sum(times) / len(times)),
+        ('opsPerSecond', 1.0 / times[0] if times[0] else None),
+    ])
+    return result
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=basedir, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_routes():
+    return load_route_manifest(os.path.join(basedir, 'route.yaml'), use_cache=False)['routes']
+
+def gen_valid_body(body_config):
+    return json.loads(json.dumps(gen_param_sample(body_config)))
+
+def gen_array_body(body_config, size):
+    # `jsonArrayField` with `size` elements, `$maxLength` is lifted
+    body_config = copy.deepcopy(body_config)
+    body_config['data']['jsonArrayField']['$maxLength'] = size
+
+    body = gen_valid_body(body_config)
+    element = body['data']['jsonArrayField'][0]
+    body['data']['jsonArrayField'] = [dict(element) for _ in range(size)]
+    return body_config, body
+
+def bench_object_checker(routes, options):
+    results = []
+
+    config = routes['app']['doPost']
+    cases = [
+        ('flat'  , QUERY_CUSTOM_DIRECTIVES, config['query'], {'abort': 'global_middlewares_1'}),
+        ('nested', BODY_CUSTOM_DIRECTIVES , config['body'] , gen_valid_body(config['body'])),
+    ]
+    for size in options['array_sizes']:
+        body_config, body = gen_array_body(config['body'], size)
+        cases.append(('jsonArrayField.{}'.format(size), BODY_CUSTOM_DIRECTIVES, body_config, body))
+
+    for case_name, custom_directives, param_config, data in cases:
+        # The same as RouteLoader
+        checker = ObjectChecker(default_required=False, custom_directives=custom_directives)
+        compiled_checker = checker.compile(param_config)
+
+        # Benchmark the success path only
+        assert compiled_checker.check(data)['isValid'], case_name
+
+        results.append(run_benchmark('objectchecker.check.{}'.format(case_name),
+            lambda: checker.check(data, param_config), repeat=options['repeat']))
+        results.append(run_benchmark('objectchecker.compiled.check.{}'.format(case_name),
+            lambda: compiled_checker.check(data), repeat=options['repeat']))
+
+    return results
+
+def create_bench_app(routes):
+    app = Flask(__name__, template_folder=os.path.join(basedir, 'templates'), static_folder=os.path.join(basedir, 'static'))
+    route_loader = RouteLoader()
+
+    config = copy.deepcopy(routes['app']['doPost'])
+
+    def bare_handler():
+        # The same as a bare Flask route parsing body by itself
+        return jsonify(json.loads(request.get_data()))
+    app.add_url_rule('/bare' + config['url'], 'bare_handler', bare_handler, methods=[config['method']])
+
+    @route_loader.route(app, config)
+    def routeloader_handler():
+        return jsonify(request.get_json())
+
+    index_config = copy.deepcopy(routes['app']['index'])
+    index_config['url'] = '/index'
+
+    @route_loader.route(app, index_config)
+    def routeloader_index():
+        return 'index'
+
+    app.add_url_rule('/bare/index', 'bare_index', lambda: 'index', methods=['GET'])
+
+    route_loader.create_doc(app, '/doc')
+    return app, route_loader
+
+def bench_route_loader(routes, options):
+    results = []
+
+    app, route_loader = create_bench_app(routes)
+    client = app.test_client()
+
+    config = routes['app']['doPost']
+    body = json.dumps(gen_valid_body(config['body']))
+    headers = {
+        'X-String-Header': 'X-String-Header',
+        'X-Enum-Header'  : 'enum1',
+    }
+    url = config['url'] + '?abort=global_middlewares_1'
+
+    assert client.post(url, data=body, headers=headers, content_type='application/json').status_code == 200
+    assert client.post('/bare' + url, data=body, headers=headers, content_type='application/json').status_code == 200
+
+    results.append(run_benchmark('request.bare.post',
+        lambda: client.post('/bare' + url, data=body, headers=headers, content_type='application/json'), repeat=options['repeat']))
+    results.append(run_benchmark('request.routeloader.post',
+        lambda: client.post(url, data=body, headers=headers, content_type='application/json'), repeat=options['repeat']))
+    results.append(run_benchmark('request.bare.get',
+        lambda: client.get('/bare/index'), repeat=options['repeat']))
+    results.append(run_benchmark('request.routeloader.get',
+        lambda: client.get('/index'), repeat=options['repeat']))
+
+    # API Document
+    with app.test_request_context():
+        results.append(run_benchmark('doc.render',
+            route_loader.render_doc, repeat=options['repeat']))
+
+    results.append(run_benchmark('doc.handler.cached',
+        lambda: client.get('/doc'), repeat=options['repeat']))
+
+    return results
+
+def bench_doc_helpers(routes, options):
+    body_config = routes['app']['doPost']['body']
+    return [
+        run_benchmark('flatten_param_config', lambda: flatten_param_config(body_config), repeat=options['repeat']),
+        run_benchmark('gen_param_sample', lambda: gen_param_sample(body_config), repeat=options['repeat']),
+    ]
+
+BENCHMARK_GROUPS = OrderedDict([
+    ('objectchecker', bench_object_checker),
+    ('routeloader'  , bench_route_loader),
+    ('dochelpers'   , bench_doc_helpers),
+])
+
+def run_benchmarks(groups=None, repeat=5, array_sizes=ARRAY_SIZES):
+    options = {
+        'repeat'     : repeat,
+        'array_sizes': array_sizes,
+    }
+
+    routes = load_routes()
+
+    results = []
+    for group_name, bench_group in BENCHMARK_GROUPS.items():
+        if groups and group_name not in groups:
+            continue
+
+        for result in bench_group(routes, options):
+            results.append(result)
+            print('{:<50} {:>14.3f} us {:>14.1f} ops/s'.format(result['name'], result['best'] * 1e6, result['opsPerSecond']))
+
+    report = OrderedDict([
+        ('meta', OrderedDict([
+            ('time'     , time.strftime('%Y-%m-%dT%H:%M:%S%z')),
+            ('gitCommit', get_git_commit()),
+            ('python'   , platform.python_version()),
+            ('platform' , platform.platform()),
+        ])),
+        ('results', results),
+    ])
+    return report
+
+def compare_reports(baseline, report):
+    # Change of best time, negative is faster
+    baseline_results = dict((r['name'], r) for r in baseline['results'])
+
+    print('')
+    print('{:<50} {:>14} {:>14} {:>9}'.format('Name', 'Baseline (us)', 'Current (us)', 'Change'))
+    for r in report['results']:
+        b = baseline_results.get(r['name'])
+        if b is None:
+            continue
+
+        change = (r['best'] - b['best']) / b['best'] * 100
+        print('{:<50} {:>14.3f} {:>14.3f} {:>+8.1f}%'.format(r['name'], b['best'] * 1e6, r['best'] * 1e6, change))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run microbenchmarks of RouteLoader')
+    parser.add_argument('--output', default='benchmark.json',
+        help='Output JSON file (default: benchmark.json)')
+    parser.add_argument('--compare',
+        help='Baseline JSON file to compare with')
+    parser.add_argument('--group', action='append', choices=list(BENCHMARK_GROUPS),
+        help='Benchmark group to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=5,
+        help='Repeat times of each benchmark (default: 5)')
+    parser.add_argument('--quick', action='store_true',
+        help='Repeat 3 times and skip the 10k elements array')
+    args = parser.parse_args(argv)
+
+    repeat = args.repeat
+    array_sizes = ARRAY_SIZES
+    if args.quick:
+        repeat = 3
+        array_sizes = tuple(s for s in ARRAY_SIZES if s < 10000)
+
+    report = run_benchmarks(groups=args.group, repeat=repeat, array_sizes=array_sizes)
+
+    with open(args.output, 'w') as _f:
+        _f.write(json.dumps(report, indent=2))
+    print('Results: {}'.format(args.output))
+
+    if args.compare:
+        with open(args.compare) as _f:
+            compare_reports(json.loads(_f.read()), report)
+
+if __name__ == '__main__':
+    sys.exit(main())
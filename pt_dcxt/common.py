@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+# Helpers shared by core modules
+
+import threading
+import sqlite3
+
+# Seconds waiting for the lock of another process
+SQLITE_TIMEOUT = 5
+
+def get_route_name(config):
+    # e.g. `POST /my_module/<param_field>/do_post`, used in state keys, logs and reports
+    return '{} {}'.format(config.get('method', '').upper(), (config.get('prefix') or '') + config.get('url', ''))
+
+class SQLiteBackend(object):
+    # Base of backends sharing state between processes on the same host in a SQLite file.
+    # `isolation_level = None` to start transactions explicitly, `pragmas` are run on each new connection
+    isolation_level = ''
+    pragmas         = ()
+
+    def __init__(self, db_path):
+        super(SQLiteBackend, self).__init__()
+
+        self.db_path = db_path
+        self._local  = threading.local()
+
+    def get_conn(self):
+        # One connection for each thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.db_path, timeout=SQLITE_TIMEOUT, isolation_level=self.isolation_level)
+            for pragma in self.pragmas:
+                conn.execute(pragma)
+
+        return conn
@@ -1,18 +1,12 @@
 # -*- coding: utf-8 -*-
 
 import os
-import json
 
-try:
-    # Use oyaml to keep the key orders
-    import oyaml as yaml
-except ImportError:
-    import yaml
-
-from flask import Flask, Blueprint, request, render_template, jsonify
+from flask import Flask, Blueprint, request, g, render_template, jsonify
 
 from pt_dcxt.routeloader import RouteLoader
-from pt_dcxt.my_middlewares import global_middlewares_1, global_middlewares_2, api_middlewares_1, api_middlewares_2
+from pt_dcxt.routemanifest import load_route_manifest
+from pt_dcxt.my_middlewares import global_middlewares_1, global_middlewares_2, api_middlewares_1, api_middlewares_2, ApiMiddleware3
 from pt_dcxt.my_decorators import api_decorator_1, api_decorator_2
 
 
@@ -20,10 +14,10 @@ from pt_dcxt.my_decorators import api_decorator_1, api_decorator_2
 ##### Init RouteLoader #####
 
 # Load API config file
-ROUTE = None
+# (parsed once and cached as `route.yaml.manifest` until `route.yaml` is changed)
 basedir = os.path.abspath(os.path.dirname(__file__))
-with open(basedir + '/route.yaml', encoding="utf-8") as _f:
-    ROUTE = yaml.load(_f.read())
+ROUTE_MANIFEST = load_route_manifest(basedir + '/route.yaml')
+ROUTE = ROUTE_MANIFEST['routes']
 
 
 ##### Use RouteLoader on Flask app object #####
@@ -32,7 +26,7 @@ global_middlewares = [
     global_middlewares_1,
     global_middlewares_2,
 ]
-route_loader = RouteLoader(middlewares=global_middlewares)
+route_loader = RouteLoader(middlewares=global_middlewares, route_manifest=ROUTE_MANIFEST)
 
 # Flask app object
 app = Flask(__name__)
@@ -41,7 +35,7 @@ app = Flask(__name__)
 def index():
     return render_template('index.html')
 
-@route_loader.route(app, ROUTE['app']['doPost'], middlewares=[api_middlewares_1, api_middlewares_2])
+@route_loader.route(app, ROUTE['app']['doPost'], middlewares=[api_middlewares_1, api_middlewares_2, ApiMiddleware3()])
 @api_decorator_1
 @api_decorator_2
 def do_post():
@@ -63,13 +57,15 @@ def my_module_index():
 
 @route_loader.route(my_module_bp, ROUTE['myModule']['doPost'])
 def my_module_do_post(**kwargs):
-    body = json.loads(request.get_data(as_text=True))
+    # Body is already parsed and checked by RouteLoader
+    body = g.body
     print(body)
     return jsonify({"param": kwargs, "body": body})
 
 @route_loader.route(my_module_bp, ROUTE['myModule']['doPostWithOutBody'])
 def my_module_do_post_without_body(**kwargs):
-    return jsonify({"param": kwargs})
+    # Serialized by `responseBody`
+    return {"param": kwargs}
 
 # Register blueprint
 app.register_blueprint(my_module_bp)
@@ -81,5 +77,10 @@ route_loader.create_doc(app, '/doc')
 
 
 
+##### Metrics #####
+route_loader.create_metrics(app, '/metrics')
+
+
+
 ##### Other options #####
 app.config['TEMPLATES_AUTO_RELOAD'] = True
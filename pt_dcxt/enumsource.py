@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+# Large enums for `$inSource` / `$commaArrayInSource` directives.
+# Values are loaded from a file or a provider function on first use, kept in memory as a frozenset,
+# and reloaded after TTL, so that thousands of values are neither inlined in route.yaml nor scanned per request.
+#
+# Usage:
+#   register_enum_file('canteenWindows', basedir + '/enums/canteen_windows.txt', ttl=300)
+#
+#   @register_enum_provider('dishIds', ttl=60)
+#   def load_dish_ids():
+#       return [row.id for row in Dish.query.all()]
+#
+#   route.yaml:
+#     dishId:
+#       $type    : enum
+#       $inSource: dishIds
+
+import threading
+import logging
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Name -> EnumSource
+ENUM_SOURCES = {}
+
+def read_enum_file(file_path):
+    # `.json` and `.yaml` files contain a list, other files contain one value per line (`#` for comments)
+    ext = os.path.splitext(file_path)[1].lower()
+    with open(file_path, encoding='utf-8') as _f:
+        if ext == '.json':
+            return json.load(_f)
+
+        elif ext in ('.yaml', '.yml'):
+            import yaml
+            return yaml.safe_load(_f)
+
+        values = []
+        for line in _f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                values.append(line)
+
+        return values
+
+def create_file_loader(file_path):
+    # The file is read again only when modified
+    state = {
+        'mtime' : None,
+        'values': None,
+    }
+
+    def load_enum_file():
+        mtime = os.path.getmtime(file_path)
+        if mtime != state['mtime']:
+            state['values'] = read_enum_file(file_path)
+            state['mtime']  = mtime
+
+        return state['values']
+
+    return load_enum_file
+
+class EnumSource(object):
+    def __init__(self, name, load, ttl=None):
+        super(EnumSource, self).__init__()
+
+        self.name = name
+        self.load = load
+        # Seconds, `None` to never reload
+        self.ttl  = ttl
+
+        # Values in original order (for samples), and the index for checks
+        self.values    = None
+        self.value_set = None
+        self.loaded_at = None
+
+        self._loaded = None
+        self._lock   = threading.Lock()
+
+    def is_expired(self):
+        return self.ttl is not None and time.time() - self.loaded_at >= self.ttl
+
+    def reload(self):
+        loaded = self.load()
+
+        # Unchanged (e.g. file not modified), keep the index
+        if loaded is not self._loaded or self.value_set is None:
+            values = tuple(loaded)
+            self.value_set = frozenset(values)
+            self.values    = values
+            self._loaded   = loaded
+
+        self.loaded_at = time.time()
+
+    def refresh(self):
+        # Loaded on first use. After TTL, one thread reloads while the others keep using current values
+        if self.value_set is None:
+            with self._lock:
+                if self.value_set is None:
+                    self.reload()
+
+            return
+
+        if not self.is_expired() or not self._lock.acquire(False):
+            return
+
+        try:
+            if self.is_expired():
+                self.reload()
+
+        except Exception:
+            # Keep current values, and retry after TTL
+            self.loaded_at = time.time()
+            logger.exception('Failed to reload enum source: %s', self.name)
+
+        finally:
+            self._lock.release()
+
+    def get_values(self):
+        self.refresh()
+        return self.values
+
+    def get_value_set(self):
+        self.refresh()
+        return self.value_set
+
+    def __contains__(self, v):
+        try:
+            return v in self.get_value_set()
+        except TypeError:
+            # Unhashable values are never in the enum
+            return False
+
+def register_enum_source(name, load, ttl=None):
+    source = EnumSource(name, load, ttl)
+    ENUM_SOURCES[name] = source
+    return source
+
+def register_enum_provider(name, func=None, ttl=None):
+    # `func()` returns an iterable of values, can be used as a decorator
+    if func is None:
+        def decorator(f):
+            register_enum_source(name, f, ttl)
+            return f
+
+        return decorator
+
+    return register_enum_source(name, func, ttl)
+
+def register_enum_file(name, file_path, ttl=None):
+    return register_enum_source(name, create_file_loader(file_path), ttl)
+
+def get_enum_source(name):
+    source = ENUM_SOURCES.get(name)
+    if source is None:
+        raise ValueError('Enum source `{}` is not registered'.format(name))
+
+    return source
+
+def get_enum_options(options, directive='$in'):
+    # Values of `$in` or `$inSource` (`$commaArrayIn` or `$commaArrayInSource`), `None` when not set
+    if options.get(directive):
+        return list(options[directive])
+
+    if options.get(directive + 'Source'):
+        return list(get_enum_source(options[directive + 'Source']).get_values())
+
+    return None
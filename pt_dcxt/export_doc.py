@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+# Export API Documents without serving requests:
+#   1. Static HTML API Document (with local `static/` resources)
+#   2. OpenAPI 3 document
+#
+# Usage:
+#   python -m pt_dcxt.export_doc [pt_dcxt.demo:route_loader] [--output-dir api_doc]
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import importlib
+
+from jinja2 import Environment, FileSystemLoader
+
+from pt_dcxt.openapi import gen_openapi
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+def load_route_loader(target):
+    # `target` is `<module>:<RouteLoader object name>`
+    module_name, _, attr = target.partition(':')
+    module = importlib.import_module(module_name)
+    return getattr(module, attr or 'route_loader')
+
+def export_html(route_loader, output_dir):
+    env = Environment(loader=FileSystemLoader(os.path.join(basedir, 'templates')))
+    template = env.get_template('api_doc.html')
+
+    page_data = route_loader.get_doc_page_data()
+    page_data.update({
+        'doc_rule'  : 'index.html',
+        'lazy'      : False,
+        'use_cdn'   : False,
+        'static_url': lambda filename: 'static/' + filename,
+    })
+    html = template.render(**page_data)
+
+    output_path = os.path.join(output_dir, 'index.html')
+    with open(output_path, 'w', encoding='utf-8') as _f:
+        _f.write(html)
+
+    static_dir = os.path.join(output_dir, 'static')
+    if os.path.exists(static_dir):
+        shutil.rmtree(static_dir)
+    shutil.copytree(os.path.join(basedir, 'static'), static_dir)
+
+    return output_path
+
+def export_openapi(route_loader, output_dir, title=None, version=None, all_routes=False):
+    spec = gen_openapi(route_loader, title=title, version=version, all_routes=all_routes)
+
+    output_path = os.path.join(output_dir, 'openapi.json')
+    with open(output_path, 'w', encoding='utf-8') as _f:
+        _f.write(json.dumps(spec, indent=2, ensure_ascii=False, default=str))
+
+    return output_path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export static API Document and OpenAPI document')
+    parser.add_argument('route_loader', nargs='?', default='pt_dcxt.demo:route_loader',
+        help='RouteLoader object to export, in `<module>:<name>` format (default: pt_dcxt.demo:route_loader)')
+    parser.add_argument('--output-dir', default='api_doc',
+        help='Output directory (default: api_doc)')
+    parser.add_argument('--title', help='OpenAPI title')
+    parser.add_argument('--version', help='OpenAPI version')
+    parser.add_argument('--all-routes', action='store_true',
+        help='Export routes without `showInDoc: true` to OpenAPI document')
+    args = parser.parse_args(argv)
+
+    # Routes are registered when the module is imported, no request is served
+    route_loader = load_route_loader(args.route_loader)
+
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    print('HTML   : {}'.format(export_html(route_loader, args.output_dir)))
+    print('OpenAPI: {}'.format(export_openapi(route_loader, args.output_dir,
+        title=args.title, version=args.version, all_routes=args.all_routes)))
+
+if __name__ == '__main__':
+    sys.exit(main())
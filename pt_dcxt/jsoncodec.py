@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# 19+ digits may not fit in 64 bits, some `orjson` versions parse such integers as float silently
+LONG_DIGITS_PATTERN       = re.compile(r'[0-9]{19}')
+LONG_DIGITS_BYTES_PATTERN = re.compile(br'[0-9]{19}')
+
+def has_long_digits(s):
+    if isinstance(s, str):
+        return LONG_DIGITS_PATTERN.search(s) is not None
+    return LONG_DIGITS_BYTES_PATTERN.search(s) is not None
+
+# Raised by `loads()` of all codecs for invalid JSON (`JSONDecodeError`, `UnicodeDecodeError`) or too deep nesting
+JSON_DECODE_ERRORS = (ValueError, RecursionError)
+
+class JSONCodec(object):
+    # Standard `json` module, also the fallback of other codecs
+    name = 'json'
+
+    def loads(self, s):
+        return json.loads(s)
+
+    def dumps(self, obj, indent=None):
+        return json.dumps(obj, indent=indent)
+
+class OrJSONCodec(JSONCodec):
+    name = 'orjson'
+
+    def loads(self, s):
+        if has_long_digits(s):
+            return super(OrJSONCodec, self).loads(s)
+
+        try:
+            return orjson.loads(s)
+        except ValueError:
+            # e.g. NaN, int over 64 bits
+            return super(OrJSONCodec, self).loads(s)
+
+    def dumps(self, obj, indent=None):
+        option = 0
+        if indent is not None:
+            # orjson only supports 2 spaces indent
+            option |= orjson.OPT_INDENT_2
+
+        try:
+            return orjson.dumps(obj, option=option).decode('utf-8')
+        except TypeError:
+            # e.g. non-str keys, big int
+            return super(OrJSONCodec, self).dumps(obj, indent=indent)
+
+class UJSONCodec(JSONCodec):
+    name = 'ujson'
+
+    def loads(self, s):
+        try:
+            return ujson.loads(s)
+        except ValueError:
+            # e.g. big int
+            return super(UJSONCodec, self).loads(s)
+
+    def dumps(self, obj, indent=None):
+        try:
+            return ujson.dumps(obj, indent=indent or 0, escape_forward_slashes=False)
+        except (TypeError, OverflowError):
+            return super(UJSONCodec, self).dumps(obj, indent=indent)
+
+JSON_CODECS = {
+    'json'  : JSONCodec,
+    'orjson': OrJSONCodec,
+    'ujson' : UJSONCodec,
+}
+
+AVAILABLE_JSON_CODECS = [name for name, module in (('orjson', orjson), ('ujson', ujson)) if module is not None] + ['json']
+
+def get_json_codec(codec=None):
+    # `codec` can be a codec name, a codec object or `None` for the standard `json` module.
+    # Fast codecs are opt-in, values they can not parse or dump fall back to `json`
+    if codec is None:
+        codec = 'json'
+
+    if hasattr(codec, 'loads') and hasattr(codec, 'dumps'):
+        return codec
+
+    if codec not in AVAILABLE_JSON_CODECS:
+        raise ValueError('JSON codec `{}` is not available, available codecs: {}'.format(codec, ', '.join(AVAILABLE_JSON_CODECS)))
+
+    return JSON_CODECS[codec]()
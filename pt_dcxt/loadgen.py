@@ -0,0 +1,437 @@
+# -*- coding: utf-8 -*-
+
+# Load generator driven by route configs.
+# Valid requests are generated by `gen_param_sample()`, invalid requests by breaking one directive at a time
+# (type, length, value range, enum, required field). Requests are sent to a local threaded WSGI server,
+# and throughput, p50/p99 latency and the rejection mix of each route are reported.
+#
+# Usage:
+#   python -m pt_dcxt.loadgen [pt_dcxt.demo:app] [--concurrency 8] [--duration 10] [--invalid-ratio 0.2]
+
+from collections import OrderedDict, Counter
+import re
+import sys
+import copy
+import json
+import math
+import time
+import random
+import itertools
+import argparse
+import importlib
+import threading
+import http.client
+
+try:
+    from urllib.parse import urlencode, quote
+except ImportError:
+    from urllib import urlencode, quote
+
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+from pt_dcxt.routeloader import ROUTE_CHECKER_CUSTOM_DIRECTIVES, timer
+from pt_dcxt.enumsource import get_enum_options
+from pt_dcxt.common import get_route_name
+
+re_url_param = re.compile(r'<(?:[^:<>]+:)?([^<>]+)>')
+
+# Marks a field to be removed
+MISSING = object()
+
+INVALID_VALUE = '__invalid__'
+
+# `$type` is only checked in body, see `ROUTE_CHECKER_CUSTOM_DIRECTIVES`
+TYPE_MUTATIONS = {
+    'int'    : 'not-a-number',
+    'integer': 'not-a-number',
+    'number' : 'not-a-number',
+    'str'    : 12345,
+    'string' : 12345,
+    'boolean': 'not-a-boolean',
+    'array'  : 'not-an-array',
+    'json'   : 'not-an-object',
+}
+
+def set_value(obj, path, value):
+    # `path` is a key of flattened param config, e.g. `data.jsonArrayField.0.intField`
+    parts = path.split('.')
+    for step in parts[:-1]:
+        obj = obj[int(step)] if isinstance(obj, list) else obj[step]
+
+    step = parts[-1]
+    if isinstance(obj, list):
+        step = int(step)
+        if value is MISSING:
+            del obj[step]
+        else:
+            obj[step] = value
+
+    elif value is MISSING:
+        obj.pop(step, None)
+    else:
+        obj[step] = value
+
+def get_value(obj, path):
+    for step in path.split('.'):
+        obj = obj[int(step)] if isinstance(obj, list) else obj.get(step)
+        if obj is None:
+            return None
+
+    return obj
+
+def gen_field_mutations(category, options, value):
+    # Yields (checker name, invalid value)
+    _type = options.get('$type')
+
+    if options.get('$isRequired') or options.get('$required'):
+        # URL params can not be missing
+        if category != 'params':
+            yield '$isRequired', MISSING
+
+    if category == 'body' and _type in TYPE_MUTATIONS:
+        yield '$type', TYPE_MUTATIONS[_type]
+
+    if options.get('$in'):
+        yield '$in', INVALID_VALUE
+
+    if options.get('$inSource'):
+        yield '$inSource', INVALID_VALUE
+
+    for directive in ('$commaArrayIn', '$commaArrayInSource'):
+        if options.get(directive):
+            yield directive, '{},{}'.format(get_enum_options(options, '$commaArrayIn')[0], INVALID_VALUE)
+
+    if options.get('$minValue') is not None:
+        yield '$minValue', options['$minValue'] - 1
+
+    if options.get('$maxValue') is not None:
+        yield '$maxValue', options['$maxValue'] + 1
+
+    if _type == 'array':
+        element = value[0] if value else None
+        if options.get('$minLength'):
+            yield '$minLength', [element] * (options['$minLength'] - 1)
+        if options.get('$maxLength') is not None:
+            yield '$maxLength', [element] * (options['$maxLength'] + 1)
+
+    else:
+        if options.get('$minLength'):
+            yield '$minLength', 'x' * (options['$minLength'] - 1)
+        if options.get('$maxLength') is not None:
+            yield '$maxLength', 'x' * (options['$maxLength'] + 1)
+
+def gen_invalid_samples(route_loader, config, samples):
+    # Yields (variant name, samples), each variant breaks exactly one directive of one field
+    for category in ROUTE_CHECKER_CUSTOM_DIRECTIVES:
+        if not config.get(category):
+            continue
+
+        for path, options in route_loader.flatten_param_config(config[category]).items():
+            value = get_value(samples[category], path)
+            for checker_name, invalid_value in gen_field_mutations(category, options, value):
+                invalid_samples = copy.deepcopy(samples)
+                set_value(invalid_samples[category], path, invalid_value)
+
+                name = '{}:{}:{}'.format(category, path, checker_name)
+                yield name, invalid_samples
+
+def create_request(config, samples):
+    # Returns (method, path, headers, body)
+    params = samples.get('params') or {}
+    path = re_url_param.sub(lambda m: quote(str(params.get(m.group(1), 1)), safe=''), config['url'])
+    path = (config.get('prefix') or '') + path
+
+    query = samples.get('query')
+    if query:
+        path += '?' + urlencode([(k, str(v)) for k, v in query.items()])
+
+    headers = dict((k, str(v)) for k, v in (samples.get('headers') or {}).items())
+
+    body = None
+    if 'body' in samples:
+        content_types = config.get('contentType') or 'application/json'
+        if isinstance(content_types, (tuple, list)):
+            content_types = content_types[0]
+
+        body = json.dumps(samples['body']).encode('utf-8')
+        headers['Content-Type'] = content_types
+
+    return config['method'].upper(), path, headers, body
+
+def create_load_plan(route_loader):
+    # Route name -> {'valid': request, 'invalid': [(variant name, request)]}
+    plan = OrderedDict()
+    for route in route_loader._ROUTES:
+        config = route['config']
+
+        samples = OrderedDict()
+        for category in ROUTE_CHECKER_CUSTOM_DIRECTIVES:
+            if config.get(category):
+                samples[category] = json.loads(json.dumps(route_loader.gen_param_sample(config[category])))
+
+        # Optional query parameters usually switch behaviours (e.g. `abort` of demo), only required ones are sent
+        if 'query' in samples:
+            for k, v in config['query'].items():
+                if isinstance(v, dict) and not (v.get('$isRequired') or v.get('$required')):
+                    samples['query'].pop(k, None)
+
+        plan[get_route_name(config)] = {
+            'valid'  : create_request(config, samples),
+            'invalid': [(name, create_request(config, s)) for name, s in gen_invalid_samples(route_loader, config, samples)],
+        }
+
+    return plan
+
+def get_rejection_type(status, data):
+    # Same types as metrics: `<type>:<checkerName>` of check failures, `invalidJSON`, or `other`
+    try:
+        ret = json.loads(data)
+    except ValueError:
+        return 'other'
+
+    if isinstance(ret, dict) and isinstance(ret.get('detail'), dict):
+        detail = ret['detail']
+        if not detail.get('checkerName'):
+            return detail.get('type')
+
+        return '{}:{}'.format(detail.get('type'), detail.get('checkerName'))
+    elif isinstance(ret, str):
+        return 'invalidJSON'
+
+    return 'other'
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return None
+
+    index = int(math.ceil(p / 100.0 * len(sorted_values))) - 1
+    return sorted_values[max(index, 0)]
+
+def create_route_stats():
+    return {
+        'latencies'      : [],
+        'errors'         : 0,
+        'statuses'       : Counter(),
+        'rejections'     : Counter(),
+        'validRejected'  : 0,
+        'invalidAccepted': 0,
+    }
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+class LoadGenerator(object):
+    def __init__(self, app, route_loader, concurrency=8, invalid_ratio=0.2, seed=None, host='127.0.0.1'):
+        super(LoadGenerator, self).__init__()
+
+        self.app           = app
+        self.route_loader  = route_loader
+        self.concurrency   = concurrency
+        self.invalid_ratio = invalid_ratio
+        self.seed          = seed
+        self.host          = host
+
+        self.plan = create_load_plan(route_loader)
+
+    def start_server(self):
+        # Random free port
+        server = make_server(self.host, 0, self.app, threaded=True, request_handler=QuietRequestHandler)
+
+        server_thread = threading.Thread(target=server.serve_forever, name='LoadGeneratorServer')
+        server_thread.daemon = True
+        server_thread.start()
+        return server
+
+    def run_worker(self, worker_index, port, deadline, counter, max_requests):
+        rand = random.Random(None if self.seed is None else self.seed + worker_index)
+        route_names = list(self.plan)
+
+        stats = dict((route_name, create_route_stats()) for route_name in route_names)
+        conn = http.client.HTTPConnection(self.host, port)
+
+        while timer() < deadline:
+            if max_requests is not None and next(counter) >= max_requests:
+                break
+
+            route_name = rand.choice(route_names)
+            route_plan = self.plan[route_name]
+
+            is_valid = not route_plan['invalid'] or rand.random() >= self.invalid_ratio
+            if is_valid:
+                method, path, headers, body = route_plan['valid']
+            else:
+                method, path, headers, body = rand.choice(route_plan['invalid'])[1]
+
+            route_stats = stats[route_name]
+            start = timer()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError):
+                route_stats['errors'] += 1
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, port)
+                continue
+
+            route_stats['latencies'].append(timer() - start)
+            route_stats['statuses'][response.status] += 1
+
+            if response.status >= 400:
+                route_stats['rejections']['{} {}'.format(response.status, get_rejection_type(response.status, data))] += 1
+                if is_valid:
+                    route_stats['validRejected'] += 1
+            elif not is_valid:
+                route_stats['invalidAccepted'] += 1
+
+        conn.close()
+        return stats
+
+    def run(self, duration=10.0, max_requests=None):
+        server = self.start_server()
+        try:
+            # Shared by workers to limit the total number of requests
+            counter = itertools.count()
+            results = [None] * self.concurrency
+
+            def run_worker(worker_index):
+                results[worker_index] = self.run_worker(worker_index, server.server_port, deadline, counter, max_requests)
+
+            workers = [threading.Thread(target=run_worker, args=(i,)) for i in range(self.concurrency)]
+
+            start = timer()
+            deadline = start + duration
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = timer() - start
+
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        return self.create_report(results, elapsed, duration)
+
+    def create_report(self, results, elapsed, duration):
+        routes = []
+        all_latencies = []
+        for route_name in self.plan:
+            merged = create_route_stats()
+            for stats in results:
+                route_stats = stats[route_name]
+                merged['latencies'].extend(route_stats['latencies'])
+                merged['errors']          += route_stats['errors']
+                merged['statuses']        .update(route_stats['statuses'])
+                merged['rejections']      .update(route_stats['rejections'])
+                merged['validRejected']   += route_stats['validRejected']
+                merged['invalidAccepted'] += route_stats['invalidAccepted']
+
+            latencies = sorted(merged['latencies'])
+            all_latencies.extend(latencies)
+
+            routes.append(OrderedDict([
+                ('route'          , route_name),
+                ('requests'       , len(latencies)),
+                ('throughput'     , len(latencies) / elapsed if elapsed else None),
+                ('p50'            , percentile(latencies, 50)),
+                ('p99'            , percentile(latencies, 99)),
+                ('errors'         , merged['errors']),
+                ('statuses'       , OrderedDict(sorted((str(k), v) for k, v in merged['statuses'].items()))),
+                ('rejections'     , OrderedDict(merged['rejections'].most_common())),
+                ('invalidVariants', len(self.plan[route_name]['invalid'])),
+                ('validRejected'  , merged['validRejected']),
+                ('invalidAccepted', merged['invalidAccepted']),
+            ]))
+
+        all_latencies.sort()
+        report = OrderedDict([
+            ('meta', OrderedDict([
+                ('time'        , time.strftime('%Y-%m-%dT%H:%M:%S%z')),
+                ('concurrency' , self.concurrency),
+                ('duration'    , duration),
+                ('elapsed'     , elapsed),
+                ('invalidRatio', self.invalid_ratio),
+                ('seed'        , self.seed),
+            ])),
+            ('total', OrderedDict([
+                ('requests'  , len(all_latencies)),
+                ('throughput', len(all_latencies) / elapsed if elapsed else None),
+                ('p50'       , percentile(all_latencies, 50)),
+                ('p99'       , percentile(all_latencies, 99)),
+            ])),
+            ('routes', routes),
+        ])
+        return report
+
+def format_ms(seconds):
+    return '-' if seconds is None else '{:.2f}'.format(seconds * 1000)
+
+def print_report(report):
+    print('{:<50} {:>9} {:>10} {:>9} {:>9} {:>9}'.format('Route', 'Requests', 'Req/s', 'p50 (ms)', 'p99 (ms)', 'Rejected'))
+    for r in report['routes']:
+        rejected = sum(r['rejections'].values())
+        print('{:<50} {:>9} {:>10.1f} {:>9} {:>9} {:>9}'.format(
+            r['route'], r['requests'], r['throughput'] or 0, format_ms(r['p50']), format_ms(r['p99']), rejected))
+
+        for rejection_type, count in r['rejections'].items():
+            print('    {:<46} {:>9}'.format(rejection_type, count))
+
+        # Valid requests should pass, invalid requests should be rejected
+        if r['validRejected'] or r['invalidAccepted'] or r['errors']:
+            print('    !! validRejected={validRejected} invalidAccepted={invalidAccepted} errors={errors}'.format(**r))
+
+    t = report['total']
+    print('{:<50} {:>9} {:>10.1f} {:>9} {:>9}'.format(
+        'Total', t['requests'], t['throughput'] or 0, format_ms(t['p50']), format_ms(t['p99'])))
+
+def load_app(target, route_loader_name='route_loader'):
+    # `target` is `<module>:<Flask app name>`, RouteLoader object is in the same module
+    module_name, _, attr = target.partition(':')
+    module = importlib.import_module(module_name)
+    return getattr(module, attr or 'app'), getattr(module, route_loader_name)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate load from route configs against a local WSGI server')
+    parser.add_argument('app', nargs='?', default='pt_dcxt.demo:app',
+        help='Flask app to serve, in `<module>:<name>` format (default: pt_dcxt.demo:app)')
+    parser.add_argument('--route-loader', default='route_loader',
+        help='RouteLoader object name in the app module (default: route_loader)')
+    parser.add_argument('--concurrency', type=int, default=8,
+        help='Number of concurrent clients (default: 8)')
+    parser.add_argument('--duration', type=float, default=10.0,
+        help='Seconds to run (default: 10)')
+    parser.add_argument('--requests', type=int,
+        help='Stop after this number of requests')
+    parser.add_argument('--invalid-ratio', type=float, default=0.2,
+        help='Ratio of invalid requests (default: 0.2)')
+    parser.add_argument('--seed', type=int,
+        help='Random seed')
+    parser.add_argument('--output',
+        help='Output JSON file')
+    args = parser.parse_args(argv)
+
+    app, route_loader = load_app(args.app, args.route_loader)
+
+    load_generator = LoadGenerator(app, route_loader,
+        concurrency=args.concurrency,
+        invalid_ratio=args.invalid_ratio,
+        seed=args.seed)
+
+    for route_name, route_plan in load_generator.plan.items():
+        print('{:<50} {:>3} invalid variants'.format(route_name, len(route_plan['invalid'])))
+    print('')
+
+    report = load_generator.run(duration=args.duration, max_requests=args.requests)
+    print('')
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as _f:
+            _f.write(json.dumps(report, indent=2))
+        print('Results: {}'.format(args.output))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+import threading
+import binascii
+import tempfile
+import logging
+import atexit
+import errno
+import time
+import json
+import glob
+import os
+
+try:
+    # Files of exited processes are only archived with file locks (not on Windows)
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Latency histogram buckets in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Each process writes its metrics to the metrics directory at most once per interval
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+METRIC_PREFIX = 'routeloader'
+
+# Metrics of exited processes are summed up into the archive file
+ARCHIVE_FILE_NAME = 'metrics_archive.json'
+LOCK_FILE_NAME    = 'metrics.lock'
+
+def escape_label_value(v):
+    return str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_labels(labels):
+    if not labels:
+        return ''
+
+    return '{' + ','.join('{}="{}"'.format(k, escape_label_value(v)) for k, v in labels) + '}'
+
+def format_value(v):
+    if v == float('inf'):
+        return '+Inf'
+
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+def get_file_pid(file_path):
+    # `metrics_<pid>_<random ID>.json` -> pid, `None` for other files (e.g. the archive)
+    parts = os.path.basename(file_path)[:-len('.json')].split('_')
+    if len(parts) != 3 or not parts[1].isdigit():
+        return None
+
+    return int(parts[1])
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        # Exists, but owned by another user
+        return e.errno == errno.EPERM
+
+    return True
+
+def read_dump(file_path):
+    # Returns `None` when missing or partial
+    try:
+        with open(file_path) as _f:
+            return json.loads(_f.read())
+    except (IOError, OSError, ValueError):
+        return None
+
+def write_file(file_path, data):
+    # Unique temp file in the same directory, writers (threads or processes) never rename the file of another one
+    fd, tmp_file_path = tempfile.mkstemp(dir=os.path.dirname(file_path), prefix=os.path.basename(file_path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as _f:
+            _f.write(data)
+
+        # Replace atomically, readers never see a partial file
+        os.rename(tmp_file_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_file_path)
+        except OSError:
+            pass
+        raise
+
+def merge_dumps(dumps, buckets):
+    # Returns (counters, histograms) summed up, dumps of other buckets are skipped
+    counters   = OrderedDict()
+    histograms = OrderedDict()
+    for d in dumps:
+        if d.get('buckets') != list(buckets):
+            continue
+
+        for name, labels, value in d['counters']:
+            key = (name, tuple(tuple(x) for x in labels))
+            counters[key] = counters.get(key, 0) + value
+
+        for name, labels, values in d['histograms']:
+            key = (name, tuple(tuple(x) for x in labels))
+            histogram = histograms.get(key)
+            if histogram is None:
+                histograms[key] = list(values)
+            else:
+                histograms[key] = [a + b for a, b in zip(histogram, values)]
+
+    return counters, histograms
+
+class MetricsLock(object):
+    # Lock of the metrics directory between processes:
+    # shared when reading the files, exclusive when archiving files of exited processes
+    def __init__(self, metrics_dir, exclusive=False):
+        super(MetricsLock, self).__init__()
+
+        self.lock_file_path = os.path.join(metrics_dir, LOCK_FILE_NAME)
+        self.exclusive      = exclusive
+        self.lock_file      = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.lock_file = open(self.lock_file_path, 'a')
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.lock_file is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+
+class RouteMetrics(object):
+    # Per-route counters and latency histograms.
+    # With `metrics_dir`, each process dumps its metrics to `<metrics_dir>/metrics_<pid>_<random ID>.json`,
+    # and metrics of all processes are summed up when exporting.
+    # Files of exited processes are summed up into `metrics_archive.json` and removed,
+    # when exporting and at exit, so that counters do not go back and the directory does not grow.
+    def __init__(self, metrics_dir=None, buckets=None, flush_interval=None):
+        super(RouteMetrics, self).__init__()
+
+        self.metrics_dir    = metrics_dir
+        self.buckets        = tuple(buckets or DEFAULT_BUCKETS)
+        self.flush_interval = DEFAULT_FLUSH_INTERVAL if flush_interval is None else flush_interval
+
+        self._lock       = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = 0
+        self._closed     = False
+
+        # File of current process, named again after fork
+        self._file_pid  = None
+        self._file_path = None
+
+        # (name, labels) -> value
+        self.counters = {}
+        # (name, labels) -> [bucket counts..., sum, count]
+        self.histograms = {}
+
+        if self.metrics_dir:
+            if not os.path.exists(self.metrics_dir):
+                os.makedirs(self.metrics_dir)
+
+            atexit.register(self.close)
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(self.buckets) + 2)
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def observe_request(self, config, route_timings, status_code, check_failure=None, response_failure=None):
+        route_labels = [
+            ('route' , (config.get('prefix') or '') + config.get('url', '')),
+            ('method', config.get('method', '').upper()),
+        ]
+
+        self.inc('requests_total', route_labels + [('status', status_code)])
+
+        middleware_elapsed = None
+        for phase, elapsed in route_timings.items():
+            if phase.startswith('middleware.'):
+                middleware_elapsed = (middleware_elapsed or 0) + elapsed
+            else:
+                self.observe('phase_seconds', route_labels + [('phase', phase)], elapsed)
+
+        if middleware_elapsed is not None:
+            self.observe('phase_seconds', route_labels + [('phase', 'middleware')], middleware_elapsed)
+
+        if check_failure is not None:
+            if isinstance(check_failure, dict):
+                detail = check_failure.get('detail') or {}
+            else:
+                # e.g. 'Invalid JSON string'
+                detail = {'type': 'invalidJSON'}
+
+            self.inc('rejections_total', route_labels + [
+                ('type'   , detail.get('type') or ''),
+                ('checker', detail.get('checkerName') or ''),
+            ])
+
+        # Sampled responses not matching `responseBody`
+        if response_failure is not None:
+            detail = response_failure.get('detail') or {}
+            self.inc('response_violations_total', route_labels + [
+                ('type'   , detail.get('type') or ''),
+                ('checker', detail.get('checkerName') or ''),
+            ])
+
+        self.flush()
+
+    def dump(self):
+        with self._lock:
+            return {
+                'buckets'   : list(self.buckets),
+                'counters'  : [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(values)] for (name, labels), values in self.histograms.items()],
+            }
+
+    def get_file_path(self):
+        pid = os.getpid()
+        if self._file_pid != pid:
+            # PIDs are reused, the random ID keeps files of processes apart
+            self._file_pid  = pid
+            self._file_path = os.path.join(self.metrics_dir, 'metrics_{}_{}.json'.format(
+                pid, binascii.hexlify(os.urandom(4)).decode('ascii')))
+
+        return self._file_path
+
+    def flush(self, force=False):
+        # Called in the request path: skipped while another thread is flushing, and I/O errors are only logged
+        if not self.metrics_dir or self._closed:
+            return
+
+        if not self._flush_lock.acquire(force):
+            return
+
+        try:
+            now = time.time()
+            if not force and now - self._last_flush < self.flush_interval:
+                return
+
+            self._last_flush = now
+
+            write_file(self.get_file_path(), json.dumps(self.dump()))
+
+        except (IOError, OSError) as e:
+            logger.warning('Failed to flush metrics: %s', e)
+
+        finally:
+            self._flush_lock.release()
+
+    def archive(self, file_paths):
+        # Sum up the files into the archive file and remove them
+        archive_file_path = os.path.join(self.metrics_dir, ARCHIVE_FILE_NAME)
+        with MetricsLock(self.metrics_dir, exclusive=True):
+            dumps = [read_dump(file_path) for file_path in [archive_file_path] + file_paths]
+            counters, histograms = merge_dumps([d for d in dumps if d is not None], self.buckets)
+
+            archive_dump = {
+                'buckets'   : list(self.buckets),
+                'counters'  : [[name, list(labels), value] for (name, labels), value in counters.items()],
+                'histograms': [[name, list(labels), values] for (name, labels), values in histograms.items()],
+            }
+            write_file(archive_file_path, json.dumps(archive_dump))
+
+            for file_path in file_paths:
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+
+    def archive_exited(self):
+        # Files of exited processes, e.g. restarted workers
+        if fcntl is None:
+            return
+
+        file_paths = []
+        for file_path in glob.glob(os.path.join(self.metrics_dir, 'metrics_*.json')):
+            pid = get_file_pid(file_path)
+            if pid is not None and pid != os.getpid() and not is_process_alive(pid):
+                file_paths.append(file_path)
+
+        if file_paths:
+            self.archive(file_paths)
+
+    def close(self):
+        # At exit, metrics of current process are archived, and not flushed any more
+        if not self.metrics_dir or self._closed or fcntl is None:
+            return
+
+        self.flush(force=True)
+        self._closed = True
+
+        try:
+            self.archive([self.get_file_path()])
+        except (IOError, OSError) as e:
+            logger.warning('Failed to archive metrics: %s', e)
+
+    def collect(self):
+        # Sum up metrics of all processes
+        if not self.metrics_dir:
+            dumps = [self.dump()]
+
+        else:
+            self.flush(force=True)
+            self.archive_exited()
+
+            with MetricsLock(self.metrics_dir):
+                dumps = [read_dump(file_path) for file_path in glob.glob(os.path.join(self.metrics_dir, 'metrics_*.json'))]
+
+            dumps = [d for d in dumps if d is not None]
+
+        return merge_dumps(dumps, self.buckets)
+
+    def export(self):
+        # Prometheus text format
+        counters, histograms = self.collect()
+
+        lines = []
+        exported_names = set()
+        for (name, labels), value in sorted(counters.items()):
+            metric_name = '{}_{}'.format(METRIC_PREFIX, name)
+            if metric_name not in exported_names:
+                exported_names.add(metric_name)
+                lines.append('# TYPE {} counter'.format(metric_name))
+
+            lines.append('{}{} {}'.format(metric_name, format_labels(labels), format_value(value)))
+
+        for (name, labels), values in sorted(histograms.items()):
+            metric_name = '{}_{}'.format(METRIC_PREFIX, name)
+            if metric_name not in exported_names:
+                exported_names.add(metric_name)
+                lines.append('# TYPE {} histogram'.format(metric_name))
+
+            for bound, count in zip(self.buckets + (float('inf'),), values[:-2] + [values[-1]]):
+                bucket_labels = labels + (('le', format_value(bound)),)
+                lines.append('{}_bucket{} {}'.format(metric_name, format_labels(bucket_labels), count))
+
+            lines.append('{}_sum{} {}'.format(metric_name, format_labels(labels), format_value(values[-2])))
+            lines.append('{}_count{} {}'.format(metric_name, format_labels(labels), values[-1]))
+
+        return '\n'.join(lines) + '\n'
@@ -24,4 +24,19 @@ def api_middlewares_2(config):
     print('IN api_middlewares_2')
 
     if request.args.get('abort') == 'api_middlewares_2':
-        abort(make_response('Abort in api_middlewares_2', 400))
\ No newline at end of file
+        abort(make_response('Abort in api_middlewares_2', 400))
+
+class ApiMiddleware3(object):
+    # Object middleware: `before` runs before handler, `after` runs after handler
+    def before(self, config):
+        print('IN ApiMiddleware3.before')
+
+        # Return a response to short-circuit
+        if request.args.get('abort') == 'api_middlewares_3':
+            return make_response('Short-circuit in ApiMiddleware3', 400)
+
+    def after(self, config, response):
+        print('IN ApiMiddleware3.after')
+
+        response.headers['X-API-Name'] = config.get('name')
+        return response
@@ -1,14 +1,37 @@
 # -*- coding: utf-8 -*-
 
 from functools import wraps, cmp_to_key
+from itertools import chain
 
 import re
+import sys
 import json
 
+try:
+    # NumPy is optional, used for checking large numeric columns
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    unicode
+except NameError:
+    # Python 3
+    unicode = str
+
+from pt_dcxt.enumsource import get_enum_source
+
 patten_email = "^(?:[a-z\d]+[_\-\+\.]?)*[a-z\d]+@(?:([a-z\d]+\-?)*[a-z\d]+\.)+([a-z]{2,})+$"
 re_email = re.compile(patten_email, re.I)
 
 DIRECTIVES = {}
+DIRECTIVE_COMPILERS = {}
+BATCH_DIRECTIVE_COMPILERS = {}
+
+# Arrays shorter than this are checked element by element
+BATCH_MIN_LENGTH = 32
+# Numeric columns longer than this are checked by NumPy (if installed)
+NUMPY_MIN_LENGTH = 1024
 
 def register_directive(key):
     def decorator(f):
@@ -20,6 +43,15 @@ def register_directive(key):
 
     return decorator
 
+# Compilers receive the directive option once and return a `check(v)` function,
+# so that works like compiling regexp are not repeated for every value.
+def register_directive_compiler(key):
+    def decorator(f):
+        DIRECTIVE_COMPILERS[key] = f
+        return f
+
+    return decorator
+
 @register_directive('$type')
 def _type(v, t):
     t = t.lower()
@@ -110,17 +142,35 @@ def _is_value(v, value):
 def _in(v, in_options):
     return v in in_options
 
+# Option lists of `$commaArrayIn` -> frozensets, so that the uncompiled checker does not rebuild them for every value.
+# Keyed by identity, options are kept in the cache so that their IDs are not reused
+OPTION_SET_CACHE_SIZE = 1024
+option_set_cache = {}
+
+def get_option_set(in_options):
+    cached = option_set_cache.get(id(in_options))
+    if cached is not None and cached[0] is in_options:
+        return cached[1]
+
+    option_set = frozenset(in_options)
+    if len(option_set_cache) >= OPTION_SET_CACHE_SIZE:
+        option_set_cache.clear()
+
+    option_set_cache[id(in_options)] = (in_options, option_set)
+    return option_set
+
 @register_directive('$commaArrayIn')
 def _comma_array_in(v, in_options):
-    v = v.split(',')
-
-    in_option_map = dict([(x, True) for x in in_options])
+    return get_option_set(in_options).issuperset(v.split(','))
 
-    for elem in v:
-        if not in_option_map.get(elem):
-            return False
+# Enums from `register_enum_file()` / `register_enum_provider()`
+@register_directive('$inSource')
+def _in_source(v, source_name):
+    return v in get_enum_source(source_name)
 
-    return True
+@register_directive('$commaArrayInSource')
+def _comma_array_in_source(v, source_name):
+    return get_enum_source(source_name).get_value_set().issuperset(v.split(','))
 
 @register_directive('$notIn')
 def _not_in(v, in_options):
@@ -159,6 +209,192 @@ def _not_match_regexp(v, regexp):
 def _is_email(v, flg):
     return flg == (re_email.match(v) != None)
 
+# Batch compilers receive the directive option once and return a `check(values, value_types)` function,
+# which checks a whole column (one field of all array elements) at once.
+# It only returns True or False, errors are located by the element by element checks.
+def register_batch_directive_compiler(key):
+    def decorator(f):
+        BATCH_DIRECTIVE_COMPILERS[key] = f
+        return f
+
+    return decorator
+
+TYPE_CHECK_CLASSES = {
+    'str'       : (str, unicode),
+    'string'    : (str, unicode),
+    'commaarray': (str, unicode),
+    'enum'      : (str, unicode),
+    'num'       : (int, float),
+    'number'    : (int, float),
+    'float'     : (int, float),
+    'int'       : int,
+    'integer'   : int,
+    'bool'      : bool,
+    'boolean'   : bool,
+    'arr'       : (tuple, list),
+    'array'     : (tuple, list),
+    'json'      : dict,
+    'obj'       : dict,
+    'object'    : dict,
+}
+
+@register_directive_compiler('$type')
+def _compile_type(t):
+    t = t.lower()
+    if t in TYPE_CHECK_CLASSES:
+        classes = TYPE_CHECK_CLASSES[t]
+        return lambda v: isinstance(v, classes)
+
+    elif t in ('jsonstring',):
+        return lambda v: DIRECTIVES['$type'](v, t)
+
+    else:
+        return lambda v: True
+
+@register_directive_compiler('$matchRegExp')
+def _compile_match_regexp(regexp):
+    pattern = re.compile(regexp)
+    return lambda v: pattern.match(str(v)) is not None
+
+@register_directive_compiler('$notMatchRegExp')
+def _compile_not_match_regexp(regexp):
+    pattern = re.compile(regexp)
+    return lambda v: pattern.match(str(v)) is None
+
+# Enums are indexed into frozensets once
+@register_directive_compiler('$in')
+def _compile_in(in_options):
+    try:
+        in_option_set = frozenset(in_options)
+    except TypeError:
+        return lambda v: DIRECTIVES['$in'](v, in_options)
+
+    def check_in(v):
+        try:
+            return v in in_option_set
+        except TypeError:
+            return False
+
+    return check_in
+
+@register_directive_compiler('$notIn')
+def _compile_not_in(in_options):
+    try:
+        in_option_set = frozenset(in_options)
+    except TypeError:
+        return lambda v: DIRECTIVES['$notIn'](v, in_options)
+
+    def check_not_in(v):
+        try:
+            return v not in in_option_set
+        except TypeError:
+            return True
+
+    return check_not_in
+
+@register_directive_compiler('$commaArrayIn')
+def _compile_comma_array_in(in_options):
+    in_option_set = frozenset(in_options)
+    return lambda v: in_option_set.issuperset(v.split(','))
+
+# Enum sources are resolved once, values are reloaded by the source after TTL
+@register_directive_compiler('$inSource')
+def _compile_in_source(source_name):
+    source = get_enum_source(source_name)
+    return lambda v: v in source
+
+@register_directive_compiler('$commaArrayInSource')
+def _compile_comma_array_in_source(source_name):
+    source = get_enum_source(source_name)
+    return lambda v: source.get_value_set().issuperset(v.split(','))
+
+INT_TYPES = frozenset([int, bool])
+FLOAT_TYPES = frozenset([float, bool])
+SIZED_TYPES = (str, unicode, tuple, list)
+
+def _column_compare(values, value_types, bound, use_max):
+    if value_types <= INT_TYPES:
+        # No NaN in integers, the builtin min/max are safe
+        if use_max:
+            return max(values) <= bound
+        else:
+            return min(values) >= bound
+
+    # Floats only, integers in a float64 array (e.g. mixed with floats) may lose precision
+    if numpy is not None and len(values) >= NUMPY_MIN_LENGTH and value_types <= FLOAT_TYPES:
+        arr = numpy.asarray(values, dtype=numpy.float64)
+
+        # NaN is never valid, and `min()`/`max()` would propagate it.
+        # Compared as Python float, NumPy would round an integer bound to float64
+        if use_max:
+            return float(arr.max()) <= bound
+        else:
+            return float(arr.min()) >= bound
+
+    if use_max:
+        return all(v <= bound for v in values)
+    else:
+        return all(v >= bound for v in values)
+
+def _column_is_sized(value_types):
+    return all(issubclass(t, SIZED_TYPES) for t in value_types)
+
+@register_batch_directive_compiler('$type')
+def _compile_batch_type(t):
+    t = t.lower()
+    if t in TYPE_CHECK_CLASSES:
+        classes = TYPE_CHECK_CLASSES[t]
+        return lambda values, value_types: all(issubclass(x, classes) for x in value_types)
+
+    elif t in ('jsonstring',):
+        return None
+
+    else:
+        return lambda values, value_types: True
+
+@register_batch_directive_compiler('$minValue')
+def _compile_batch_min_value(min_value):
+    return lambda values, value_types: _column_compare(values, value_types, min_value, False)
+
+@register_batch_directive_compiler('$maxValue')
+def _compile_batch_max_value(max_value):
+    return lambda values, value_types: _column_compare(values, value_types, max_value, True)
+
+@register_batch_directive_compiler('$in')
+def _compile_batch_in(in_options):
+    try:
+        in_option_set = frozenset(in_options)
+    except TypeError:
+        return None
+
+    return lambda values, value_types: in_option_set.issuperset(values)
+
+@register_batch_directive_compiler('$notIn')
+def _compile_batch_not_in(in_options):
+    try:
+        in_option_set = frozenset(in_options)
+    except TypeError:
+        return None
+
+    return lambda values, value_types: in_option_set.isdisjoint(values)
+
+@register_batch_directive_compiler('$inSource')
+def _compile_batch_in_source(source_name):
+    source = get_enum_source(source_name)
+    return lambda values, value_types: source.get_value_set().issuperset(values)
+
+@register_batch_directive_compiler('$minLength')
+def _compile_batch_min_length(min_length):
+    return lambda values, value_types: _column_is_sized(value_types) and min(map(len, values)) >= min_length
+
+@register_batch_directive_compiler('$maxLength')
+def _compile_batch_max_length(max_length):
+    return lambda values, value_types: _column_is_sized(value_types) and max(map(len, values)) <= max_length
+
+@register_batch_directive_compiler('$isLength')
+def _compile_batch_is_length(length):
+    return lambda values, value_types: _column_is_sized(value_types) and set(map(len, values)) == set([length])
+
 # Functional methods
 def create_error_message(e, template):
     error_message = template.get(e.type)
@@ -167,13 +403,43 @@ def create_error_message(e, template):
     else:
         error_message = str(e)
 
-    if (e.type == 'invalid'):
+    if e.type in ('invalid', 'overBudget', 'overloaded'):
         error_message = error_message.replace('{{fieldValue}}', json.dumps(e.field_value or ''))
         error_message = error_message.replace('{{checkerName}}', (e.checker_name or '')[1:])
         error_message = error_message.replace('{{checkerOption}}', json.dumps(e.checker_option or ''))
 
     return error_message
 
+def type_check_first_cmp(x, y):
+    if x[0] == '$type':
+        return -1
+    elif y[0] == '$type':
+        return 1
+
+    return 0
+
+def create_check_result(error, template):
+    ret = {
+        'isValid': True,
+        'message': None,
+        'detail' : None,
+    }
+
+    if error is not None:
+        ret['isValid'] = False
+        ret['message'] = create_error_message(error, template)
+        ret['detail'] = {
+            'type'         : error.type,
+            'fieldName'    : error.field_name,
+            'fieldValue'   : error.field_value,
+            'checkerName'  : error.checker_name,
+            'checkerOption': error.checker_option,
+        }
+
+    return ret
+
+NO_OP_DIRECTIVES = ('$isOptional', '$optional', '$isRequired', '$required', '$allowNull')
+
 class Nothing(object):
     pass
 
@@ -187,8 +453,256 @@ class ObjectCheckerException(Exception):
         self.checker_name   = checker_name
         self.checker_option = checker_option
 
+def raise_not_object(obj, obj_name):
+    # Fields are described, but the value is not an object (e.g. a string)
+    raise ObjectCheckerException(
+        type_='invalid',
+        field_name=obj_name,
+        field_value=obj,
+        checker_name='$type',
+        checker_option='json')
+
+# Budget options of route configs -> checker names in check results
+BUDGET_OPTIONS = {
+    'maxDepth'       : '$maxDepth',
+    'maxNodes'       : '$maxNodes',
+    'maxArrayLength' : '$maxArrayLength',
+    'maxStringLength': '$maxStringLength',
+}
+
+def get_budget_field_name(frame, obj=nothing, root_name='obj'):
+    # Same as field names of checkers: object keys, and `<array name>[<index>]` for array elements.
+    # Keys are not kept when walking, they are found by identity on errors only
+    # Frame: (container, depth, parent frame), `root_name` is the field name of the container of the root frame
+    indexes = []
+    while frame is not None:
+        container = frame[0]
+        if obj is not nothing:
+            if isinstance(container, dict):
+                key = next(k for k, v in container.items() if v is obj)
+                for index in reversed(indexes):
+                    key = '{}[{}]'.format(key, index)
+
+                return str(key)
+
+            indexes.append(next(i for i, v in enumerate(container) if v is obj))
+
+        obj, frame = container, frame[2]
+
+    field_name = root_name
+    for index in reversed(indexes):
+        field_name = '{}[{}]'.format(field_name, index)
+
+    return field_name
+
+# Values of other types are checked by `isinstance()`
+SCALAR_TYPES = frozenset([int, float, bool, type(None)])
+
+CONTAINER_TYPES = (dict, list, tuple)
+
+class ValidationBudget(object):
+    # Limits of the whole payload, including values not described by options (e.g. `$type: any`).
+    # Charged by the compiled checker while walking the payload (see `BudgetWalk`), containers are charged
+    # before their values are checked, so that a deeply nested or very wide payload is rejected with the
+    # `overBudget` error type before burning CPU on checking it.
+    def __init__(self, max_depth=None, max_nodes=None, max_array_length=None, max_string_length=None):
+        super(ValidationBudget, self).__init__()
+
+        self.options = {
+            '$maxDepth'       : max_depth,
+            '$maxNodes'       : max_nodes,
+            '$maxArrayLength' : max_array_length,
+            '$maxStringLength': max_string_length,
+        }
+
+        # No limit by default
+        self.max_depth         = sys.maxsize if max_depth is None else max_depth
+        self.max_nodes         = sys.maxsize if max_nodes is None else max_nodes
+        self.max_array_length  = sys.maxsize if max_array_length is None else max_array_length
+        self.max_string_length = sys.maxsize if max_string_length is None else max_string_length
+
+    def raise_over_budget(self, checker_name, field_name):
+        # Payloads are not included in the error
+        raise ObjectCheckerException(
+            type_='overBudget',
+            field_name=field_name,
+            checker_name=checker_name,
+            checker_option=self.options[checker_name])
+
+class BudgetWalk(object):
+    # `ValidationBudget` charged while checking one payload.
+    # Values described by options are charged by the compiled checks visiting them,
+    # the rest (e.g. `$type: any`, other keys of `$type: json`) are walked iteratively, without recursion
+    def __init__(self, budget):
+        super(BudgetWalk, self).__init__()
+
+        self.budget = budget
+        self.depth  = 0
+        # The root value
+        self.nodes  = 1
+
+    def enter(self, container, obj_name):
+        # Before checking values of the container
+        budget = self.budget
+
+        depth = self.depth + 1
+        if depth > budget.max_depth:
+            budget.raise_over_budget('$maxDepth', obj_name)
+
+        if not isinstance(container, dict) and len(container) > budget.max_array_length:
+            budget.raise_over_budget('$maxArrayLength', obj_name)
+
+        self.nodes += len(container)
+        if self.nodes > budget.max_nodes:
+            budget.raise_over_budget('$maxNodes', obj_name)
+
+        self.depth = depth
+
+    def leave(self):
+        self.depth -= 1
+
+    def charge_string(self, v, obj_name):
+        if len(v) > self.budget.max_string_length:
+            self.budget.raise_over_budget('$maxStringLength', obj_name)
+
+    def walk(self, obj, obj_name, entered=False):
+        # Charges `obj` and all values in it, `entered`: `obj` is a container already charged by `enter()`.
+        # Walked level by level, the field name is only located (`locate_over_budget()`) when over budget
+        budget = self.budget
+
+        max_depth         = budget.max_depth
+        max_nodes         = budget.max_nodes
+        max_array_length  = budget.max_array_length
+        max_string_length = budget.max_string_length
+
+        if not entered:
+            t = type(obj)
+            if t in SCALAR_TYPES:
+                return
+
+            if t is str or isinstance(obj, (str, unicode)):
+                if len(obj) > max_string_length:
+                    budget.raise_over_budget('$maxStringLength', obj_name)
+
+                return
+
+            if not isinstance(obj, CONTAINER_TYPES):
+                return
+
+        root_entered = entered
+
+        nodes = self.nodes
+        depth = self.depth if entered else self.depth + 1
+        level = [obj]
+        while True:
+            if entered:
+                entered = False
+
+            else:
+                if depth > max_depth:
+                    self.locate_over_budget(obj, obj_name, root_entered)
+
+                arrays = [container for container in level if not isinstance(container, dict)]
+                if arrays and max(map(len, arrays)) > max_array_length:
+                    self.locate_over_budget(obj, obj_name, root_entered)
+
+                nodes += sum(map(len, level))
+                if nodes > max_nodes:
+                    self.locate_over_budget(obj, obj_name, root_entered)
+
+            values = list(chain.from_iterable([container.values() if isinstance(container, dict) else container for container in level]))
+
+            # Values are filtered by exact types, `isinstance()` of each value is slower
+            value_types = set(map(type, values))
+            if value_types.issubset(SCALAR_TYPES):
+                break
+
+            string_types = frozenset(t for t in value_types if issubclass(t, (str, unicode)))
+            if string_types and max([len(v) for v in values if type(v) in string_types]) > max_string_length:
+                self.locate_over_budget(obj, obj_name, root_entered)
+
+            container_types = frozenset(t for t in value_types if issubclass(t, CONTAINER_TYPES))
+            if not container_types:
+                break
+
+            level = [v for v in values if type(v) in container_types]
+            depth += 1
+
+        self.nodes = nodes
+
+    def locate_over_budget(self, obj, obj_name, entered):
+        # Walks `obj` again depth first, and raises with the field name of the first value over budget.
+        # Nodes are counted from `self.nodes`, which does not include values of `obj` yet
+        budget = self.budget
+
+        max_depth         = budget.max_depth
+        max_nodes         = budget.max_nodes
+        max_array_length  = budget.max_array_length
+        max_string_length = budget.max_string_length
+
+        # Only containers are pushed, scalars are checked in place
+        nodes = self.nodes
+        stack = [(obj, self.depth if entered else self.depth + 1, None)]
+
+        push = stack.append
+        pop  = stack.pop
+        while stack:
+            frame = pop()
+            container, depth = frame[0], frame[1]
+
+            if isinstance(container, dict):
+                values = container.values()
+            else:
+                values = container
+
+            if entered:
+                entered = False
+
+            else:
+                if depth > max_depth:
+                    budget.raise_over_budget('$maxDepth', get_budget_field_name(frame, root_name=obj_name))
+
+                if values is container and len(container) > max_array_length:
+                    budget.raise_over_budget('$maxArrayLength', get_budget_field_name(frame, root_name=obj_name))
+
+                nodes += len(container)
+                if nodes > max_nodes:
+                    budget.raise_over_budget('$maxNodes', get_budget_field_name(frame, root_name=obj_name))
+
+            for v in values:
+                t = type(v)
+                if t in SCALAR_TYPES:
+                    continue
+
+                if t is str or isinstance(v, (str, unicode)):
+                    if len(v) > max_string_length:
+                        budget.raise_over_budget('$maxStringLength', get_budget_field_name(frame, v, obj_name))
+
+                elif isinstance(v, CONTAINER_TYPES):
+                    push((v, depth + 1, frame))
+
+def create_validation_budget(*budget_configs):
+    # Later configs override earlier ones (e.g. default budget, then route budget).
+    # Returns `None` when no limit is set
+    options = {}
+    for budget_config in budget_configs:
+        for k, v in (budget_config or {}).items():
+            if k not in BUDGET_OPTIONS:
+                raise ValueError('Unknown budget option `{}`'.format(k))
+
+            options[k] = v
+
+    if not any(v is not None for v in options.values()):
+        return None
+
+    return ValidationBudget(
+        max_depth=options.get('maxDepth'),
+        max_nodes=options.get('maxNodes'),
+        max_array_length=options.get('maxArrayLength'),
+        max_string_length=options.get('maxStringLength'))
+
 class ObjectChecker(object):
-    def __init__(self, default_required=None, message_template=None, custom_directives=None):
+    def __init__(self, default_required=None, message_template=None, custom_directives=None, batch_min_length=None):
         if default_required is None:
             self.default_required = True
         else:
@@ -196,9 +710,12 @@ class ObjectChecker(object):
 
         if message_template is None:
             self.message_template = {
-                'invalid'   : "Field `{{fieldName}}` value `{{fieldValue}}` is not valid. ({{checkerName}} = {{checkerOption}})",
-                'missing'   : "Field `{{fieldName}}` is missing.",
-                'unexpected': "Found unexpected field `{{fieldName}}`"
+                'invalid'     : "Field `{{fieldName}}` value `{{fieldValue}}` is not valid. ({{checkerName}} = {{checkerOption}})",
+                'missing'     : "Field `{{fieldName}}` is missing.",
+                'unexpected'  : "Found unexpected field `{{fieldName}}`",
+                'overBudget'  : "Field `{{fieldName}}` is over the validation budget. ({{checkerName}} = {{checkerOption}})",
+                'unauthorized': "Sign in required, `{{fieldName}}` is missing or not a valid session.",
+                'overloaded'  : "Too many requests of `{{fieldName}}`, retry later. ({{checkerName}} = {{checkerOption}})",
             }
         else:
             self.message_template = message_template
@@ -208,6 +725,12 @@ class ObjectChecker(object):
         else:
             self.custom_directives = custom_directives
 
+        # Set `batch_min_length` to `0` to disable batch checking of compiled arrays
+        if batch_min_length is None:
+            self.batch_min_length = BATCH_MIN_LENGTH
+        else:
+            self.batch_min_length = batch_min_length
+
     def verify(self, obj, options, obj_name=None):
         if obj_name is None:
             obj_name = 'obj'
@@ -244,14 +767,6 @@ class ObjectChecker(object):
                         field_name=obj_key)
 
 
-        def type_check_first_cmp(x, y):
-            if x[0] == '$type':
-                return -1
-            elif y[0] == '$type':
-                return 1
-
-            return 0
-
         for option_key, option in sorted(options.items(), key=cmp_to_key(type_check_first_cmp)):
             has_option = False
             check_func = None
@@ -278,7 +793,7 @@ class ObjectChecker(object):
                         checker_option=option)
 
             else:
-                if option_key in ('$isOptional', '$optional', '$isRequired', '$required', '$allowNull'):
+                if option_key in NO_OP_DIRECTIVES:
                     # no op
                     pass
 
@@ -296,6 +811,9 @@ class ObjectChecker(object):
                         self.verify(element, option, '{}[{}]'.format(obj_name, i))
 
                 else:
+                    if not hasattr(obj, 'get'):
+                        raise_not_object(obj, obj_name)
+
                     self.verify(obj.get(option_key, nothing), option, option_key)
 
     def is_valid(self, obj, options):
@@ -308,24 +826,350 @@ class ObjectChecker(object):
         return True
 
     def check(self, obj, options):
-        ret = {
-            'isValid': True,
-            'message': None,
-            'detail' : None,
-        }
-
         try:
             self.verify(obj, options, 'obj')
 
         except ObjectCheckerException as error:
-            ret['isValid'] = False
-            ret['message'] = create_error_message(error, self.message_template)
-            ret['detail'] = {
-                'type'         : error.type,
-                'fieldName'    : error.field_name,
-                'fieldValue'   : error.field_value,
-                'checkerName'  : error.checker_name,
-                'checkerOption': error.checker_option,
-            }
+            return create_check_result(error, self.message_template)
+
+        return create_check_result(None, self.message_template)
+
+    def compile(self, options, budget=None):
+        return CompiledObjectChecker(self, options, budget)
+
+class CompiledObjectChecker(object):
+    # Options are compiled into a tree of check functions once,
+    # so that each call only runs the prebound checks.
+    # Every check function is called as `check(obj, obj_name, walk)`, `walk` is the `BudgetWalk` or `None`,
+    # and raises `ObjectCheckerException` like `ObjectChecker.verify()` does.
+    def __init__(self, checker, options, budget=None):
+        super(CompiledObjectChecker, self).__init__()
+
+        self.checker          = checker
+        self.options          = options
+        self.message_template = checker.message_template
+        # `ValidationBudget` charged while checking
+        self.budget           = budget
+
+        self._verify = self.compile_node(options)
+
+    def resolve_directive(self, option_key, option):
+        custom_directives = self.checker.custom_directives
+
+        if option_key in custom_directives:
+            check_func = custom_directives.get(option_key)
+        else:
+            check_func = DIRECTIVES.get(option_key)
+
+        if not check_func:
+            return None
+
+        if check_func is DIRECTIVES.get(option_key) and option_key in DIRECTIVE_COMPILERS:
+            return DIRECTIVE_COMPILERS[option_key](option)
+
+        return lambda v: check_func(v, option)
+
+    def compile_directive(self, option_key, option):
+        check_value = self.resolve_directive(option_key, option)
+        if check_value is None:
+            return None
+
+        def check_directive(obj, obj_name, walk):
+            if check_value(obj) is False:
+                raise ObjectCheckerException(
+                    type_='invalid',
+                    field_name=obj_name,
+                    field_value=obj,
+                    checker_name=option_key,
+                    checker_option=option)
+
+        return check_directive
+
+    def compile_array(self, option):
+        check_element = self.compile_node(option)
+
+        batch_min_length = self.checker.batch_min_length
+        batch_check_elements = None
+        if batch_min_length:
+            batch_check_elements = self.compile_batch_node(option)
+
+        def check_array(obj, obj_name, walk):
+            if not isinstance(obj, (tuple, list)):
+                raise ObjectCheckerException(
+                    type_='invalid',
+                    field_name=obj_name,
+                    field_value=obj,
+                    checker_name='$',
+                    checker_option=option)
+
+            # Check all elements at once, only locate the error element by element when failed
+            if batch_check_elements is not None and len(obj) >= batch_min_length:
+                try:
+                    is_valid = batch_check_elements(obj) is True
+                except Exception:
+                    is_valid = False
+
+                if is_valid:
+                    # Elements are not visited one by one
+                    if walk is not None:
+                        walk.walk(obj, obj_name, entered=True)
+
+                    return
+
+            for i in range(len(obj)):
+                check_element(obj[i], '{}[{}]'.format(obj_name, i), walk)
+
+        return check_array
+
+    def compile_batch_node(self, options):
+        # Returns `None` when the options can not be checked in batch
+        checker = self.checker
+
+        options = options or {}
+        if not isinstance(options, dict):
+            return None
+
+        if checker.default_required is True:
+            skip_nothing = (options.get('$isOptional') or options.get('$optional')) is True
+        elif checker.default_required is False:
+            skip_nothing = (options.get('$isRequired') or options.get('$required')) is not True
+        else:
+            skip_nothing = False
+
+        allow_null = options.get('$allowNull') is True
+
+        obj_type = options.get('$type', '').lower()
+        skip_all = options.get('$skip') is True or obj_type in ('any', '*')
+
+        check_unexpected = obj_type not in ('json', 'obj', 'object')
+        option_keys = frozenset(options.keys())
+
+        value_checks = []
+        field_checks = []
+        element_check = None
+        if not skip_all:
+            for option_key, option in options.items():
+                if option_key in DIRECTIVES or option_key in checker.custom_directives:
+                    if option_key in checker.custom_directives:
+                        check_func = checker.custom_directives.get(option_key)
+                    else:
+                        check_func = DIRECTIVES.get(option_key)
+
+                    if not check_func:
+                        continue
+
+                    if check_func is not DIRECTIVES.get(option_key) or option_key not in BATCH_DIRECTIVE_COMPILERS:
+                        return None
+
+                    check = BATCH_DIRECTIVE_COMPILERS[option_key](option)
+                    if check is None:
+                        return None
+
+                    value_checks.append(check)
+
+                elif option_key in NO_OP_DIRECTIVES:
+                    continue
+
+                elif option_key == '$':
+                    element_check = self.compile_batch_node(option)
+                    if element_check is None:
+                        return None
+
+                else:
+                    field_check = self.compile_batch_node(option)
+                    if field_check is None:
+                        return None
+
+                    field_checks.append((option_key, field_check))
+
+        value_checks = tuple(value_checks)
+        field_checks = tuple(field_checks)
+
+        def batch_check_node(values):
+            if nothing in values:
+                if not skip_nothing:
+                    return False
+
+                values = [v for v in values if v is not nothing]
+
+            if allow_null and None in values:
+                values = [v for v in values if v is not None]
+
+            if skip_all or not values:
+                return True
+
+            value_types = frozenset(map(type, values))
+
+            if check_unexpected and any(issubclass(t, dict) for t in value_types):
+                for v in values:
+                    if isinstance(v, dict) and not option_keys.issuperset(v.keys()):
+                        return False
+
+            for check in value_checks:
+                if check(values, value_types) is not True:
+                    return False
+
+            if element_check is not None:
+                if not all(issubclass(t, (tuple, list)) for t in value_types):
+                    return False
+
+                elements = [e for v in values for e in v]
+                if elements and element_check(elements) is not True:
+                    return False
+
+            if field_checks:
+                if not all(issubclass(t, dict) for t in value_types):
+                    return False
+
+                for option_key, field_check in field_checks:
+                    field_values = [v.get(option_key, nothing) for v in values]
+                    if field_check(field_values) is not True:
+                        return False
+
+            return True
+
+        return batch_check_node
+
+    def compile_field(self, option_key, option):
+        check_child = self.compile_node(option)
+
+        def check_field(obj, obj_name, walk):
+            try:
+                get = obj.get
+            except AttributeError:
+                raise_not_object(obj, obj_name)
+
+            check_child(get(option_key, nothing), option_key, walk)
+
+        return check_field
+
+    def compile_node(self, options):
+        checker = self.checker
+
+        options = options or {}
+        if not isinstance(options, dict):
+            # Not a schema node, leave it to the original verifier
+            def check_fallback(obj, obj_name, walk):
+                checker.verify(obj, options, obj_name)
+
+                if walk is not None:
+                    walk.walk(obj, obj_name)
+
+            return check_fallback
+
+        if checker.default_required is True:
+            skip_nothing = (options.get('$isOptional') or options.get('$optional')) is True
+        elif checker.default_required is False:
+            skip_nothing = (options.get('$isRequired') or options.get('$required')) is not True
+        else:
+            skip_nothing = False
+
+        allow_null = options.get('$allowNull') is True
+
+        obj_type = options.get('$type', '').lower()
+        skip_all = options.get('$skip') is True or obj_type in ('any', '*')
+
+        check_unexpected = obj_type not in ('json', 'obj', 'object')
+        option_keys = frozenset(options.keys())
+
+        # Elements of arrays are charged by `check_array()`
+        has_element_check = '$' in options
+
+        checks = []
+        for option_key, option in sorted(options.items(), key=cmp_to_key(type_check_first_cmp)):
+            if option_key in DIRECTIVES or option_key in checker.custom_directives:
+                check = self.compile_directive(option_key, option)
+
+            elif option_key in NO_OP_DIRECTIVES:
+                check = None
+
+            elif option_key == '$':
+                check = self.compile_array(option)
+
+            else:
+                check = self.compile_field(option_key, option)
+
+            if check is not None:
+                checks.append(check)
+
+        checks = tuple(checks)
+
+        def check_node(obj, obj_name, walk):
+            if obj is nothing:
+                if skip_nothing:
+                    return
+
+                raise ObjectCheckerException(
+                    type_='missing',
+                    field_name=(obj_name or 'obj'))
+
+            if allow_null and obj is None:
+                return
+
+            if skip_all:
+                if walk is not None:
+                    walk.walk(obj, obj_name)
+
+                return
+
+            entered = False
+            if walk is not None:
+                if isinstance(obj, CONTAINER_TYPES):
+                    walk.enter(obj, obj_name)
+                    entered = True
+
+                elif isinstance(obj, (str, unicode)):
+                    walk.charge_string(obj, obj_name)
+
+            if check_unexpected and isinstance(obj, dict):
+                for obj_key in obj.keys():
+                    if obj_key not in option_keys:
+                        raise ObjectCheckerException(
+                            type_='unexpected',
+                            field_name=obj_key)
+
+            for check in checks:
+                check(obj, obj_name, walk)
+
+            if entered:
+                # Values not visited by the checks
+                if isinstance(obj, dict):
+                    if not check_unexpected:
+                        for obj_key, v in obj.items():
+                            if obj_key not in option_keys:
+                                walk.walk(v, obj_key)
+
+                elif not has_element_check:
+                    walk.walk(obj, obj_name, entered=True)
+
+                walk.leave()
+
+        return check_node
+
+    def verify(self, obj, obj_name=None, check_budget=True):
+        if obj_name is None:
+            obj_name = 'obj'
+
+        walk = None
+        if check_budget and self.budget is not None:
+            walk = BudgetWalk(self.budget)
+
+        self._verify(obj, obj_name, walk)
+
+    def is_valid(self, obj):
+        try:
+            self.verify(obj, 'obj')
+
+        except ObjectCheckerException:
+            return False
+
+        return True
+
+    def check(self, obj):
+        try:
+            self.verify(obj, 'obj')
+
+        except ObjectCheckerException as error:
+            return create_check_result(error, self.message_template)
 
-        return ret
+        return create_check_result(None, self.message_template)
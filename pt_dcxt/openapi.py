@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+import re
+
+from pt_dcxt.paging import get_paging_query
+
+OPENAPI_VERSION = '3.0.3'
+
+TYPE_SCHEMAS = {
+    'str'       : {'type': 'string'},
+    'string'    : {'type': 'string'},
+    'enum'      : {'type': 'string'},
+    'commaarray': {'type': 'string'},
+    'jsonstring': {'type': 'string', 'format': 'json'},
+    'num'       : {'type': 'number'},
+    'number'    : {'type': 'number'},
+    'float'     : {'type': 'number'},
+    'int'       : {'type': 'integer'},
+    'integer'   : {'type': 'integer'},
+    'bool'      : {'type': 'boolean'},
+    'boolean'   : {'type': 'boolean'},
+    'arr'       : {'type': 'array'},
+    'array'     : {'type': 'array'},
+    'json'      : {'type': 'object'},
+    'obj'       : {'type': 'object'},
+    'object'    : {'type': 'object'},
+}
+
+RESPONSE_CONTENT_TYPES = {
+    'json': 'application/json',
+    'html': 'text/html',
+    'text': 'text/plain',
+}
+
+re_url_param = re.compile(r'<(?:[^:<>]+:)?([^<>]+)>')
+
+# Session token of `requireSignIn` routes
+SECURITY_SCHEME_NAME = 'sessionToken'
+
+def is_required_option(option):
+    # Same as RouteLoader (`default_required=False`)
+    return isinstance(option, dict) and (option.get('$isRequired') or option.get('$required')) is True
+
+def gen_schema(options):
+    # Convert ObjectChecker directives to JSON Schema (OpenAPI flavor)
+    schema = OrderedDict()
+    if not isinstance(options, dict):
+        return schema
+
+    obj_type = options.get('$type', '').lower()
+    if obj_type in ('any', '*') or options.get('$skip') is True:
+        schema.update(description=options.get('$desc', ''))
+        return schema
+
+    if obj_type in TYPE_SCHEMAS:
+        schema.update(TYPE_SCHEMAS[obj_type])
+    elif '$' in options:
+        schema['type'] = 'array'
+    elif any(k[0] != '$' for k in options):
+        schema['type'] = 'object'
+
+    is_array = schema.get('type') == 'array'
+
+    properties = OrderedDict()
+    required   = []
+    for k, v in options.items():
+        if k == '$desc':
+            schema['description'] = v
+        elif k == '$name':
+            schema['title'] = v
+        elif k == '$example':
+            schema['example'] = v
+        elif k == '$allowNull':
+            schema['nullable'] = v
+        elif k == '$in':
+            schema['enum'] = list(v)
+        elif k == '$notIn':
+            schema['not'] = {'enum': list(v)}
+        elif k == '$isValue':
+            schema['enum'] = [v]
+        elif k == '$minValue':
+            schema['minimum'] = v
+        elif k == '$maxValue':
+            schema['maximum'] = v
+        elif k in ('$minLength', '$maxLength', '$isLength'):
+            min_key, max_key = ('minItems', 'maxItems') if is_array else ('minLength', 'maxLength')
+            if k in ('$minLength', '$isLength'):
+                schema[min_key] = v
+            if k in ('$maxLength', '$isLength'):
+                schema[max_key] = v
+        elif k == '$matchRegExp':
+            schema['pattern'] = v
+        elif k == '$notMatchRegExp':
+            schema['not'] = {'pattern': v}
+        elif k == '$isEmail' and v is True:
+            schema['format'] = 'email'
+        elif k == '$notEmptyString' and v is True:
+            schema['minLength'] = 1
+        elif k in ('$isPositiveInteger', '$isPositiveZeroInteger', '$isPositiveIntegerOrZero') and v is True:
+            schema['type'] = 'integer'
+            schema['minimum'] = 1 if k == '$isPositiveInteger' else 0
+        elif k in ('$isNegativeInteger', '$isNegativeZeroInteger', '$isNegativeIntegerOrZero') and v is True:
+            schema['type'] = 'integer'
+            schema['maximum'] = -1 if k == '$isNegativeInteger' else 0
+        elif k == '$isInteger' and v is True:
+            schema['type'] = 'integer'
+        elif k == '$commaArrayIn':
+            schema['x-commaArrayIn'] = list(v)
+        elif k in ('$inSource', '$commaArrayInSource'):
+            # Values are loaded at runtime, only the source name is exported
+            schema['x-' + k[1:]] = v
+        elif k == '$':
+            schema['items'] = gen_schema(v)
+        elif k[0] == '$':
+            # Other directives can not be expressed in JSON Schema
+            continue
+        else:
+            properties[k] = gen_schema(v)
+            if is_required_option(v):
+                required.append(k)
+
+    if properties:
+        schema['properties'] = properties
+        if required:
+            schema['required'] = required
+
+        if obj_type not in ('json', 'obj', 'object'):
+            # ObjectChecker rejects unexpected fields
+            schema['additionalProperties'] = False
+
+    return schema
+
+def gen_parameters(options, location):
+    parameters = []
+    for name, option in (options or {}).items():
+        if name[0] == '$':
+            continue
+
+        schema = gen_schema(option)
+        parameter = OrderedDict([
+            ('name'    , name),
+            ('in'      , location),
+            ('required', location == 'path' or is_required_option(option)),
+            ('schema'  , schema),
+        ])
+        if schema.get('description'):
+            parameter['description'] = schema['description']
+
+        parameters.append(parameter)
+
+    return parameters
+
+def gen_operation(config):
+    operation = OrderedDict()
+    operation['summary'] = config.get('name', '')
+    if config.get('desc'):
+        operation['description'] = config['desc']
+    if config.get('deprecated'):
+        operation['deprecated'] = True
+
+    parameters = []
+    parameters += gen_parameters(config.get('params'), 'path')
+    parameters += gen_parameters(get_paging_query(config), 'query')
+    parameters += gen_parameters(config.get('headers'), 'header')
+    if parameters:
+        operation['parameters'] = parameters
+
+    if config.get('body'):
+        content_types = config.get('contentType') or ['application/json']
+        if not isinstance(content_types, (tuple, list)):
+            content_types = [content_types]
+
+        body_schema = gen_schema(config['body'])
+        operation['requestBody'] = OrderedDict([
+            ('content', OrderedDict((t, {'schema': body_schema}) for t in content_types)),
+        ])
+
+    response = OrderedDict([('description', 'Success')])
+    response_content_type = RESPONSE_CONTENT_TYPES.get(config.get('response'))
+    if response_content_type:
+        response['content'] = {response_content_type: {}}
+        if config.get('responseBody'):
+            response['content'][response_content_type]['schema'] = gen_schema(config['responseBody'])
+
+    operation['responses'] = OrderedDict([
+        ('200', response),
+        ('400', {'description': 'Check failure'}),
+    ])
+
+    if config.get('requireSignIn') is True:
+        operation['security'] = [{SECURITY_SCHEME_NAME: []}]
+        operation['responses']['401'] = {'description': 'Sign in required'}
+
+    admission = config.get('admission') or {}
+    if admission.get('rate'):
+        operation['responses']['429'] = {'description': 'Rate limited, see `Retry-After`'}
+    if admission.get('maxConcurrent') or admission.get('queueTimeout'):
+        operation['responses']['503'] = {'description': 'Overloaded, see `Retry-After`'}
+
+    return operation
+
+def gen_openapi(route_loader, title=None, version=None, all_routes=False):
+    # Only routes with `showInDoc: true` are exported by default, like the API Document page
+    paths = OrderedDict()
+    for route in route_loader._ROUTES:
+        config = route.get('config', {})
+        if not all_routes and config.get('showInDoc') is not True:
+            continue
+
+        url = (config.get('prefix') or '') + config.get('url', '')
+        path = re_url_param.sub(r'{\1}', url)
+
+        paths.setdefault(path, OrderedDict())
+        paths[path][config.get('method', 'get').lower()] = gen_operation(config)
+
+    spec = OrderedDict([
+        ('openapi', OPENAPI_VERSION),
+        ('info'   , OrderedDict([
+            ('title'  , title or 'API Documents'),
+            ('version', version or '1.0.0'),
+        ])),
+        ('paths'  , paths),
+    ])
+
+    if any('security' in operation for operations in paths.values() for operation in operations.values()):
+        spec['components'] = {
+            'securitySchemes': {
+                SECURITY_SCHEME_NAME: {'type': 'http', 'scheme': 'bearer'},
+            },
+        }
+
+    return spec
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+# Keyset (cursor) pagination of routes with `paging` option.
+# `cursor` and `limit` query params are added to the route, and checked with other query params.
+# Cursors are signed, so that handlers can trust the key values in them.
+#
+# Usage:
+#   route.yaml:
+#     getOrders:
+#       method: get
+#       url   : /orders
+#       paging:
+#         key         : [createdAt, id]
+#         order       : desc
+#         defaultLimit: 20
+#         maxLimit    : 100
+#
+#   @route_loader.route(app, ROUTE['app']['getOrders'])
+#   def get_orders():
+#       paging = g.paging
+#       condition, values = paging.sql_condition(['created_at', 'id'])
+#       rows = db.execute('SELECT * FROM orders WHERE user_id = ? AND ' + condition +
+#           ' ORDER BY created_at DESC, id DESC LIMIT ?', [user_id] + values + [paging.fetch_limit])
+#       return jsonify(paging.page(rows))
+
+from collections import OrderedDict
+import binascii
+import base64
+import hashlib
+import hmac
+import json
+import os
+
+from pt_dcxt.common import get_route_name
+
+DEFAULT_PAGING_KEY = ['id']
+DEFAULT_LIMIT      = 20
+MAX_LIMIT          = 100
+
+CURSOR_MAX_LENGTH = 512
+
+# Truncated HMAC-SHA256
+SIGNATURE_SIZE = 16
+
+PAGING_QUERY = OrderedDict([
+    ('cursor', {
+        '$desc'       : 'Cursor of the next page, `nextCursor` of the previous page. Empty for the first page',
+        '$type'       : 'string',
+        '$example'    : '',
+        '$maxLength'  : CURSOR_MAX_LENGTH,
+        '$matchRegExp': '^[A-Za-z0-9_-]*$',
+    }),
+    ('limit', {
+        '$desc'       : 'Number of items per page',
+        '$type'       : 'int',
+        '$matchRegExp': '^[0-9]{1,9}$',
+    }),
+])
+
+def get_paging_options(config):
+    # `paging: true` or `paging: {key, order, defaultLimit, maxLimit}`, `None` when not paged
+    paging = config.get('paging')
+    if not paging:
+        return None
+
+    if not isinstance(paging, dict):
+        paging = {}
+
+    key = paging.get('key') or DEFAULT_PAGING_KEY
+    if not isinstance(key, (tuple, list)):
+        key = [key]
+
+    order = (paging.get('order') or 'asc').lower()
+    if order not in ('asc', 'desc'):
+        raise ValueError('Unknown paging order `{}`, should be `asc` or `desc`'.format(order))
+
+    max_limit     = paging.get('maxLimit') or MAX_LIMIT
+    default_limit = min(paging.get('defaultLimit') or DEFAULT_LIMIT, max_limit)
+
+    options = {
+        'key'         : list(key),
+        'order'       : order,
+        'defaultLimit': default_limit,
+        'maxLimit'    : max_limit,
+    }
+    return options
+
+def get_paging_query(config):
+    # Query options with `cursor` and `limit` of paged routes, query params declared by route win
+    paging_options = get_paging_options(config)
+    if paging_options is None:
+        return config.get('query')
+
+    query = OrderedDict(config.get('query') or {})
+    for k, v in PAGING_QUERY.items():
+        if k not in query:
+            query[k] = dict(v)
+
+    if 'limit' not in (config.get('query') or {}):
+        query['limit']['$desc'] = '{} (default: {}, max: {})'.format(
+            query['limit']['$desc'], paging_options['defaultLimit'], paging_options['maxLimit'])
+        query['limit']['$example'] = paging_options['defaultLimit']
+
+    return query
+
+def b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def b64decode(s):
+    s = s.encode('ascii')
+    return base64.urlsafe_b64decode(s + b'=' * (-len(s) % 4))
+
+def get_row_value(row, k):
+    # Rows are dicts, or objects (e.g. ORM models)
+    if isinstance(row, dict):
+        return row[k]
+
+    return getattr(row, k)
+
+class CursorCodec(object):
+    # Cursor = base64url(signature + JSON of [route, key values]), the signature is HMAC of the JSON.
+    # Cursors of other routes or other secrets are rejected.
+    def __init__(self, secret=None):
+        super(CursorCodec, self).__init__()
+
+        # Without a secret, cursors only work in current process
+        if secret is None:
+            secret = os.urandom(32)
+        elif not isinstance(secret, bytes):
+            secret = secret.encode('utf-8')
+
+        self.secret = secret
+
+    def sign(self, payload):
+        return hmac.new(self.secret, payload, hashlib.sha256).digest()[:SIGNATURE_SIZE]
+
+    def encode(self, route_name, values):
+        # Values are converted by `str()` when not JSON serializable (e.g. datetime)
+        payload = json.dumps([route_name, values], separators=(',', ':'), default=str).encode('utf-8')
+        return b64encode(self.sign(payload) + payload)
+
+    def decode(self, route_name, cursor):
+        # Returns key values, or `None` when the cursor is invalid
+        try:
+            data = b64decode(cursor)
+        except (ValueError, TypeError, binascii.Error):
+            return None
+
+        signature, payload = data[:SIGNATURE_SIZE], data[SIGNATURE_SIZE:]
+        if not hmac.compare_digest(signature, self.sign(payload)):
+            return None
+
+        try:
+            cursor_route_name, values = json.loads(payload.decode('utf-8'))
+        except (ValueError, TypeError):
+            return None
+
+        if cursor_route_name != route_name or not isinstance(values, list):
+            return None
+
+        return values
+
+class Paging(object):
+    # Paging of current request, `g.paging`
+    def __init__(self, route_paging, after, limit):
+        super(Paging, self).__init__()
+
+        self.route_paging = route_paging
+        self.key          = route_paging.key
+        self.order        = route_paging.order
+
+        # Key values of the last item of the previous page, `None` for the first page
+        self.after = after
+        self.limit = limit
+
+        # One more row tells whether there is a next page
+        self.fetch_limit = limit + 1
+
+    @property
+    def is_first_page(self):
+        return self.after is None
+
+    def get_after(self):
+        # Key -> value of the last item of the previous page
+        if self.after is None:
+            return None
+
+        return OrderedDict(zip(self.key, self.after))
+
+    def sql_condition(self, columns=None, placeholder='?'):
+        # Row value comparison, e.g. `(created_at, id) < (?, ?)`, `1 = 1` for the first page.
+        # Returns (SQL, values)
+        if self.after is None:
+            return '1 = 1', []
+
+        columns = columns or self.key
+        operator = '>' if self.order == 'asc' else '<'
+        sql = '({}) {} ({})'.format(', '.join(columns), operator, ', '.join([placeholder] * len(columns)))
+        return sql, list(self.after)
+
+    def next_cursor(self, row):
+        return self.route_paging.encode_cursor([get_row_value(row, k) for k in self.key])
+
+    def page(self, rows):
+        # Rows fetched with `fetch_limit`, returns `{'items': [...], 'nextCursor': ...}`
+        rows = list(rows)
+
+        next_cursor = None
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            next_cursor = self.next_cursor(rows[-1])
+
+        ret = OrderedDict([
+            ('items'     , rows),
+            ('nextCursor', next_cursor),
+        ])
+        return ret
+
+class RoutePaging(object):
+    # Compiled paging options of a route
+    def __init__(self, config, cursor_codec):
+        super(RoutePaging, self).__init__()
+
+        options = get_paging_options(config)
+
+        self.route_name   = get_route_name(config)
+        self.cursor_codec = cursor_codec
+
+        self.key           = options['key']
+        self.order         = options['order']
+        self.default_limit = options['defaultLimit']
+        self.max_limit     = options['maxLimit']
+
+    def encode_cursor(self, values):
+        return self.cursor_codec.encode(self.route_name, values)
+
+    def parse(self, query):
+        # Returns (Paging, None), or (None, (field name, field value, checker name, checker option)) when invalid
+        limit = query.get('limit')
+        if limit:
+            # `limit` declared by the route may not be checked as digits
+            try:
+                limit = int(limit)
+            except (TypeError, ValueError):
+                return None, ('limit', limit, '$type', 'int')
+
+            if limit < 1:
+                return None, ('limit', limit, '$minValue', 1)
+            if limit > self.max_limit:
+                return None, ('limit', limit, '$maxValue', self.max_limit)
+        else:
+            limit = self.default_limit
+
+        after = None
+        cursor = query.get('cursor')
+        if cursor:
+            after = self.cursor_codec.decode(self.route_name, cursor)
+            if after is None or len(after) != len(self.key):
+                return None, ('cursor', cursor, '$signedCursor', True)
+
+        return Paging(self, after, limit), None
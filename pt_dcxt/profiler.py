@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import random
+import marshal
+import cProfile
+import pstats
+import hmac
+import glob
+import re
+import os
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+PROFILE_FILE_EXT = '.prof'
+
+# Sort keys for formatted stats
+PROFILE_SORT_KEYS = ('cumulative', 'tottime', 'ncalls', 'calls', 'time')
+
+re_unsafe_file_name_chars = re.compile(r'[^A-Za-z0-9]+')
+re_profile_name           = re.compile(r'^[A-Za-z0-9_]+$')
+
+def get_profile_name(config):
+    # e.g. `POST /my_module/<param_field>/do_post` -> `POST_my_module_param_field_do_post`
+    url = (config.get('prefix') or '') + config.get('url', '')
+    return re_unsafe_file_name_chars.sub('_', '{} {}'.format(config.get('method', '').upper(), url)).strip('_')
+
+class RouteProfiler(object):
+    # Profiles sampled requests (`sample_rate`), or requests with `trigger_header: trigger_token`, by cProfile.
+    # Profiles of each route are aggregated into `<profile_dir>/<profile name>.<pid>.prof`
+    # (one file per process, merged when downloaded).
+    # Profiles are only available with `trigger_token`, the URLs are disabled without it.
+    def __init__(self, profile_dir, sample_rate=0.0, trigger_header='X-Profile', trigger_token=None):
+        super(RouteProfiler, self).__init__()
+
+        self.profile_dir    = profile_dir
+        self.sample_rate    = sample_rate or 0.0
+        self.trigger_header = trigger_header
+        self.trigger_token  = trigger_token
+
+        self._lock = threading.Lock()
+
+        # One request is profiled at a time in the process
+        self._profile_lock = threading.Lock()
+
+        if not os.path.exists(self.profile_dir):
+            os.makedirs(self.profile_dir)
+
+    def is_authorized(self, token):
+        if not self.trigger_token or not token:
+            return False
+
+        return hmac.compare_digest(str(token), str(self.trigger_token))
+
+    def should_profile(self, headers):
+        if self.is_authorized(headers.get(self.trigger_header)):
+            return True
+
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def get_file_path(self, name):
+        return os.path.join(self.profile_dir, '{}.{}{}'.format(name, os.getpid(), PROFILE_FILE_EXT))
+
+    def profile(self, config, func, *args, **kwargs):
+        # Profilers of Python 3.12+ are process wide, enabling another one (e.g. in another thread) raises.
+        # Requests are not profiled while another request is
+        if not self._profile_lock.acquire(False):
+            return func(*args, **kwargs)
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiling tool is active (e.g. a debugger)
+            self._profile_lock.release()
+            return func(*args, **kwargs)
+
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            self._profile_lock.release()
+
+            self.save(get_profile_name(config), profile)
+
+    def save(self, name, profile):
+        file_path = self.get_file_path(name)
+        with self._lock:
+            stats = pstats.Stats(profile)
+            if os.path.exists(file_path):
+                stats.add(file_path)
+
+            tmp_file_path = file_path + '.tmp'
+            stats.dump_stats(tmp_file_path)
+            os.rename(tmp_file_path, file_path)
+
+    def list_profiles(self):
+        # Profile name -> summary of all processes
+        profiles = {}
+        for file_path in glob.glob(os.path.join(self.profile_dir, '*' + PROFILE_FILE_EXT)):
+            name = os.path.basename(file_path).rsplit('.', 2)[0]
+            file_stat = os.stat(file_path)
+
+            p = profiles.setdefault(name, {
+                'name'     : name,
+                'files'    : 0,
+                'size'     : 0,
+                'updatedAt': 0,
+            })
+            p['files']    += 1
+            p['size']     += file_stat.st_size
+            p['updatedAt'] = max(p['updatedAt'], file_stat.st_mtime)
+
+        return [profiles[name] for name in sorted(profiles)]
+
+    def load_stats(self, name):
+        # Returns `None` when no such profile
+        if not re_profile_name.match(name):
+            return None
+
+        file_paths = sorted(glob.glob(os.path.join(self.profile_dir, name + '.*' + PROFILE_FILE_EXT)))
+        if not file_paths:
+            return None
+
+        return pstats.Stats(*file_paths)
+
+    def dump_stats(self, stats):
+        # Same format as `pstats.Stats.dump_stats()`, can be opened by `pstats`/`snakeviz`
+        return marshal.dumps(stats.stats)
+
+    def format_stats(self, stats, sort_key='cumulative', limit=50):
+        stream = StringIO()
+        stats.stream = stream
+        stats.sort_stats(sort_key).print_stats(limit)
+        return stream.getvalue()
+
+    def clear(self, name=None):
+        if name and not re_profile_name.match(name):
+            return
+
+        pattern = (name + '.*' if name else '*') + PROFILE_FILE_EXT
+        for file_path in glob.glob(os.path.join(self.profile_dir, pattern)):
+            os.remove(file_path)
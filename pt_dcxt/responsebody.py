@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+# `responseBody` route option: the shape of JSON responses, in the same format as `body`.
+# Data returned by handlers is projected by a function compiled from the options once (a copy of declared fields only,
+# in declared order), and then serialized by the JSON codec of RouteLoader (not by an encoder generated for the schema).
+# A sample of projected responses is checked by `ObjectChecker` to catch contract drift.
+#
+# Usage:
+#   @route_loader.route(app, ROUTE['app']['getDish'])
+#   def get_dish():
+#       return {'id': 1, 'name': 'Noodles'}
+
+from functools import wraps
+import logging
+import random
+import time
+
+from flask import g, make_response
+
+from pt_dcxt.objectchecker import ObjectChecker, nothing
+from pt_dcxt.common import get_route_name
+
+logger = logging.getLogger(__name__)
+
+timer = getattr(time, 'perf_counter', time.time)
+
+# The same as body
+RESPONSE_CUSTOM_DIRECTIVES = {
+    '$desc'   : None,
+    '$name'   : None,
+    '$example': None,
+}
+
+def add_timing(route_timings, name, start):
+    route_timings[name] = route_timings.get(name, 0) + (timer() - start)
+
+def split_handler_result(ret):
+    # `data`, `(data, status)`, `(data, headers)` or `(data, status, headers)` like Flask
+    if isinstance(ret, tuple):
+        return ret[0], ret[1:]
+
+    return ret, ()
+
+def compile_projection(options):
+    # Returns a function copying declared fields only, or `None` when values are kept as is
+    if not isinstance(options, dict):
+        return None
+
+    obj_type = options.get('$type', '').lower()
+    if options.get('$skip') is True or obj_type in ('any', '*'):
+        return None
+
+    if '$' in options:
+        project_element = compile_projection(options['$'])
+        if project_element is None:
+            return None
+
+        def project_array(obj):
+            if not isinstance(obj, (tuple, list)):
+                return obj
+
+            return [project_element(e) for e in obj]
+
+        return project_array
+
+    fields = tuple((k, compile_projection(v)) for k, v in options.items() if not k.startswith('$'))
+    if not fields:
+        return None
+
+    def project_object(obj):
+        if not isinstance(obj, dict):
+            return obj
+
+        ret = {}
+        for key, project in fields:
+            v = obj.get(key, nothing)
+            if v is nothing:
+                continue
+
+            ret[key] = v if project is None or v is None else project(v)
+
+        return ret
+
+    return project_object
+
+class ResponseBody(object):
+    def __init__(self, config, json_codec, sample_rate=0.0):
+        super(ResponseBody, self).__init__()
+
+        options = config['responseBody']
+
+        self.route_name = get_route_name(config)
+        self.json_codec = json_codec
+
+        # Ratio of responses to check, `responseSampleRate` route option overrides the default one
+        self.sample_rate = config.get('responseSampleRate', sample_rate) or 0.0
+
+        self.project = compile_projection(options)
+
+        checker = ObjectChecker(default_required=False, custom_directives=RESPONSE_CUSTOM_DIRECTIVES)
+        self.checker = checker.compile(options)
+
+    def project_data(self, data):
+        if self.project is None:
+            return data
+
+        return self.project(data)
+
+    def should_validate(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def validate(self, data, route_timings):
+        # Invalid responses are still sent, the failure is logged.
+        # Returns the failure to be kept for metrics, or `None`
+        start = timer()
+        ret = self.checker.check(data)
+        add_timing(route_timings, 'check.response', start)
+
+        if ret['isValid']:
+            return None
+
+        logger.warning('Response of `%s` does not match `responseBody`: %s', self.route_name, ret['message'])
+        return ret
+
+    def dump_data(self, data, route_timings):
+        # Returns (JSON string of projected data, failure of the sampled check or `None`).
+        # What is sent is checked, fields removed by the projection are not violations
+        start = timer()
+        data = self.project_data(data)
+        add_timing(route_timings, 'response.serialize', start)
+
+        failure = None
+        if self.should_validate():
+            failure = self.validate(data, route_timings)
+
+        start = timer()
+        body = self.json_codec.dumps(data)
+        add_timing(route_timings, 'response.serialize', start)
+        return body, failure
+
+    def wrap(self, handler):
+        @wraps(handler)
+        def serialized_handler(*args, **kwargs):
+            ret = handler(*args, **kwargs)
+
+            data, rest = split_handler_result(ret)
+            if isinstance(data, (dict, list)):
+                body, failure = self.dump_data(data, g.route_timings)
+                if failure is not None:
+                    g.route_response_failure = failure
+
+                response = make_response(body, *rest)
+                response.mimetype = 'application/json'
+                return response
+
+            # Responses made by handler (e.g. `jsonify()`) are only checked
+            if self.should_validate():
+                response = make_response(ret)
+                if response.is_json and not response.is_streamed:
+                    data = response.get_json(silent=True)
+                    if data is not None:
+                        failure = self.validate(data, g.route_timings)
+                        if failure is not None:
+                            g.route_response_failure = failure
+
+                return response
+
+            return ret
+
+        return serialized_handler
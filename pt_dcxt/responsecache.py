@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+from functools import wraps
+from collections import OrderedDict
+import threading
+import sqlite3
+import hashlib
+import pickle
+import json
+import time
+
+from flask import request, g, make_response
+
+from pt_dcxt.common import SQLiteBackend, get_route_name
+
+DEFAULT_CACHE_TTL         = 60
+DEFAULT_CACHE_MAX_ENTRIES = 1000
+
+# Only responses of these methods are cached
+CACHEABLE_METHODS = ('get', 'head')
+
+# Headers not to be stored in cache entries
+UNCACHED_HEADERS = ('content-length', 'etag', 'last-modified', 'date', 'x-cache')
+
+def get_cache_key(params, vary_headers, session_token_hash=None, req=None):
+    # Normalized query (already checked), URL params, values of vary-on headers,
+    # and the session of `requireSignIn` routes.
+    # `req` is the Flask request by default, or e.g. the Quart request
+    if req is None:
+        req = request
+
+    key_data = [
+        sorted(req.args.items(multi=True)),
+        sorted((k, str(v)) for k, v in params.items()),
+        [req.headers.get(h) for h in vary_headers],
+    ]
+    if session_token_hash is not None:
+        key_data.append(session_token_hash)
+
+    return hashlib.md5(json.dumps(key_data).encode('utf-8')).hexdigest()
+
+def create_cache_entry(response, body=None):
+    if body is None:
+        body = response.get_data()
+
+    return {
+        'status'      : response.status_code,
+        'headers'     : [(k, v) for k, v in response.headers.items() if k.lower() not in UNCACHED_HEADERS],
+        'body'        : body,
+        'etag'        : hashlib.md5(body).hexdigest(),
+        'lastModified': int(time.time()),
+    }
+
+def is_cacheable_response(response):
+    return response.status_code == 200 and not response.is_streamed and 'Set-Cookie' not in response.headers
+
+class MemoryCacheBackend(object):
+    # In-process LRU cache with TTL
+    def __init__(self):
+        super(MemoryCacheBackend, self).__init__()
+
+        self._lock = threading.Lock()
+
+        # Route name -> OrderedDict(key -> (expires at, entry))
+        self._routes = {}
+
+    def get(self, route_name, key):
+        with self._lock:
+            entries = self._routes.get(route_name)
+            if not entries or key not in entries:
+                return None
+
+            expires_at, entry = entries[key]
+            if expires_at <= time.time():
+                del entries[key]
+                return None
+
+            # Most recently used at the end
+            entries[key] = entries.pop(key)
+            return entry
+
+    def set(self, route_name, key, entry, ttl, max_entries):
+        with self._lock:
+            entries = self._routes.setdefault(route_name, OrderedDict())
+            entries.pop(key, None)
+            entries[key] = (time.time() + ttl, entry)
+
+            while len(entries) > max_entries:
+                entries.popitem(last=False)
+
+    def clear(self, route_name=None):
+        with self._lock:
+            if route_name is None:
+                self._routes.clear()
+            else:
+                self._routes.pop(route_name, None)
+
+class SQLiteCacheBackend(SQLiteBackend):
+    # Cache shared by processes on the same host, stored in a SQLite file
+    def __init__(self, db_path):
+        super(SQLiteCacheBackend, self).__init__(db_path)
+
+        with self.get_conn() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    route_name TEXT NOT NULL,
+                    key        TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    used_at    REAL NOT NULL,
+                    entry      BLOB NOT NULL,
+                    PRIMARY KEY (route_name, key)
+                )''')
+
+    def get(self, route_name, key):
+        now = time.time()
+        with self.get_conn() as conn:
+            row = conn.execute('SELECT expires_at, entry FROM response_cache WHERE route_name = ? AND key = ?', (route_name, key)).fetchone()
+            if row is None:
+                return None
+
+            if row[0] <= now:
+                conn.execute('DELETE FROM response_cache WHERE route_name = ? AND key = ?', (route_name, key))
+                return None
+
+            conn.execute('UPDATE response_cache SET used_at = ? WHERE route_name = ? AND key = ?', (now, route_name, key))
+            return pickle.loads(row[1])
+
+    def set(self, route_name, key, entry, ttl, max_entries):
+        now = time.time()
+        with self.get_conn() as conn:
+            conn.execute('INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?)',
+                (route_name, key, now + ttl, now, sqlite3.Binary(pickle.dumps(entry, pickle.HIGHEST_PROTOCOL))))
+
+            # Remove expired and least recently used entries
+            conn.execute('DELETE FROM response_cache WHERE route_name = ? AND expires_at <= ?', (route_name, now))
+            conn.execute('''
+                DELETE FROM response_cache WHERE route_name = ? AND key NOT IN (
+                    SELECT key FROM response_cache WHERE route_name = ? ORDER BY used_at DESC LIMIT ?
+                )''', (route_name, route_name, max_entries))
+
+    def clear(self, route_name=None):
+        with self.get_conn() as conn:
+            if route_name is None:
+                conn.execute('DELETE FROM response_cache')
+            else:
+                conn.execute('DELETE FROM response_cache WHERE route_name = ?', (route_name,))
+
+class ResponseCache(object):
+    # Route option:
+    #   cache:
+    #     ttl        : 60    # Seconds
+    #     maxEntries : 1000
+    #     varyHeaders:       # Headers to be a part of the cache key
+    #       - Accept-Language
+    def __init__(self, config, backend):
+        super(ResponseCache, self).__init__()
+
+        cache_config = config.get('cache')
+        if not isinstance(cache_config, dict):
+            cache_config = {}
+
+        self.route_name   = get_route_name(config)
+        self.ttl          = cache_config.get('ttl', DEFAULT_CACHE_TTL)
+        self.max_entries  = cache_config.get('maxEntries', DEFAULT_CACHE_MAX_ENTRIES)
+        self.vary_headers = list(cache_config.get('varyHeaders') or [])
+        self.backend      = backend
+
+        # Responses of `requireSignIn` routes are cached for each session
+        self.require_sign_in = config.get('requireSignIn') is True
+
+    def make_cached_response(self, entry, hit):
+        response = make_response(entry['body'], entry['status'])
+        response.headers.clear()
+        for k, v in entry['headers']:
+            response.headers.add(k, v)
+
+        response.set_etag(entry['etag'])
+        response.last_modified = entry['lastModified']
+        response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+        if self.vary_headers:
+            response.vary.update(self.vary_headers)
+
+        return response.make_conditional(request)
+
+    def wrap(self, handler):
+        @wraps(handler)
+        def cached_handler(*args, **kwargs):
+            session_token_hash = None
+            if self.require_sign_in:
+                # Not cached when sign-in is not enforced, the response may be of any user
+                session_token_hash = g.get('session_token_hash')
+                if session_token_hash is None:
+                    return handler(*args, **kwargs)
+
+            key = get_cache_key(kwargs, self.vary_headers, session_token_hash)
+
+            entry = self.backend.get(self.route_name, key)
+            if entry is not None:
+                return self.make_cached_response(entry, hit=True)
+
+            response = make_response(handler(*args, **kwargs))
+            if not is_cacheable_response(response):
+                return response
+
+            entry = create_cache_entry(response)
+            self.backend.set(self.route_name, key, entry, self.ttl, self.max_entries)
+            return self.make_cached_response(entry, hit=False)
+
+        return cached_handler
+
+    def clear(self):
+        self.backend.clear(self.route_name)
@@ -2,14 +2,32 @@
 
 from functools import wraps
 from collections import OrderedDict
-import json
+import threading
+import time
 import hashlib
+import logging
+import json
+import gzip
 
-from flask import Blueprint, request, abort, render_template, make_response, jsonify
-import markdown
+from flask import Blueprint, request, g, abort, render_template, make_response, url_for
+from werkzeug.exceptions import HTTPException
 
-from pt_dcxt.objectchecker import ObjectChecker
+from pt_dcxt.jsoncodec import get_json_codec
+from pt_dcxt.common import get_route_name
+from pt_dcxt.objectchecker import ObjectChecker, ObjectCheckerException, create_check_result, create_validation_budget, nothing
+from pt_dcxt.enumsource import get_enum_options
+from pt_dcxt.streamchecker import StreamChecker, RecordingStream
+from pt_dcxt.metrics import RouteMetrics
+from pt_dcxt.responsecache import ResponseCache, MemoryCacheBackend, CACHEABLE_METHODS
+from pt_dcxt.responsebody import ResponseBody
+from pt_dcxt.signin import SignIn, hash_session_token
+from pt_dcxt.paging import RoutePaging, CursorCodec, get_paging_query, get_paging_options
+from pt_dcxt.admission import RouteAdmission, MemoryAdmissionBackend
+from pt_dcxt.batch import Batch, create_batch_config, DEFAULT_BATCH_MAX_ITEMS
+from pt_dcxt.warmup import get_memory_usage, freeze_gc
+from pt_dcxt.profiler import RouteProfiler, get_profile_name, PROFILE_SORT_KEYS
 
+logger = logging.getLogger(__name__)
 
 def get_md5(s):
     md5 = hashlib.md5()
@@ -18,7 +36,26 @@ def get_md5(s):
     md5_string = md5.hexdigest()
     return md5_string
 
+def get_routes_md5(routes):
+    # Content hash of route configs
+    configs = [r.get('config') for r in routes]
+    return get_md5(json.dumps(configs, sort_keys=True, default=str))
+
+def get_config_md5(config):
+    return get_md5(json.dumps(config, sort_keys=True, default=str))
+
+def create_doc_cache_entry(html, etag):
+    html = html.encode('utf-8')
+    return {
+        'etag': etag,
+        'html': html,
+        'gzip': gzip.compress(html, 9),
+    }
+
 def render_md(text):
+    # Imported only when documents are rendered
+    import markdown
+
     exts = [
         'markdown.extensions.extra',
     ]
@@ -56,8 +93,9 @@ def flatten_param_config(param_config, cur_key=None):
 
     return d
 
-def gen_param_sample(param_config):
-    flattened_param_config = flatten_param_config(param_config)
+def gen_param_sample(param_config, flattened_param_config=None):
+    if flattened_param_config is None:
+        flattened_param_config = flatten_param_config(param_config)
 
     d = OrderedDict()
     for k, v in flattened_param_config.items():
@@ -74,11 +112,19 @@ def gen_param_sample(param_config):
             if (isinstance(obj, (dict, OrderedDict)) and obj.get(step) is None) or (isinstance(obj, list) and step.isalnum() and len(obj) < int(step) + 1):
                 _type = v.get('$type')
                 if _type == 'enum':
+                    in_options = get_enum_options(v, '$in')
                     if is_array:
-                        auto_example = [v.get('$in')[0], v.get('$in')[-1]]
+                        auto_example = [in_options[0], in_options[-1]]
                         obj.extend(v.get('$example', auto_example))
                     else:
-                        auto_example = v.get('$in')[0]
+                        auto_example = in_options[0]
+                        obj[step] = v.get('$example', auto_example)
+
+                elif _type == 'commaArray' and (v.get('$commaArrayIn') or v.get('$commaArrayInSource')):
+                    auto_example = ','.join(get_enum_options(v, '$commaArrayIn')[:2])
+                    if is_array:
+                        obj.extend(v.get('$example', [auto_example]))
+                    else:
                         obj[step] = v.get('$example', auto_example)
 
                 elif _type in ('str', 'string', 'commaArray'):
@@ -139,113 +185,944 @@ def gen_param_sample(param_config):
 
     return d
 
+QUERY_CUSTOM_DIRECTIVES = {
+    '$desc'      : None,
+    '$name'      : None,
+    '$type'      : None,
+    '$example'   : None,
+}
+
+BODY_CUSTOM_DIRECTIVES = {
+    '$desc'      : None,
+    '$name'      : None,
+    '$example'   : None,
+}
+
+# URL params are converted by Flask URL converters, so `$type` is skipped like query
+PARAMS_CUSTOM_DIRECTIVES = QUERY_CUSTOM_DIRECTIVES
+
+# Header values are always strings, so `$type` is skipped like query
+HEADERS_CUSTOM_DIRECTIVES = QUERY_CUSTOM_DIRECTIVES
+
+ROUTE_CHECKER_CUSTOM_DIRECTIVES = OrderedDict([
+    ('headers', HEADERS_CUSTOM_DIRECTIVES),
+    ('params' , PARAMS_CUSTOM_DIRECTIVES),
+    ('query'  , QUERY_CUSTOM_DIRECTIVES),
+    ('body'   , BODY_CUSTOM_DIRECTIVES),
+])
+
+def get_route_param_config(config, category):
+    # Query of paged routes includes `cursor` and `limit`
+    if category == 'query':
+        return get_paging_query(config)
+
+    return config.get(category)
+
+def compile_route_checkers(config, default_budget=None):
+    checkers = {}
+    for category, custom_directives in ROUTE_CHECKER_CUSTOM_DIRECTIVES.items():
+        param_config = get_route_param_config(config, category)
+        if not param_config:
+            continue
+
+        # Validation budget of body, `budget` route option overrides the default one
+        budget = None
+        if category == 'body':
+            budget = create_validation_budget(default_budget, config.get('budget'))
+
+        default_required = False
+        checker = ObjectChecker(default_required=default_required, custom_directives=custom_directives)
+        checkers[category] = checker.compile(param_config, budget)
+
+    # Opt-in streaming body checking
+    if config.get('streamBody') is True and checkers.get('body'):
+        checkers['bodyStream'] = StreamChecker(checkers['body'])
+
+    return checkers
+
+def create_admission_failure(field_name, field_value, checker_name, checker_option, type_='invalid'):
+    # Same format as `ObjectChecker.check()` failure
+    error = ObjectCheckerException(
+        type_=type_,
+        field_name=field_name,
+        field_value=field_value,
+        checker_name=checker_name,
+        checker_option=checker_option)
+
+    return create_check_result(error, ObjectChecker().message_template)
+
+def create_overloaded_failure(failure):
+    # Check failure, status code and headers of a request rejected by `RouteAdmission`
+    status_code, retry_after, field_name, checker_name, checker_option = failure
+    ret = create_admission_failure(field_name, None, checker_name, checker_option, type_='overloaded')
+    return ret, status_code, {'Retry-After': str(retry_after)}
+
+def has_request_body(req=None):
+    # `req` is the Flask request by default, or e.g. the Quart request
+    if req is None:
+        req = request
+
+    return bool(req.content_length) or 'chunked' in req.headers.get('Transfer-Encoding', '').lower()
+
+def read_request_data(max_body_size=None):
+    # Returns `None` when the body is over `max_body_size`
+    if max_body_size is None:
+        return request.get_data()
+
+    incomming_stream = RecordingStream(request.stream, max_size=max_body_size)
+    while incomming_stream.read(64 * 1024):
+        pass
+
+    if incomming_stream.too_large:
+        return None
+
+    data = incomming_stream.get_data()
+
+    # Keep the raw body available for `request.get_data()`
+    request._cached_data = data
+    return data
+
+timer = getattr(time, 'perf_counter', time.time)
+
+def is_middleware(middleware):
+    return hasattr(middleware, '__call__') or hasattr(middleware, 'before') or hasattr(middleware, 'after')
+
+def normalize_middlewares(middlewares):
+    if is_middleware(middlewares):
+        return [middlewares]
+    elif isinstance(middlewares, (tuple, list)):
+        return list(middlewares)
+    else:
+        return []
+
+def get_middleware_name(middleware):
+    return getattr(middleware, '__name__', None) or type(middleware).__name__
+
+def add_route_timing(route_timings, name, start):
+    route_timings[name] = route_timings.get(name, 0) + (timer() - start)
+
+def record_timing(name, start):
+    # Time spent in each stage of current request, in seconds
+    add_route_timing(g.route_timings, name, start)
+
+def wrap_middleware(middleware, next_stage, config):
+    # A middleware is a function `middleware(config)`,
+    # or an object with `before(config)` and/or `after(config, response)` methods.
+    if hasattr(middleware, 'before') or hasattr(middleware, 'after'):
+        before = getattr(middleware, 'before', None)
+        after  = getattr(middleware, 'after', None)
+    else:
+        before = middleware
+        after  = None
+
+    name = 'middleware.' + get_middleware_name(middleware)
+
+    def middleware_stage(*args, **kwargs):
+        if before is not None:
+            start = timer()
+            try:
+                ret = before(config)
+            finally:
+                record_timing(name, start)
+
+            # Short-circuit
+            if ret is not None:
+                return ret
+
+        response = next_stage(*args, **kwargs)
+
+        if after is not None:
+            start = timer()
+            try:
+                response = make_response(response)
+                ret = after(config, response)
+            finally:
+                record_timing(name + '.after', start)
+
+            # Replace response
+            if ret is not None:
+                response = ret
+
+        return response
+
+    return middleware_stage
+
+def compose_middleware_chain(middlewares, handler, config):
+    # Middlewares and handler are composed into one function once, when route is registered.
+    def handler_stage(*args, **kwargs):
+        start = timer()
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            record_timing('handler', start)
+
+    chain = handler_stage
+    for middleware in reversed(middlewares):
+        chain = wrap_middleware(middleware, chain, config)
+
+    return chain
+
+def create_server_timing(route_timings):
+    return ', '.join('{};dur={:.3f}'.format(name, elapsed * 1000) for name, elapsed in route_timings.items())
+
 class RouteLoader(object):
-    def __init__(self, middlewares=None):
+    def __init__(self, middlewares=None, json_codec=None, server_timing=False, cache_backend=None, route_manifest=None,
+            budget=None, response_sample_rate=0.0, paging_secret=None, admission_backend=None):
         super(RouteLoader, self).__init__()
 
         self._ROUTES = []
 
-        if hasattr(middlewares, '__call__'):
-            self.middlewares = [middlewares]
-        elif isinstance(middlewares, (tuple, list)):
-            self.middlewares = middlewares
+        # Global middlewares run before route middlewares
+        self.middlewares = normalize_middlewares(middlewares)
+
+        # Add `Server-Timing` header of middlewares and handler to responses
+        self.server_timing = server_timing
+
+        self.doc_rule    = '/docs'
+        self.doc_lazy    = False
+        self.doc_created = False
+
+        # JSON codec for parsing body, failure responses and documents
+        # (the standard `json` by default, `orjson`/`ujson` are opt-in)
+        self.json_codec = get_json_codec(json_codec)
+
+        # Backend of routes with `cache` option, e.g. `SQLiteCacheBackend` to share between processes
+        self.cache_backend = cache_backend or MemoryCacheBackend()
+
+        # State of routes with `admission` option, e.g. `SQLiteAdmissionBackend` to share limits between processes
+        self.admission_backend = admission_backend or MemoryAdmissionBackend()
+
+        # Default validation budget of bodies (e.g. `{'maxDepth': 32, 'maxNodes': 10000}`),
+        # overridden by `budget` route option
+        self.budget = budget
+
+        # Ratio of responses checked by `responseBody` route option,
+        # overridden by `responseSampleRate` route option
+        self.response_sample_rate = response_sample_rate
+
+        # Signing cursors of `paging` routes. Set the same secret in all processes,
+        # otherwise cursors only work in the process making them
+        self.cursor_codec = CursorCodec(paging_secret)
+
+        # Per-route metrics, enabled by `create_metrics()`
+        self.metrics_rule = '/metrics'
+        self.metrics      = None
+
+        # Sampling profiler, enabled by `create_profiler()`
+        self.profiler_rule = '/profiles'
+        self.profiler      = None
+
+        # Sign-in enforcement of `requireSignIn` routes, enabled by `create_sign_in()`
+        self.sign_in        = None
+        self.sign_in_warned = False
+
+        # Batch route, enabled by `create_batch()`
+        self.batch_rule = '/batch'
+        self.batch      = None
+
+        # id(param config) -> (param config, flattened param config), from route manifests
+        self._flattened_param_configs = {}
+        if route_manifest is not None:
+            self.add_route_manifest(route_manifest)
+
+        # Rendered API document is cached until routes changed
+        self._routes_version = 0
+        self._doc_cache      = None
+        self._doc_cache_lock = threading.Lock()
+
+    def add_route_manifest(self, route_manifest):
+        # Use flattened param configs in the manifest (see `routemanifest.py`).
+        # Entries of the previous manifest are replaced, except param configs still used by registered routes
+        # (e.g. routes unchanged on reload), so that reloads do not pile up entries
+        flattened_param_configs = {}
+        for route in self._ROUTES:
+            for category in ROUTE_CHECKER_CUSTOM_DIRECTIVES:
+                param_config = route['config'].get(category)
+                cached = self._flattened_param_configs.get(id(param_config))
+                if cached is not None and cached[0] is param_config:
+                    flattened_param_configs[id(param_config)] = cached
+
+        for path, flattened_param_config in route_manifest['flattenedParamConfigs']:
+            param_config = route_manifest['routes']
+            for k in path:
+                param_config = param_config[k]
+
+            flattened_param_configs[id(param_config)] = (param_config, flattened_param_config)
+
+        # Swapped, readers see either the old or the new entries
+        self._flattened_param_configs = flattened_param_configs
+
+    def flatten_param_config(self, param_config):
+        cached = self._flattened_param_configs.get(id(param_config))
+        if cached is not None and cached[0] is param_config:
+            return cached[1]
+
+        return flatten_param_config(param_config)
+
+    def gen_param_sample(self, param_config):
+        return gen_param_sample(param_config, self.flatten_param_config(param_config))
+
+    def make_json_response(self, data, status_code=200):
+        response = make_response(self.json_codec.dumps(data), status_code)
+        response.mimetype = 'application/json'
+        return response
+
+    def make_check_failure_response(self, ret, status_code=400, headers=None):
+        # Failure is kept for metrics
+        g.route_check_failure = ret
+        response = self.make_json_response(ret, status_code)
+        if headers:
+            response.headers.update(headers)
+
+        return response
+
+    def check_request(self, route, req, params, route_timings, verified=None):
+        # Checks before reading any byte of body, shared by RouteLoader and AsyncRouteLoader.
+        # `req` is the Flask or Quart request, time of each check is added to `route_timings`.
+        # `verified` is (token, session) already verified by AsyncRouteLoader, not to block the event loop.
+        # Returns (values to be set to `g`, None), or (None, (check failure, status code, headers))
+        checkers      = route['checkers']
+        max_body_size = route['maxBodySize']
+        content_types = route['contentTypes']
+
+        g_values = {}
+
+        # Check session (cached, usually no round-trip to the session backend)
+        sign_in = self.sign_in
+        if sign_in is not None and route['requireSignIn']:
+            start = timer()
+            if verified is None:
+                token = sign_in.get_token(req)
+                session = sign_in.verify(token)
+            else:
+                token, session = verified
+            add_route_timing(route_timings, 'check.signIn', start)
+            if session is None:
+                ret = create_admission_failure(sign_in.header, None, '$requireSignIn', True, type_='unauthorized')
+                return None, (ret, 401, {'WWW-Authenticate': 'Bearer'})
+
+            g_values['session'] = session
+
+            # Cached responses are kept for each session
+            if route['cache'] is not None:
+                g_values['session_token_hash'] = hash_session_token(token)
+
+        elif route['requireSignIn'] and not self.sign_in_warned:
+            self.sign_in_warned = True
+            logger.warning('`requireSignIn` of `%s` is not enforced, `create_sign_in()` is not called', req.url_rule)
+
+        # Check body size
+        if max_body_size is not None and req.content_length and req.content_length > max_body_size:
+            ret = create_admission_failure('Content-Length', req.content_length, '$maxBodySize', max_body_size)
+            return None, (ret, 413, None)
+
+        # Check body content type
+        if content_types and has_request_body(req) and req.mimetype not in content_types:
+            ret = create_admission_failure('Content-Type', req.mimetype, '$contentType', content_types)
+            return None, (ret, 415, None)
+
+        # Check headers, URL params and query
+        for category, incomming_data in (('headers', req.headers), ('params', params), ('query', req.args)):
+            if checkers.get(category):
+                start = timer()
+                ret = checkers[category].check(incomming_data)
+                add_route_timing(route_timings, 'check.' + category, start)
+                if not ret.get('isValid'):
+                    # !! Change check failure response here
+                    return None, (ret, 400, None)
+
+        # Check limit and cursor of paged routes
+        if route['paging'] is not None:
+            start = timer()
+            paging, failure = route['paging'].parse(req.args)
+            add_route_timing(route_timings, 'check.paging', start)
+            if failure is not None:
+                return None, (create_admission_failure(*failure), 400, None)
+
+            g_values['paging'] = paging
+
+        return g_values, None
+
+    def create_route(self, config, handler, middlewares=None):
+        # Everything a request needs is compiled once, except the handler chain
+        # (shared by RouteLoader and AsyncRouteLoader, see `compile_route()`).
+
+        # Compile checkers once, requests only run the compiled checkers
+        checkers = compile_route_checkers(config, self.budget)
+
+        # Response cache around the handler, middlewares still run for cached responses
+        response_cache = None
+        if config.get('cache') and config['method'].lower() in CACHEABLE_METHODS:
+            response_cache = ResponseCache(config, self.cache_backend)
+
+        # Data returned by handler is serialized by `responseBody`, and then cached
+        response_body = None
+        if config.get('responseBody'):
+            response_body = ResponseBody(config, self.json_codec, self.response_sample_rate)
+
+        # Rate limit and max concurrent requests, enforced before checks
+        admission = None
+        if config.get('admission'):
+            admission = RouteAdmission(config, self.admission_backend)
+
+        # Keyset pagination, handlers get `g.paging`
+        paging = None
+        if config.get('paging'):
+            paging = RoutePaging(config, self.cursor_codec)
+
+        content_types = config.get('contentType')
+        if content_types and not isinstance(content_types, (tuple, list)):
+            content_types = [content_types]
+
+        route = {
+            'config'       : config,
+            'configMd5'    : get_config_md5(config),
+            'handler'      : handler,
+            'middlewares'  : middlewares,
+            'checkers'     : checkers,
+            'cache'        : response_cache,
+            'responseBody' : response_body,
+            'chain'        : None,
+            'maxBodySize'  : config.get('maxBodySize'),
+            'contentTypes' : content_types,
+            'requireSignIn': config.get('requireSignIn') is True,
+            'paging'       : paging,
+            'admission'    : admission,
+        }
+        return route
+
+    def compile_route(self, config, handler, middlewares=None):
+        # Each request gets the compiled route from `_ROUTES` when started, so that a route can be replaced atomically.
+        route = self.create_route(config, handler, middlewares)
+
+        handler_stage = handler
+        if route['responseBody']:
+            handler_stage = route['responseBody'].wrap(handler_stage)
+        if route['cache']:
+            handler_stage = route['cache'].wrap(handler_stage)
+
+        # Compose global and route middlewares with handler once
+        route['chain'] = compose_middleware_chain(self.middlewares + normalize_middlewares(middlewares), handler_stage, config)
+        return route
+
+    def update_route_config(self, old_config, new_config):
+        # Recompile a registered route with a new config, and replace it without dropping in-flight requests.
+        # Returns `True` when updated, `False` when unchanged, `None` when the route is not found.
+        # Raises `ValueError` when the method or URL is changed, which requires re-registering the route.
+        for route_index, route in enumerate(self._ROUTES):
+            if route['config'] is old_config:
+                break
         else:
-            self.middlewares = []
+            return None
+
+        if 'prefix' in old_config:
+            new_config['prefix'] = old_config['prefix']
+
+        if get_config_md5(new_config) == route['configMd5']:
+            return False
+
+        for k in ('method', 'url'):
+            if new_config.get(k) != old_config.get(k):
+                raise ValueError('Route `{} {}` can not be updated: `{}` is changed'.format(old_config.get('method'), old_config.get('url'), k))
+
+        new_route = self.compile_route(new_config, route['handler'], route['middlewares'])
+
+        # Swap, in-flight requests keep using the old route
+        self._ROUTES[route_index] = new_route
+        self._routes_version += 1
+
+        # Cached responses may not pass the new checkers
+        if route['cache'] is not None:
+            route['cache'].clear()
 
-        self.doc_rule = '/docs'
+        return True
 
     def route(self, flask_app_or_blueprint, config, middlewares=None, **options):
         def decorator(handler):
             if isinstance(flask_app_or_blueprint, Blueprint):
                 config['prefix'] = flask_app_or_blueprint.url_prefix
 
-            self._ROUTES.append({
-                'config'     : config,
-                'middlewares': middlewares,
-            })
+            route_index = len(self._ROUTES)
+            self._ROUTES.append(self.compile_route(config, handler, middlewares))
+            self._routes_version += 1
 
             # Options for original Flask route options
             rule     = config['url']
             endpoint = options.pop('endpoints', None)
             options['methods'] = [config['method']]
 
-            @wraps(handler)
-            def wrapped_handler(*args, **kwargs):
-                # Check query
-                if config.get('query'):
-                    default_required = False
-                    custom_directives = {
-                      '$desc'      : None,
-                      '$name'      : None,
-                      '$type'      : None,
-                      '$example'   : None,
-                    }
-
-                    checker = ObjectChecker(default_required=default_required, custom_directives=custom_directives)
-
-                    incomming_query = request.args
-                    ret = checker.check(incomming_query, config.get('query'))
-                    if not ret.get('isValid'):
+            def handle_request(route, *args, **kwargs):
+                checkers      = route['checkers']
+                chain         = route['chain']
+                max_body_size = route['maxBodySize']
+
+                ### Admission: checks before reading any byte of body ###
+                g_values, failure = self.check_request(route, request, kwargs, g.route_timings)
+                if failure is not None:
+                    abort(self.make_check_failure_response(*failure))
+
+                for k, v in g_values.items():
+                    setattr(g, k, v)
+
+                ### Body ###
+                incomming_body = None
+
+                # Check body while streaming
+                if checkers.get('bodyStream'):
+                    incomming_stream = RecordingStream(request.stream, max_size=max_body_size)
+                    start = timer()
+                    try:
+                        ret, incomming_body = checkers['bodyStream'].check(incomming_stream)
+                    except ValueError as e:
+                        ret = 'Invalid JSON string'
+                    finally:
+                        # Reading, parsing and checking are interleaved
+                        record_timing('body.stream', start)
+
+                    if incomming_stream.too_large:
+                        ret = create_admission_failure('Content-Length', incomming_stream.size, '$maxBodySize', max_body_size)
+                        abort(self.make_check_failure_response(ret, 413))
+
+                    if not isinstance(ret, dict) or not ret.get('isValid'):
                         # !! Change check failure response here
-                        abort(make_response(jsonify(ret), 400))
+                        abort(self.make_check_failure_response(ret, 400))
 
-                # Check body
-                if config.get('body'):
-                    default_required = False
-                    custom_directives = {
-                      '$desc'      : None,
-                      '$name'      : None,
-                      '$example'   : None,
-                    }
+                    # Keep the raw body available for `request.get_data()`
+                    request._cached_data = incomming_stream.get_data()
 
-                    checker = ObjectChecker(default_required=default_required, custom_directives=custom_directives)
+                    if incomming_body is nothing:
+                        incomming_body = None
+
+                # Check body
+                elif checkers.get('body'):
+                    start = timer()
+                    incomming_data = read_request_data(max_body_size)
+                    record_timing('body.read', start)
+                    if incomming_data is None:
+                        ret = create_admission_failure('Content-Length', None, '$maxBodySize', max_body_size)
+                        abort(self.make_check_failure_response(ret, 413))
 
-                    incomming_data = request.get_data(as_text=True)
                     if incomming_data:
+                        start = timer()
                         try:
-                            incomming_body = json.loads(incomming_data)
+                            incomming_body = self.json_codec.loads(incomming_data)
                         except Exception as e:
                             ret = 'Invalid JSON string'
-                            abort(make_response(jsonify(ret), 400))
+                            abort(self.make_check_failure_response(ret, 400))
                         else:
-                            ret = checker.check(incomming_body, config.get('body'))
+                            record_timing('body.parse', start)
+
+                            start = timer()
+                            ret = checkers['body'].check(incomming_body)
+                            record_timing('check.body', start)
                             if not ret.get('isValid'):
                                 # !! Change check failure response here
-                                abort(make_response(jsonify(ret), 400))
+                                abort(self.make_check_failure_response(ret, 400))
+
+                # Limit body size of routes without body checking
+                elif max_body_size is not None and has_request_body():
+                    if read_request_data(max_body_size) is None:
+                        ret = create_admission_failure('Content-Length', None, '$maxBodySize', max_body_size)
+                        abort(self.make_check_failure_response(ret, 413))
+
+                # Parsed and checked payloads for handler
+                g.query = request.args
+                g.body  = incomming_body
+
+                # Run middlewares and handler
+                ret = chain(*args, **kwargs)
+
+                if self.server_timing:
+                    ret = make_response(ret)
+                    ret.headers['Server-Timing'] = create_server_timing(g.route_timings)
+
+                return ret
+
+            def admit_request(route, *args, **kwargs):
+                admission = route['admission']
+                if admission is None:
+                    return handle_request(route, *args, **kwargs)
+
+                # Shed load before reading or checking anything, a slot is held until the handler returns
+                start = timer()
+                slot_id, failure = admission.acquire(request)
+                record_timing('admission', start)
+                if failure is not None:
+                    abort(self.make_check_failure_response(*create_overloaded_failure(failure)))
+
+                try:
+                    return handle_request(route, *args, **kwargs)
+                finally:
+                    admission.release(slot_id)
+
+            def measure_request(route, *args, **kwargs):
+                g.route_timings          = OrderedDict()
+                g.route_check_failure    = None
+                g.route_response_failure = None
+
+                metrics = self.metrics
+                if metrics is None:
+                    return admit_request(route, *args, **kwargs)
+
+                start = timer()
+                status_code = 500
+                try:
+                    ret = make_response(admit_request(route, *args, **kwargs))
+                    status_code = ret.status_code
+                    return ret
+
+                except HTTPException as e:
+                    status_code = e.response.status_code if e.response is not None else e.code
+                    raise
+
+                finally:
+                    record_timing('total', start)
+                    metrics.observe_request(route['config'], g.route_timings, status_code, g.route_check_failure,
+                        g.route_response_failure)
+
+            @wraps(handler)
+            def wrapped_handler(*args, **kwargs):
+                # The same compiled route is used during the whole request
+                route = self._ROUTES[route_index]
 
-                # Run extra checkers
-                if self.middlewares:
-                    for checker in self.middlewares:
-                        checker(config)
+                # Profile the whole request path of sampled or triggered requests
+                profiler = self.profiler
+                if profiler is not None and profiler.should_profile(request.headers):
+                    return profiler.profile(route['config'], measure_request, route, *args, **kwargs)
 
-                # Run handler
-                return handler(*args, **kwargs)
+                return measure_request(route, *args, **kwargs)
+
+            # Routes of this RouteLoader can be called by the batch route
+            wrapped_handler.route_loader = self
 
             return flask_app_or_blueprint.add_url_rule(rule, endpoint, wrapped_handler, **options)
 
         return decorator
 
-    def doc_handler(self):
+    def invalidate_cache(self, config=None):
+        # Clear cached responses of a route, or all routes
+        if config is None:
+            self.cache_backend.clear()
+        else:
+            self.cache_backend.clear(get_route_name(config))
+
+    def get_doc_page_data(self):
         routes = filter(lambda r: r.get('config', {}).get('showInDoc') is True, self._ROUTES)
         page_data = {
             'doc_rule'            : self.doc_rule,
             'routes'              : routes,
+            'lazy'                : self.doc_lazy,
             'isinstance'          : isinstance,
             'list'                : list,
             'tuple'               : tuple,
-            'json'                : json,
-            'flatten_param_config': flatten_param_config,
-            'gen_param_sample'    : gen_param_sample,
+            'json'                : self.json_codec,
+            'flatten_param_config': self.flatten_param_config,
+            'gen_param_sample'    : self.gen_param_sample,
+            'get_paging_query'    : get_paging_query,
+            'get_paging_options'  : get_paging_options,
             'render_md'           : render_md,
             'get_md5'             : get_md5,
+            'static_url'          : lambda filename: url_for('static', filename=filename),
         }
+        return page_data
+
+    def get_doc_routes(self):
+        # API document ID -> Route, the same IDs as in `api_doc.html`
+        doc_routes = OrderedDict()
+
+        routes = filter(lambda r: r.get('config', {}).get('showInDoc') is True, self._ROUTES)
+        for i, route in enumerate(routes):
+            c = route['config']
+            api_doc_id = get_md5('api_doc_{}_{}'.format(c.get('method'), c.get('url')))
+            if api_doc_id not in doc_routes:
+                doc_routes[api_doc_id] = {
+                    'apiId': 'api_{}'.format(i + 1),
+                    'route': route,
+                }
+
+        return doc_routes
+
+    def render_doc(self):
+        page_data = self.get_doc_page_data()
         return render_template('api_doc.html', **page_data)
 
-    def create_doc(self, flask_app_or_blueprint, rule=None):
+    def render_doc_fragment(self, api_doc_id, doc_route):
+        c = doc_route['route']['config']
+
+        page_data = self.get_doc_page_data()
+        page_data.update({
+            'c'         : c,
+            'api_id'    : doc_route['apiId'],
+            'api_doc_id': api_doc_id,
+            'api_url'   : (c.get('prefix') or '') + c.get('url', ''),
+        })
+        return render_template('api_doc_route.html', **page_data)
+
+    def get_doc_cache(self):
+        # Rendered page and fragments of current routes
+        doc_cache = self._doc_cache
+        if doc_cache is None or doc_cache['routesVersion'] != self._routes_version:
+            doc_cache = {
+                'routesVersion'    : self._routes_version,
+                'page'             : None,
+                'routes'           : None,
+                'fragments'        : {},
+                # Fragments of unchanged routes are reused
+                'previousFragments': {},
+            }
+            if self._doc_cache is not None:
+                doc_cache['previousFragments'].update(self._doc_cache['previousFragments'])
+                doc_cache['previousFragments'].update(self._doc_cache['fragments'])
+
+            self._doc_cache = doc_cache
+
+        return doc_cache
+
+    def get_doc_page(self):
+        doc_cache = self.get_doc_cache()
+        if doc_cache['page'] is None:
+            with self._doc_cache_lock:
+                if doc_cache['page'] is None:
+                    etag = get_md5('{}:{}:{}'.format(self.doc_rule, self.doc_lazy, get_routes_md5(self._ROUTES)))
+                    doc_cache['page'] = create_doc_cache_entry(self.render_doc(), etag)
+
+        return doc_cache['page']
+
+    def get_doc_fragment(self, api_doc_id):
+        # Returns `None` when no such route
+        doc_cache = self.get_doc_cache()
+        if api_doc_id not in doc_cache['fragments']:
+            with self._doc_cache_lock:
+                if doc_cache['routes'] is None:
+                    doc_cache['routes'] = self.get_doc_routes()
+
+                doc_route = doc_cache['routes'].get(api_doc_id)
+                if doc_route is None:
+                    return None
+
+                if api_doc_id not in doc_cache['fragments']:
+                    etag = get_md5('{}:{}:{}'.format(self.doc_rule, doc_route['apiId'], get_routes_md5([doc_route['route']])))
+
+                    doc_fragment = doc_cache['previousFragments'].get(api_doc_id)
+                    if doc_fragment is None or doc_fragment['etag'] != etag:
+                        doc_fragment = create_doc_cache_entry(self.render_doc_fragment(api_doc_id, doc_route), etag)
+
+                    doc_cache['fragments'][api_doc_id] = doc_fragment
+
+        return doc_cache['fragments'][api_doc_id]
+
+    def clear_doc_cache(self):
+        self._doc_cache = None
+
+    def make_doc_response(self, doc_cache_entry):
+        if request.accept_encodings['gzip']:
+            response = make_response(doc_cache_entry['gzip'])
+            response.headers['Content-Encoding'] = 'gzip'
+            response.set_etag(doc_cache_entry['etag'] + '-gzip')
+        else:
+            response = make_response(doc_cache_entry['html'])
+            response.set_etag(doc_cache_entry['etag'])
+
+        response.mimetype = 'text/html'
+        response.headers['Vary'] = 'Accept-Encoding'
+        # Always revalidate by ETag
+        response.cache_control.no_cache = True
+
+        return response.make_conditional(request)
+
+    def doc_handler(self):
+        return self.make_doc_response(self.get_doc_page())
+
+    def get_doc_route_data(self, api_doc_id, doc_route):
+        c = doc_route['route']['config']
+        data = {
+            'apiDocId': api_doc_id,
+            'apiId'   : doc_route['apiId'],
+            'name'    : c.get('name'),
+            'method'  : c.get('method'),
+            'url'     : (c.get('prefix') or '') + c.get('url', ''),
+            'config'  : c,
+            'samples' : dict((category, self.gen_param_sample(get_route_param_config(c, category)))
+                for category in ROUTE_CHECKER_CUSTOM_DIRECTIVES if get_route_param_config(c, category)),
+        }
+        return data
+
+    def doc_route_handler(self, api_doc_id):
+        if request.args.get('format') == 'json':
+            doc_route = self.get_doc_routes().get(api_doc_id)
+            if doc_route is None:
+                abort(404)
+
+            return self.make_json_response(self.get_doc_route_data(api_doc_id, doc_route))
+
+        doc_fragment = self.get_doc_fragment(api_doc_id)
+        if doc_fragment is None:
+            abort(404)
+
+        return self.make_doc_response(doc_fragment)
+
+    def create_doc(self, flask_app_or_blueprint, rule=None, lazy=False):
+        # Lazy mode: only names, methods and URLs of routes are rendered in the page,
+        # details of each route are loaded when expanded
         if rule is not None:
             self.doc_rule = rule
 
+        self.doc_lazy    = lazy
+        self.doc_created = True
+
         options = {
             'methods': ['GET']
         }
+        flask_app_or_blueprint.add_url_rule(self.doc_rule + '/routes/<api_doc_id>', None, self.doc_route_handler, **options)
         return flask_app_or_blueprint.add_url_rule(self.doc_rule, None, self.doc_handler, **options)
+
+    def metrics_handler(self):
+        response = make_response(self.metrics.export())
+        response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+        return response
+
+    def create_metrics(self, flask_app_or_blueprint, rule=None, metrics_dir=None, buckets=None):
+        # Export metrics in Prometheus text format.
+        # For multi-process servers (e.g. gunicorn workers), set `metrics_dir` to a directory shared by all processes
+        if rule is not None:
+            self.metrics_rule = rule
+
+        self.metrics = RouteMetrics(metrics_dir=metrics_dir, buckets=buckets)
+
+        options = {
+            'methods': ['GET']
+        }
+        return flask_app_or_blueprint.add_url_rule(self.metrics_rule, None, self.metrics_handler, **options)
+
+    def create_sign_in(self, backend, cache_ttl=None, negative_ttl=None, cache_max_entries=None, header='Authorization', cookie='session'):
+        # Enforce sign-in of routes with `requireSignIn: true`, session data is set to `g.session`.
+        # `backend` is e.g. `SQLiteSessionBackend`, or any object with `get_session(token)` and `delete_session(token)`
+        self.sign_in = SignIn(backend,
+            cache_ttl=cache_ttl,
+            negative_ttl=negative_ttl,
+            cache_max_entries=cache_max_entries,
+            header=header,
+            cookie=cookie)
+
+        return self.sign_in
+
+    def create_batch(self, flask_app_or_blueprint, rule=None, max_items=None, max_concurrency=None, workers=None, middlewares=None):
+        # Batch route running several API calls of this RouteLoader in one request (see `batch.py`).
+        # Up to `max_concurrency` sub-requests of a batch request run at the same time, in a pool of `workers` threads
+        if rule is not None:
+            self.batch_rule = rule
+
+        config = create_batch_config(self.batch_rule, max_items or DEFAULT_BATCH_MAX_ITEMS)
+        self.batch = Batch(self, config, max_concurrency=max_concurrency, workers=workers)
+
+        @self.route(flask_app_or_blueprint, config, middlewares)
+        def batch_handler():
+            return self.batch.handler()
+
+        return self.batch
+
+    def check_profiler_token(self):
+        # Profiles are only available with the trigger token (header or `token` query), not found without a trigger token
+        profiler = self.profiler
+        if not profiler.trigger_token:
+            abort(404)
+
+        if not profiler.is_authorized(request.headers.get(profiler.trigger_header) or request.args.get('token')):
+            abort(403)
+
+    def profiles_handler(self):
+        self.check_profiler_token()
+
+        route_configs = dict((get_profile_name(r['config']), r['config']) for r in self._ROUTES)
+
+        profiles = self.profiler.list_profiles()
+        for p in profiles:
+            c = route_configs.get(p['name']) or {}
+            p.update({
+                'method': c.get('method'),
+                'url'   : (c.get('prefix') or '') + c.get('url', '') if c else None,
+                'link'  : request.path.rstrip('/') + '/' + p['name'],
+            })
+
+        return self.make_json_response({'profiles': profiles})
+
+    def profile_handler(self, name):
+        self.check_profiler_token()
+
+        if request.method == 'DELETE':
+            self.profiler.clear(name)
+            return self.make_json_response({'name': name})
+
+        stats = self.profiler.load_stats(name)
+        if stats is None:
+            abort(404)
+
+        # `?format=text` for the top functions by cumulative time
+        if request.args.get('format') == 'text':
+            sort_key = request.args.get('sort') or 'cumulative'
+            if sort_key not in PROFILE_SORT_KEYS:
+                abort(400)
+
+            response = make_response(self.profiler.format_stats(stats, sort_key))
+            response.mimetype = 'text/plain'
+            return response
+
+        response = make_response(self.profiler.dump_stats(stats))
+        response.mimetype = 'application/octet-stream'
+        response.headers['Content-Disposition'] = 'attachment; filename={}.prof'.format(name)
+        return response
+
+    def create_profiler(self, flask_app_or_blueprint, rule=None, profile_dir='profiles', sample_rate=0.0, trigger_header='X-Profile', trigger_token=None):
+        # Profile `sample_rate` of requests, and requests with `<trigger_header>: <trigger_token>`
+        if rule is not None:
+            self.profiler_rule = rule
+
+        self.profiler = RouteProfiler(profile_dir,
+            sample_rate=sample_rate,
+            trigger_header=trigger_header,
+            trigger_token=trigger_token)
+
+        flask_app_or_blueprint.add_url_rule(self.profiler_rule + '/<name>', None, self.profile_handler, methods=['GET', 'DELETE'])
+        return flask_app_or_blueprint.add_url_rule(self.profiler_rule, None, self.profiles_handler, methods=['GET'])
+
+    def warm_up(self, flask_app, freeze=True):
+        # Do everything lazy in the master process before forking workers (e.g. gunicorn `--preload`),
+        # so that workers share them by copy-on-write instead of creating them in each worker.
+        memory_before = get_memory_usage()
+        start = timer()
+
+        try:
+            import markdown
+        except ImportError:
+            pass
+
+        # Initialize JSON codec
+        self.json_codec.loads(self.json_codec.dumps({'warmUp': [1, 1.5, 'str', True, None]}))
+
+        # Compile URL matcher and templates
+        flask_app.url_map.update()
+        for template_name in flask_app.jinja_env.list_templates():
+            flask_app.jinja_env.get_template(template_name)
+
+        # Render and compress API document page (and fragments in lazy mode)
+        if self.doc_created:
+            with flask_app.test_request_context():
+                self.get_doc_page()
+
+                if self.doc_lazy:
+                    for api_doc_id in self.get_doc_routes():
+                        self.get_doc_fragment(api_doc_id)
+
+        frozen_objects = freeze_gc() if freeze else None
+
+        report = {
+            'elapsed'      : timer() - start,
+            'frozenObjects': frozen_objects,
+            'memoryBefore' : memory_before,
+            'memoryAfter'  : get_memory_usage(),
+        }
+        return report
+
+    def get_memory_report(self):
+        # Call in each worker (e.g. gunicorn `post_worker_init` hook) to see how much memory is shared
+        return get_memory_usage()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+# Route manifest: parsed route file and flattened param configs, cached next to the route file
+# (`route.yaml` -> `route.yaml.manifest`) so that workers do not parse YAML on boot.
+#
+# Usage:
+#   ROUTE_MANIFEST = load_route_manifest(basedir + '/route.yaml')
+#   ROUTE = ROUTE_MANIFEST['routes']
+#   route_loader = RouteLoader(route_manifest=ROUTE_MANIFEST)
+
+import hashlib
+import pickle
+import os
+
+import yaml
+
+from pt_dcxt.routeloader import flatten_param_config, ROUTE_CHECKER_CUSTOM_DIRECTIVES
+
+# Change it when the manifest format is changed
+MANIFEST_VERSION = 1
+
+MANIFEST_FILE_EXT = '.manifest'
+
+# libyaml based loader is much faster than the pure-Python one
+YAMLLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+def is_route_config(obj):
+    return isinstance(obj, dict) and 'method' in obj and 'url' in obj
+
+def iter_route_configs(routes, path=()):
+    # Yields `(path, route config)` of all route configs in the route file
+    if is_route_config(routes):
+        yield path, routes
+        return
+
+    if isinstance(routes, dict):
+        for k, v in routes.items():
+            for x in iter_route_configs(v, path + (k,)):
+                yield x
+
+def get_by_path(routes, path):
+    obj = routes
+    for k in path:
+        obj = obj[k]
+
+    return obj
+
+def build_route_manifest(data, mtime, md5):
+    routes = yaml.load(data, Loader=YAMLLoader)
+
+    flattened_param_configs = []
+    for path, config in iter_route_configs(routes):
+        for category in ROUTE_CHECKER_CUSTOM_DIRECTIVES:
+            if isinstance(config.get(category), dict):
+                flattened_param_configs.append((path + (category,), flatten_param_config(config[category])))
+
+    manifest = {
+        'version'              : MANIFEST_VERSION,
+        'mtime'                : mtime,
+        'md5'                  : md5,
+        'routes'               : routes,
+        'flattenedParamConfigs': flattened_param_configs,
+    }
+    return manifest
+
+def read_manifest_file(manifest_path):
+    # Returns `None` when the manifest file is missing or broken
+    try:
+        with open(manifest_path, 'rb') as _f:
+            manifest = pickle.load(_f)
+    except Exception:
+        return None
+
+    if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+        return None
+
+    return manifest
+
+def write_manifest_file(manifest_path, manifest):
+    tmp_manifest_path = '{}.{}.tmp'.format(manifest_path, os.getpid())
+    try:
+        with open(tmp_manifest_path, 'wb') as _f:
+            pickle.dump(manifest, _f, pickle.HIGHEST_PROTOCOL)
+
+        # Replace atomically, other workers never read a partial file
+        os.rename(tmp_manifest_path, manifest_path)
+
+    except (IOError, OSError):
+        # e.g. read-only file system, the manifest is only a cache
+        if os.path.exists(tmp_manifest_path):
+            os.remove(tmp_manifest_path)
+
+def load_route_manifest(file_path, use_cache=True):
+    # The manifest is valid when the route file has the same md5.
+    # The mtime is not enough, edits within its resolution or files copied with old mtimes keep it
+    manifest_path = file_path + MANIFEST_FILE_EXT
+    mtime = os.path.getmtime(file_path)
+
+    with open(file_path, 'rb') as _f:
+        data = _f.read()
+
+    md5 = hashlib.md5(data).hexdigest()
+
+    manifest = read_manifest_file(manifest_path) if use_cache else None
+    if manifest is not None and manifest['md5'] == md5:
+        if manifest['mtime'] == mtime:
+            return manifest
+
+        manifest['mtime'] = mtime
+    else:
+        manifest = build_route_manifest(data, mtime, md5)
+
+    if use_cache:
+        write_manifest_file(manifest_path, manifest)
+
+    return manifest
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+# Reload the route file without restarting:
+# changed route configs are recompiled and replaced, other routes are not touched.
+#
+# Usage:
+#   ROUTE_MANIFEST = load_route_manifest(basedir + '/route.yaml')
+#   ...register routes...
+#   route_reloader = RouteReloader(route_loader, basedir + '/route.yaml', ROUTE_MANIFEST)
+#   route_reloader.watch()
+
+import threading
+import logging
+import os
+
+from pt_dcxt.routemanifest import load_route_manifest, iter_route_configs
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WATCH_INTERVAL = 2.0
+
+def format_route_path(path):
+    return '.'.join(path)
+
+class RouteReloader(object):
+    def __init__(self, route_loader, file_path, route_manifest=None):
+        super(RouteReloader, self).__init__()
+
+        self.route_loader = route_loader
+        self.file_path    = file_path
+
+        if route_manifest is None:
+            route_manifest = load_route_manifest(file_path)
+
+        self.md5 = route_manifest['md5']
+
+        # Route path (e.g. `myModule.doPost`) -> config in use
+        self.configs = dict(iter_route_configs(route_manifest['routes']))
+
+        self._lock         = threading.Lock()
+        self._watch_thread = None
+        self._stopped      = threading.Event()
+
+    def reload(self):
+        # Returns route paths of each result
+        with self._lock:
+            report = {
+                'updated'        : [],
+                'unchanged'      : [],
+                'restartRequired': [],
+                'added'          : [],
+                'removed'        : [],
+                'notRegistered'  : [],
+            }
+
+            manifest = load_route_manifest(self.file_path)
+            if manifest['md5'] == self.md5:
+                return report
+
+            self.route_loader.add_route_manifest(manifest)
+
+            new_configs = dict(iter_route_configs(manifest['routes']))
+            for path, new_config in new_configs.items():
+                old_config = self.configs.get(path)
+                if old_config is None:
+                    # New routes need handlers
+                    report['added'].append(format_route_path(path))
+                    continue
+
+                try:
+                    updated = self.route_loader.update_route_config(old_config, new_config)
+                except ValueError as e:
+                    logger.warning(e)
+                    report['restartRequired'].append(format_route_path(path))
+                    continue
+
+                if updated is None:
+                    report['notRegistered'].append(format_route_path(path))
+                elif updated:
+                    self.configs[path] = new_config
+                    report['updated'].append(format_route_path(path))
+                else:
+                    report['unchanged'].append(format_route_path(path))
+
+            for path in self.configs:
+                if path not in new_configs:
+                    report['removed'].append(format_route_path(path))
+
+            self.md5 = manifest['md5']
+            return report
+
+    def watch(self, interval=None):
+        # Check the mtime of the route file in a daemon thread
+        if self._watch_thread is not None:
+            return self._watch_thread
+
+        interval = interval or DEFAULT_WATCH_INTERVAL
+
+        def watch_route_file():
+            mtime = os.path.getmtime(self.file_path)
+            while not self._stopped.wait(interval):
+                try:
+                    new_mtime = os.path.getmtime(self.file_path)
+                    if new_mtime == mtime:
+                        continue
+
+                    mtime = new_mtime
+                    report = self.reload()
+                    logger.info('Route file reloaded: %s', report)
+
+                except Exception:
+                    # e.g. YAML syntax error, keep the current routes
+                    logger.exception('Failed to reload route file: %s', self.file_path)
+
+        self._watch_thread = threading.Thread(target=watch_route_file, name='RouteReloader')
+        self._watch_thread.daemon = True
+        self._watch_thread.start()
+        return self._watch_thread
+
+    def stop(self):
+        self._stopped.set()
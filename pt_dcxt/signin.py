@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+# Sign-in enforcement of routes with `requireSignIn: true`.
+# Session tokens are verified by a session backend, and the results (including unknown tokens)
+# are cached in process, so that most authenticated requests do not hit the session store.
+#
+# Usage:
+#   sign_in = route_loader.create_sign_in(SQLiteSessionBackend(basedir + '/sessions.db'))
+#
+#   token = sign_in.backend.create_session({'userId': 1})  # Sign in
+#   sign_in.logout(token)                                  # Sign out
+
+from collections import OrderedDict
+import threading
+import binascii
+import hashlib
+import json
+import time
+import os
+
+from flask import request
+
+from pt_dcxt.common import SQLiteBackend
+
+DEFAULT_SESSION_TTL       = 7 * 24 * 3600
+DEFAULT_CACHE_TTL         = 60
+DEFAULT_NEGATIVE_TTL      = 5
+DEFAULT_CACHE_MAX_ENTRIES = 10000
+
+def gen_session_token():
+    return binascii.hexlify(os.urandom(32)).decode('ascii')
+
+def hash_session_token(token):
+    # Session stores keep hashes only, tokens can not be recovered from them
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+# Session backends:
+#   get_session(token)    -> (session data, expires at) or `None`
+#   delete_session(token) -> Optional, for logout
+class MemorySessionBackend(object):
+    # Sessions in process memory, for development and tests
+    def __init__(self, ttl=None):
+        super(MemorySessionBackend, self).__init__()
+
+        self.ttl = ttl or DEFAULT_SESSION_TTL
+
+        self._lock     = threading.Lock()
+        self._sessions = {}
+
+    def create_session(self, data, ttl=None):
+        token = gen_session_token()
+        with self._lock:
+            self._sessions[hash_session_token(token)] = (data, time.time() + (ttl or self.ttl))
+
+        return token
+
+    def get_session(self, token):
+        with self._lock:
+            session = self._sessions.get(hash_session_token(token))
+
+        if session is None or session[1] <= time.time():
+            return None
+
+        return session
+
+    def delete_session(self, token):
+        with self._lock:
+            self._sessions.pop(hash_session_token(token), None)
+
+class SQLiteSessionBackend(SQLiteBackend):
+    # Sessions shared by processes on the same host, stored in a SQLite file
+    def __init__(self, db_path, ttl=None):
+        super(SQLiteSessionBackend, self).__init__(db_path)
+
+        self.ttl = ttl or DEFAULT_SESSION_TTL
+
+        with self.get_conn() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    token_hash TEXT NOT NULL PRIMARY KEY,
+                    data       TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )''')
+
+    def create_session(self, data, ttl=None):
+        token = gen_session_token()
+        now = time.time()
+        with self.get_conn() as conn:
+            conn.execute('INSERT INTO sessions VALUES (?, ?, ?)', (hash_session_token(token), json.dumps(data), now + (ttl or self.ttl)))
+            conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+
+        return token
+
+    def get_session(self, token):
+        with self.get_conn() as conn:
+            row = conn.execute('SELECT data, expires_at FROM sessions WHERE token_hash = ?', (hash_session_token(token),)).fetchone()
+
+        if row is None or row[1] <= time.time():
+            return None
+
+        return json.loads(row[0]), row[1]
+
+    def delete_session(self, token):
+        with self.get_conn() as conn:
+            conn.execute('DELETE FROM sessions WHERE token_hash = ?', (hash_session_token(token),))
+
+class SessionCache(object):
+    # In-process LRU cache of verified tokens with TTL.
+    # Unknown tokens are cached too (negative caching), so that invalid tokens do not hit the backend every time.
+    def __init__(self, ttl=None, negative_ttl=None, max_entries=None):
+        super(SessionCache, self).__init__()
+
+        self.ttl          = DEFAULT_CACHE_TTL if ttl is None else ttl
+        self.negative_ttl = DEFAULT_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+        self.max_entries  = max_entries or DEFAULT_CACHE_MAX_ENTRIES
+
+        self._lock = threading.Lock()
+
+        # Token -> (expires at, session data or `None`)
+        self._entries = OrderedDict()
+
+    def get(self, token):
+        # Returns (hit, session data)
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return False, None
+
+            if entry[0] <= time.time():
+                del self._entries[token]
+                return False, None
+
+            # Most recently used at the end
+            self._entries.move_to_end(token)
+            return True, entry[1]
+
+    def set(self, token, data, expires_at=None):
+        now = time.time()
+        if data is None:
+            cache_expires_at = now + self.negative_ttl
+        else:
+            # Never longer than the session
+            cache_expires_at = now + self.ttl
+            if expires_at is not None:
+                cache_expires_at = min(cache_expires_at, expires_at)
+
+        with self._lock:
+            self._entries.pop(token, None)
+            self._entries[token] = (cache_expires_at, data)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class SignIn(object):
+    # Tokens are read from `Authorization: Bearer <token>` (or the raw value of another header), then the cookie
+    def __init__(self, backend, cache_ttl=None, negative_ttl=None, cache_max_entries=None, header='Authorization', cookie='session'):
+        super(SignIn, self).__init__()
+
+        self.backend = backend
+        self.header  = header
+        self.cookie  = cookie
+
+        self.cache = SessionCache(ttl=cache_ttl, negative_ttl=negative_ttl, max_entries=cache_max_entries)
+
+    def get_token(self, req=None):
+        # `req` is the Flask request by default, or e.g. the Quart request
+        if req is None:
+            req = request
+
+        value = req.headers.get(self.header)
+        if value:
+            if self.header.lower() != 'authorization':
+                return value
+
+            scheme, _, token = value.partition(' ')
+            if scheme.lower() == 'bearer' and token.strip():
+                return token.strip()
+
+        if self.cookie:
+            return req.cookies.get(self.cookie) or None
+
+        return None
+
+    def verify(self, token):
+        # Returns session data, or `None` when not signed in
+        if not token:
+            return None
+
+        hit, data = self.cache.get(token)
+        if hit:
+            return data
+
+        session = self.backend.get_session(token)
+        if session is None:
+            self.cache.set(token, None)
+            return None
+
+        data, expires_at = session
+        self.cache.set(token, data, expires_at)
+        return data
+
+    async def verify_async(self, token, call):
+        # The same as `verify()`, for AsyncRouteLoader: cache misses go to the backend by `await call(func, *args)`
+        if not token:
+            return None
+
+        hit, data = self.cache.get(token)
+        if hit:
+            return data
+
+        return await call(self.verify, token)
+
+    def logout(self, token=None):
+        # Other processes keep the cached session until `cache_ttl` is over
+        token = token or self.get_token()
+        if not token:
+            return
+
+        delete_session = getattr(self.backend, 'delete_session', None)
+        if delete_session is not None:
+            delete_session(token)
+
+        self.cache.invalidate(token)
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+
+from decimal import Decimal
+import json
+
+try:
+    # ijson is optional, streaming body checking falls back to buffered parsing without it
+    import ijson
+except ImportError:
+    ijson = None
+
+from pt_dcxt.objectchecker import DIRECTIVES, NO_OP_DIRECTIVES, TYPE_CHECK_CLASSES, SIZED_TYPES, ObjectCheckerException, \
+    ValidationBudget, create_check_result, nothing
+
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# `maxDepth` of streamed bodies without one in the validation budget.
+# Deeper bodies can not be handled by recursive code later (e.g. `json.dumps()` in handlers)
+STREAM_MAX_DEPTH = 512
+
+class RecordingStream(object):
+    # Keep the read chunks, so that the raw body is still available after streaming.
+    # When `max_size` is set, reading stops (as EOF) once the body is over the size
+    # and `too_large` is set to True.
+    def __init__(self, stream, max_size=None):
+        super(RecordingStream, self).__init__()
+
+        self.stream    = stream
+        self.chunks    = []
+        self.max_size  = max_size
+        self.size      = 0
+        self.too_large = False
+
+    def read(self, size=-1):
+        # Parsers may call `read(0)`, which is not passed to the request stream (werkzeug raises `ClientDisconnected` on it)
+        if self.too_large or size == 0:
+            return b''
+
+        if self.max_size is not None:
+            remaining = self.max_size + 1 - self.size
+            if size is None or size < 0 or size > remaining:
+                size = remaining
+
+        chunk = self.stream.read(size)
+        if chunk:
+            self.size += len(chunk)
+            if self.max_size is not None and self.size > self.max_size:
+                self.too_large = True
+                return b''
+
+            self.chunks.append(chunk)
+
+        return chunk
+
+    def get_data(self):
+        return b''.join(self.chunks)
+
+class ChainedStream(object):
+    def __init__(self, first_chunk, stream):
+        super(ChainedStream, self).__init__()
+
+        self.first_chunk = first_chunk
+        self.stream      = stream
+
+    def read(self, size=-1):
+        if size == 0:
+            return b''
+
+        if self.first_chunk:
+            chunk, self.first_chunk = self.first_chunk, None
+            return chunk
+
+        return self.stream.read(size)
+
+def compile_stream_node(options, custom_directives):
+    # Only the checks which can be decided before a value is fully parsed are compiled here,
+    # the others are left to the compiled checker running after parsing.
+    options = options or {}
+    if not isinstance(options, dict):
+        return None
+
+    obj_type = options.get('$type', '').lower()
+    if options.get('$skip') is True or obj_type in ('any', '*'):
+        return None
+
+    def is_builtin(key):
+        return key in options and key in DIRECTIVES and key not in custom_directives
+
+    node = {
+        'allowNull'      : options.get('$allowNull') is True,
+        'typeClasses'    : None,
+        'typeOption'     : options.get('$type'),
+        'maxLength'      : None,
+        'maxLengthKey'   : None,
+        'checkUnexpected': obj_type not in ('json', 'obj', 'object'),
+        'optionKeys'     : frozenset(options.keys()),
+        'fields'         : {},
+        'element'        : None,
+        'isArray'        : '$' in options,
+        'arrayOption'    : options.get('$'),
+    }
+
+    if is_builtin('$type'):
+        node['typeClasses'] = TYPE_CHECK_CLASSES.get(obj_type)
+
+    for length_key in ('$maxLength', '$isLength'):
+        if is_builtin(length_key):
+            node['maxLength']    = options[length_key]
+            node['maxLengthKey'] = length_key
+            break
+
+    for option_key, option in options.items():
+        if option_key in DIRECTIVES or option_key in custom_directives or option_key in NO_OP_DIRECTIVES:
+            continue
+
+        elif option_key == '$':
+            node['element'] = compile_stream_node(option, custom_directives)
+
+        else:
+            node['fields'][option_key] = compile_stream_node(option, custom_directives)
+
+    return node
+
+class StreamChecker(object):
+    # Parse JSON body event by event, and reject it as soon as
+    # an unexpected key, a bad type or an over-length array/string is seen.
+    # The fully parsed body is checked by the compiled checker at the end.
+    def __init__(self, compiled_checker, chunk_size=None):
+        super(StreamChecker, self).__init__()
+
+        self.compiled_checker = compiled_checker
+        self.message_template = compiled_checker.message_template
+        self.chunk_size       = chunk_size or STREAM_CHUNK_SIZE
+
+        self.root = compile_stream_node(compiled_checker.options, compiled_checker.checker.custom_directives)
+
+        # Budget is checked event by event, instead of walking the parsed body again.
+        # Nesting is always limited, by `STREAM_MAX_DEPTH` unless the budget has `maxDepth`
+        budget = compiled_checker.budget
+        if budget is None or budget.options['$maxDepth'] is None:
+            budget_options = budget.options if budget is not None else {}
+            budget = ValidationBudget(
+                max_depth=STREAM_MAX_DEPTH,
+                max_nodes=budget_options.get('$maxNodes'),
+                max_array_length=budget_options.get('$maxArrayLength'),
+                max_string_length=budget_options.get('$maxStringLength'))
+
+        self.budget = budget
+
+    def raise_invalid(self, node, obj_name, obj, checker_name):
+        if checker_name == '$type':
+            checker_option = node['typeOption']
+        elif checker_name == '$':
+            checker_option = node['arrayOption']
+        else:
+            checker_option = node['maxLength']
+
+        raise ObjectCheckerException(
+            type_='invalid',
+            field_name=obj_name,
+            field_value=obj,
+            checker_name=checker_name,
+            checker_option=checker_option)
+
+    def check_value(self, node, obj_name, obj):
+        if node is None:
+            return
+
+        if obj is None and node['allowNull']:
+            return
+
+        type_classes = node['typeClasses']
+        if type_classes is not None and not isinstance(obj, type_classes):
+            self.raise_invalid(node, obj_name, obj, '$type')
+
+        if node['isArray'] and not isinstance(obj, list):
+            self.raise_invalid(node, obj_name, obj, '$')
+
+        if node['maxLength'] is not None and isinstance(obj, SIZED_TYPES) and len(obj) > node['maxLength']:
+            self.raise_invalid(node, obj_name, obj, node['maxLengthKey'])
+
+    def parse(self, stream):
+        # Frame: [container, node, obj_name, current_key]
+        frames = []
+        try:
+            return self.parse_events(stream, frames)
+
+        except ObjectCheckerException:
+            raise
+
+        except Exception as e:
+            # Parsers with a nesting limit fail on deeper bodies, which are over budget rather than invalid
+            if len(frames) >= self.budget.max_depth:
+                self.budget.raise_over_budget('$maxDepth', frames[-1][2])
+
+            raise ValueError(str(e))
+
+    def parse_events(self, stream, frames):
+        root = nothing
+
+        budget = self.budget
+        nodes  = 0
+
+        # `basic_parse()`, prefixes of events are not used (and grow with nesting).
+        # Not `use_float=True`, the C backend fails on integers over 64 bits with it.
+        # Non-integers are `Decimal`, converted to float the same as `json.loads()`
+        for event, value in ijson.basic_parse(stream, buf_size=self.chunk_size):
+            if event == 'number' and type(value) is Decimal:
+                value = float(value)
+
+            elif event == 'map_key':
+                frame = frames[-1]
+                frame[3] = value
+
+                node = frame[1]
+                if node is not None and node['checkUnexpected'] and value not in node['optionKeys']:
+                    raise ObjectCheckerException(
+                        type_='unexpected',
+                        field_name=value)
+
+                continue
+
+            if event in ('end_map', 'end_array'):
+                frames.pop()
+                continue
+
+            # Locate the node of the incoming value
+            if not frames:
+                node, obj_name = self.root, 'obj'
+
+            else:
+                container, parent_node, parent_name, current_key = frames[-1]
+                if isinstance(container, list):
+                    obj_name = '{}[{}]'.format(parent_name, len(container))
+                    node = parent_node['element'] if parent_node is not None else None
+
+                    # Array grows over the limit
+                    if parent_node is not None \
+                            and parent_node['maxLength'] is not None \
+                            and len(container) >= parent_node['maxLength']:
+                        self.raise_invalid(parent_node, parent_name, container, parent_node['maxLengthKey'])
+
+                else:
+                    obj_name = current_key
+                    node = parent_node['fields'].get(current_key) if parent_node is not None else None
+
+            if event == 'start_map':
+                obj = {}
+            elif event == 'start_array':
+                obj = []
+            else:
+                obj = value
+
+            nodes += 1
+            if nodes > budget.max_nodes:
+                budget.raise_over_budget('$maxNodes', obj_name)
+
+            if event in ('start_map', 'start_array'):
+                if len(frames) + 1 > budget.max_depth:
+                    budget.raise_over_budget('$maxDepth', obj_name)
+            elif isinstance(obj, str) and len(obj) > budget.max_string_length:
+                budget.raise_over_budget('$maxStringLength', obj_name)
+
+            if frames and isinstance(frames[-1][0], list) and len(frames[-1][0]) >= budget.max_array_length:
+                budget.raise_over_budget('$maxArrayLength', frames[-1][2])
+
+            self.check_value(node, obj_name, obj)
+
+            if frames:
+                container, current_key = frames[-1][0], frames[-1][3]
+                if isinstance(container, list):
+                    container.append(obj)
+                else:
+                    container[current_key] = obj
+            else:
+                root = obj
+
+            if event in ('start_map', 'start_array'):
+                frames.append([obj, node, obj_name, None])
+
+        return root
+
+    def load(self, stream):
+        # Returns `nothing` for empty body,
+        # raises `ValueError` for invalid JSON and `ObjectCheckerException` for invalid body.
+        first_chunk = stream.read(self.chunk_size)
+        if not first_chunk:
+            return nothing
+
+        if ijson is None:
+            try:
+                obj = json.loads(first_chunk + stream.read())
+            except RecursionError:
+                self.budget.raise_over_budget('$maxDepth', 'obj')
+
+        else:
+            obj = self.parse(ChainedStream(first_chunk, stream))
+
+        # Budget is checked when parsing, unless parsed without ijson
+        self.compiled_checker.verify(obj, 'obj', check_budget=ijson is None)
+        return obj
+
+    def check(self, stream):
+        try:
+            obj = self.load(stream)
+
+        except ObjectCheckerException as error:
+            return create_check_result(error, self.message_template), nothing
+
+        return create_check_result(None, self.message_template), obj
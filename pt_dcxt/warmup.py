@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import gc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Fields of `/proc/self/smaps_rollup` (kB)
+SMAPS_ROLLUP_FIELDS = {
+    'Rss'          : 'rss',
+    'Pss'          : 'pss',
+    'Shared_Clean' : 'shared',
+    'Shared_Dirty' : 'shared',
+    'Private_Clean': 'private',
+    'Private_Dirty': 'private',
+}
+
+def read_smaps_rollup():
+    # Linux 4.14+
+    usage = {}
+    with open('/proc/self/smaps_rollup') as _f:
+        for line in _f:
+            parts = line.split()
+            key = SMAPS_ROLLUP_FIELDS.get(parts[0].rstrip(':'))
+            if key is not None:
+                usage[key] = usage.get(key, 0) + int(parts[1])
+
+    return usage
+
+def read_proc_status():
+    with open('/proc/self/status') as _f:
+        for line in _f:
+            if line.startswith('VmRSS:'):
+                return {'rss': int(line.split()[1])}
+
+    return {}
+
+def get_memory_usage():
+    # Memory usage of current process in kB.
+    # `shared` pages of pre-forked workers are not copied until written (copy-on-write),
+    # `pss` counts shared pages proportionally among processes sharing them.
+    usage = {
+        'rss'    : None,
+        'pss'    : None,
+        'shared' : None,
+        'private': None,
+    }
+
+    for reader in (read_smaps_rollup, read_proc_status):
+        try:
+            usage.update(reader())
+            return usage
+        except (IOError, OSError, ValueError, IndexError):
+            continue
+
+    if resource is not None:
+        # Peak RSS only, in kB on Linux
+        usage['rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return usage
+
+def freeze_gc():
+    # Move all objects to the permanent generation, so that GC in forked workers
+    # does not write to them and copy the pages shared with the master process.
+    # Returns the number of frozen objects, or `None` before Python 3.7
+    gc.collect()
+
+    if not hasattr(gc, 'freeze'):
+        return None
+
+    gc.freeze()
+    return gc.get_freeze_count()
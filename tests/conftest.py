@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+import pytest
+
+# `pt_dcxt` is not installed, tests run from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def make_app():
+    # Returns a function making a Flask app and a RouteLoader with options, routes are added by each test
+    from flask import Flask
+    from pt_dcxt.routeloader import RouteLoader
+
+    def make_app(**options):
+        return Flask('pt_dcxt.routeloader'), RouteLoader(**options)
+
+    return make_app
+
+@pytest.fixture
+def make_async_app():
+    # The same as `make_app`, with a Quart app and an AsyncRouteLoader, skipped without Quart
+    quart = pytest.importorskip('quart')
+    from pt_dcxt.asyncrouteloader import AsyncRouteLoader
+
+    def make_async_app(**options):
+        return quart.Quart('pt_dcxt.routeloader'), AsyncRouteLoader(**options)
+
+    return make_async_app
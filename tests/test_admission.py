@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import sqlite3
+import time
+
+import pytest
+
+from pt_dcxt.admission import MemoryAdmissionBackend, SQLiteAdmissionBackend
+
+@pytest.fixture
+def create_app(make_app):
+    return lambda backend, state: create_admission_app(make_app, backend, state)
+
+def create_admission_app(make_app, backend, state):
+    app, route_loader = make_app(admission_backend=backend)
+    lock = threading.Lock()
+
+    @route_loader.route(app, {'method': 'get', 'url': '/slow', 'admission': {'maxConcurrent': 2, 'queueTimeout': 150}})
+    def slow():
+        with lock:
+            state['current'] += 1
+            state['max'] = max(state['max'], state['current'])
+
+        time.sleep(0.1)
+
+        with lock:
+            state['current'] -= 1
+
+        return 'ok'
+
+    @route_loader.route(app, {'method': 'get', 'url': '/rate', 'admission': {'rate': 5, 'burst': 3, 'clientKey': 'header:X-User'}})
+    def rate():
+        return 'ok'
+
+    return app
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmpdir):
+    if request.param == 'memory':
+        return MemoryAdmissionBackend()
+
+    return SQLiteAdmissionBackend(str(tmpdir.join('admission.db')))
+
+def test_rate(create_app, backend):
+    client = create_app(backend, {}).test_client()
+
+    status_codes = [client.get('/rate', headers={'X-User': 'a'}).status_code for _ in range(3)]
+    assert status_codes == [200, 200, 200]
+
+    response = client.get('/rate', headers={'X-User': 'a'})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+    assert response.json['detail']['fieldName'] == 'GET /rate'
+    assert response.json['detail']['checkerName'] == '$rate'
+
+    # Other clients
+    assert client.get('/rate', headers={'X-User': 'b'}).status_code == 200
+
+def test_max_concurrent(create_app, backend):
+    state = {'current': 0, 'max': 0}
+    app = create_app(backend, state)
+
+    status_codes = []
+    def request():
+        status_codes.append(app.test_client().get('/slow').status_code)
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert state['max'] <= 2
+    assert status_codes.count(200) >= 2
+    assert set(status_codes) <= set([200, 503])
+
+def test_queued_in_proxy(create_app, backend):
+    client = create_app(backend, {'current': 0, 'max': 0}).test_client()
+
+    response = client.get('/slow', headers={'X-Request-Start': 't={:.3f}'.format(time.time() - 1)})
+    assert response.status_code == 503
+    assert response.json['detail']['checkerName'] == '$queueTimeout'
+
+def test_sqlite_full_route_without_write_lock(tmpdir):
+    db_path = str(tmpdir.join('admission.db'))
+    backend = SQLiteAdmissionBackend(db_path)
+    slot_id = backend.acquire_slot('GET /slow', 1)
+    assert slot_id is not None
+
+    # Another process holds the write lock, polling a full route does not wait for it
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        start = time.time()
+        assert backend.acquire_slot('GET /slow', 1) is None
+        assert time.time() - start < 1
+    finally:
+        conn.execute('ROLLBACK')
+
+    backend.release_slot('GET /slow', slot_id)
+    assert backend.acquire_slot('GET /slow', 1) is not None
+
+def test_sqlite_lease_renewed(tmpdir):
+    db_path = str(tmpdir.join('admission.db'))
+    backend = SQLiteAdmissionBackend(db_path)
+
+    slot_id = backend.acquire_slot('GET /slow', 1, lease_time=0.3)
+    time.sleep(1)
+
+    # Still held by the in-flight request
+    assert SQLiteAdmissionBackend(db_path).acquire_slot('GET /slow', 1, lease_time=0.3) is None
+
+    backend.release_slot('GET /slow', slot_id)
+    assert SQLiteAdmissionBackend(db_path).acquire_slot('GET /slow', 1, lease_time=0.3) is not None
+
+def test_sqlite_lease_of_crashed_process(tmpdir):
+    db_path = str(tmpdir.join('admission.db'))
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    SQLiteAdmissionBackend(db_path)
+    conn.execute("INSERT INTO admission_slots VALUES ('GET /slow', 'crashed', ?)", (time.time() + 0.2,))
+
+    backend = SQLiteAdmissionBackend(db_path)
+    assert backend.acquire_slot('GET /slow', 1) is None
+    time.sleep(0.3)
+    assert backend.acquire_slot('GET /slow', 1) is not None
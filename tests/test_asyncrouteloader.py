@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import asyncio
+import json
+import time
+
+import pytest
+
+quart = pytest.importorskip('quart')
+
+from pt_dcxt.signin import MemorySessionBackend, SQLiteSessionBackend
+from pt_dcxt.responsecache import SQLiteCacheBackend
+from pt_dcxt.admission import SQLiteAdmissionBackend
+
+# Threads calling the SQLite backends
+backend_threads = []
+
+class RecordingSessionBackend(SQLiteSessionBackend):
+    def get_session(self, token):
+        backend_threads.append(threading.get_ident())
+        return super(RecordingSessionBackend, self).get_session(token)
+
+class RecordingCacheBackend(SQLiteCacheBackend):
+    def get(self, *args):
+        backend_threads.append(threading.get_ident())
+        return super(RecordingCacheBackend, self).get(*args)
+
+    def set(self, *args):
+        backend_threads.append(threading.get_ident())
+        return super(RecordingCacheBackend, self).set(*args)
+
+class RecordingAdmissionBackend(SQLiteAdmissionBackend):
+    def acquire_slot(self, *args):
+        backend_threads.append(threading.get_ident())
+        return super(RecordingAdmissionBackend, self).acquire_slot(*args)
+
+    def release_slot(self, *args):
+        backend_threads.append(threading.get_ident())
+        return super(RecordingAdmissionBackend, self).release_slot(*args)
+
+    def take_token(self, *args):
+        backend_threads.append(threading.get_ident())
+        return super(RecordingAdmissionBackend, self).take_token(*args)
+
+@pytest.fixture
+def create_app(make_async_app):
+    return lambda **options: create_async_app(make_async_app, **options)
+
+def create_async_app(make_async_app, **options):
+    app, route_loader = make_async_app(response_sample_rate=1.0, **options)
+    state = {'calls': 0}
+
+    @route_loader.route(app, {'method': 'post', 'url': '/cart', 'body': {'dishId': {'$type': 'int', '$isRequired': True}}})
+    async def cart():
+        return quart.jsonify({'dishId': quart.g.body['dishId']})
+
+    @route_loader.route(app, {'method': 'get', 'url': '/me', 'requireSignIn': True, 'cache': {'ttl': 60}})
+    async def me():
+        state['calls'] += 1
+        return quart.jsonify({'session': quart.g.session, 'calls': state['calls']})
+
+    @route_loader.route(app, {'method': 'get', 'url': '/dish', 'responseBody': {'id': {'$type': 'int'}, 'name': {'$type': 'string'}}})
+    def dish():
+        # Sync handler
+        return {'id': 'x', 'name': 'Noodles', 'secret': 1}
+
+    @route_loader.route(app, {'method': 'get', 'url': '/slow', 'admission': {'maxConcurrent': 1, 'queueTimeout': 100}})
+    async def slow():
+        await asyncio.sleep(0.3)
+        return 'slow'
+
+    @route_loader.route(app, {'method': 'get', 'url': '/rate', 'admission': {'rate': 1, 'burst': 1}})
+    async def rate():
+        return 'rate'
+
+    route_loader.create_metrics(app)
+    return app, route_loader
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_checks(create_app):
+    app, _ = create_app()
+
+    async def main():
+        client = app.test_client()
+
+        response = await client.post('/cart', json={'dishId': 7})
+        assert response.status_code == 200
+        assert await response.get_json() == {'dishId': 7}
+
+        response = await client.post('/cart', json={'dishId': 'x'})
+        assert response.status_code == 400
+        assert (await response.get_json())['detail']['fieldName'] == 'dishId'
+
+    run(main())
+
+def test_sign_in_and_cache(create_app):
+    app, route_loader = create_app()
+    backend = MemorySessionBackend()
+    route_loader.create_sign_in(backend)
+    token_a = backend.create_session({'userId': 1})
+    token_b = backend.create_session({'userId': 2})
+
+    async def main():
+        client = app.test_client()
+
+        response = await client.get('/me')
+        assert response.status_code == 401
+        assert response.headers['WWW-Authenticate'] == 'Bearer'
+
+        response = await client.get('/me', headers={'Authorization': 'Bearer ' + token_a})
+        assert response.headers['X-Cache'] == 'MISS'
+        assert (await response.get_json())['session'] == {'userId': 1}
+
+        response = await client.get('/me', headers={'Authorization': 'Bearer ' + token_b})
+        assert response.headers['X-Cache'] == 'MISS'
+        assert (await response.get_json())['session'] == {'userId': 2}
+
+        response = await client.get('/me', headers={'Authorization': 'Bearer ' + token_a})
+        assert response.headers['X-Cache'] == 'HIT'
+        assert await response.get_json() == {'session': {'userId': 1}, 'calls': 1}
+
+    run(main())
+
+def test_response_body(create_app):
+    app, _ = create_app()
+
+    async def main():
+        client = app.test_client()
+
+        response = await client.get('/dish')
+        assert response.status_code == 200
+        assert json.loads(await response.get_data()) == {'id': 'x', 'name': 'Noodles'}
+
+        metrics = await (await client.get('/metrics')).get_data(as_text=True)
+        assert 'routeloader_response_violations_total{route="/dish",method="GET",type="invalid",checker="$type"} 1' in metrics
+
+    run(main())
+
+def test_admission(create_app):
+    app, _ = create_app()
+
+    async def main():
+        client = app.test_client()
+
+        # The event loop is not blocked while waiting for a slot
+        start = time.time()
+        responses = await asyncio.gather(*[client.get('/slow') for _ in range(3)])
+        assert sorted(r.status_code for r in responses) == [200, 503, 503]
+        assert time.time() - start < 0.6
+
+        assert (await client.get('/rate')).status_code == 200
+        response = await client.get('/rate')
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == '1'
+
+    run(main())
+
+@pytest.mark.parametrize('offload_body_size', [None, 0])
+@pytest.mark.parametrize('data', [b'{"dishId": ', b'\xff', b'[' * 100000])
+def test_invalid_json(create_app, offload_body_size, data):
+    app, _ = create_app(offload_body_size=offload_body_size)
+
+    async def main():
+        client = app.test_client()
+
+        response = await client.post('/cart', data=data, headers={'Content-Type': 'application/json'})
+        assert response.status_code == 400
+        assert await response.get_json() == 'Invalid JSON string'
+
+    run(main())
+
+def test_blocking_backends(create_app, tmpdir):
+    app, route_loader = create_app(
+        cache_backend=RecordingCacheBackend(str(tmpdir.join('cache.db'))),
+        admission_backend=RecordingAdmissionBackend(str(tmpdir.join('admission.db'))))
+    backend = RecordingSessionBackend(str(tmpdir.join('sessions.db')))
+    route_loader.create_sign_in(backend)
+    token = backend.create_session({'userId': 1})
+
+    async def main():
+        client = app.test_client()
+        del backend_threads[:]
+
+        for x_cache in ('MISS', 'HIT'):
+            response = await client.get('/me', headers={'Authorization': 'Bearer ' + token})
+            assert response.headers['X-Cache'] == x_cache
+            assert (await response.get_json())['session'] == {'userId': 1}
+
+        assert (await client.get('/slow')).status_code == 200
+        assert (await client.get('/rate')).status_code == 200
+
+        # Session (once, then cached), cache get and set, cache get, slot acquire and release, token bucket
+        assert len(backend_threads) == 7
+        assert threading.get_ident() not in backend_threads
+
+    run(main())
+
+def test_unsupported(create_app):
+    app, route_loader = create_app()
+
+    with pytest.raises(NotImplementedError):
+        route_loader.create_batch(app)
+    with pytest.raises(NotImplementedError):
+        route_loader.create_profiler(app)
+    with pytest.raises(NotImplementedError):
+        route_loader.warm_up(app)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+import pytest
+from flask import jsonify, g
+
+@pytest.fixture
+def create_app(make_app):
+    return lambda max_concurrency: create_batch_app(make_app, max_concurrency)
+
+def create_batch_app(make_app, max_concurrency):
+    app, route_loader = make_app()
+
+    @route_loader.route(app, {'method': 'get', 'url': '/menu', 'query': {'canteenId': {'$type': 'enum', '$in': ['1', '2']}}})
+    def menu():
+        return jsonify({'canteenId': g.query['canteenId']})
+
+    @route_loader.route(app, {'method': 'post', 'url': '/cart', 'body': {'dishId': {'$type': 'int'}}})
+    def cart():
+        return jsonify({'dishId': g.body['dishId']})
+
+    @route_loader.route(app, {'method': 'get', 'url': '/g'})
+    def get_g():
+        # `g` of a sub-request is not the one of the batch request, or of other sub-requests
+        seen = getattr(g, 'seen', None)
+        g.seen = True
+        return jsonify({'seen': seen, 'thread': threading.current_thread().name})
+
+    @route_loader.route(app, {'method': 'get', 'url': '/slow'})
+    def slow():
+        time.sleep(0.1)
+        return 'slow'
+
+    @app.route('/plain')
+    def plain():
+        return 'plain'
+
+    route_loader.create_batch(app, '/batch', max_items=6, max_concurrency=max_concurrency)
+    return app
+
+def batch(client, requests):
+    response = client.post('/batch', json={'requests': requests})
+    assert response.status_code == 200
+    return response.json['results']
+
+@pytest.mark.parametrize('max_concurrency', [1, 3])
+def test_batch(create_app, max_concurrency):
+    client = create_app(max_concurrency).test_client()
+
+    results = batch(client, [
+        {'method': 'get' , 'url': '/menu', 'query': {'canteenId': '1'}},
+        {'method': 'GET' , 'url': '/menu?canteenId=2'},
+        {'method': 'POST', 'url': '/cart', 'body': {'dishId': 7}},
+        {'method': 'post', 'url': '/cart', 'body': {'dishId': 'x'}},
+    ])
+    assert [r['status'] for r in results] == [200, 200, 200, 400]
+    assert results[0]['body'] == {'canteenId': '1'}
+    assert results[1]['body'] == {'canteenId': '2'}
+    assert results[2]['body'] == {'dishId': 7}
+    assert results[3]['body']['detail']['fieldName'] == 'dishId'
+
+@pytest.mark.parametrize('max_concurrency', [1, 3])
+def test_g_not_shared(create_app, max_concurrency):
+    client = create_app(max_concurrency).test_client()
+
+    results = batch(client, [{'method': 'get', 'url': '/g'}] * 3)
+    assert [r['body']['seen'] for r in results] == [None, None, None]
+
+    # A single sub-request runs in the batch request thread
+    results = batch(client, [{'method': 'get', 'url': '/g'}])
+    assert results[0]['body']['seen'] is None
+
+def test_concurrency(create_app):
+    client = create_app(3).test_client()
+
+    start = time.time()
+    results = batch(client, [{'method': 'get', 'url': '/slow'}] * 6)
+    assert time.time() - start < 0.5
+    assert [r['body'] for r in results] == ['slow'] * 6
+
+def test_error_results(create_app):
+    client = create_app(3).test_client()
+
+    results = batch(client, [
+        {'method': 'get' , 'url': '/batch'},
+        {'method': 'post', 'url': '/batch', 'body': {'requests': [{'method': 'get', 'url': '/menu'}]}},
+        {'method': 'get' , 'url': '/plain'},
+        {'method': 'get' , 'url': '/nope'},
+        {'method': 'post', 'url': '/menu'},
+        {'method': 'get' , 'url': 'http://example.com/menu'},
+    ])
+    assert [r['status'] for r in results] == [405, 404, 404, 404, 405, 400]
+
+def test_invalid_batch(create_app):
+    client = create_app(3).test_client()
+
+    assert client.post('/batch', json={'requests': [{'method': 'patch', 'url': '/menu'}]}).status_code == 400
+    assert client.post('/batch', json={'requests': [{'method': 'get', 'url': '/menu'}] * 7}).status_code == 400
+    assert client.post('/batch', json={'requests': []}).status_code == 400
+
+@pytest.mark.parametrize('data', [None, b'{}'])
+def test_missing_requests(create_app, data):
+    client = create_app(3).test_client()
+
+    response = client.post('/batch', data=data, content_type='application/json')
+    assert response.status_code == 400
+    assert response.json['detail']['type'] == 'missing'
+    assert response.json['detail']['fieldName'] == 'requests'
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+
+import pytest
+from flask import jsonify
+
+from pt_dcxt.routeloader import get_md5
+
+MENU_CONFIG = {
+    'showInDoc': True,
+    'name'     : 'Menu',
+    'method'   : 'get',
+    'url'      : '/menu',
+    'query': {
+        'canteenId': {'$type': 'string', '$desc': 'Canteen ID'},
+    },
+}
+
+CART_CONFIG = {
+    'showInDoc': True,
+    'name'     : 'Cart',
+    'method'   : 'post',
+    'url'      : '/cart',
+    'body': {
+        'dishId': {'$type': 'int', '$desc': 'Dish ID'},
+    },
+}
+
+MENU_DOC_ID = get_md5('api_doc_get_/menu')
+CART_DOC_ID = get_md5('api_doc_post_/cart')
+
+def create_doc_app(make_app, lazy):
+    app, route_loader = make_app()
+
+    @route_loader.route(app, MENU_CONFIG)
+    def menu():
+        return jsonify({})
+
+    @route_loader.route(app, CART_CONFIG)
+    def cart():
+        return jsonify({})
+
+    route_loader.create_doc(app, '/doc', lazy=lazy)
+    app.route_loader = route_loader
+    return app
+
+@pytest.fixture(params=[False, True], ids=['full', 'lazy'])
+def app(request, make_app):
+    return create_doc_app(make_app, request.param)
+
+@pytest.fixture
+def lazy_app(make_app):
+    return create_doc_app(make_app, True)
+
+def test_doc_cache(app):
+    client = app.test_client()
+
+    response = client.get('/doc')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/html'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert 'Content-Encoding' not in response.headers
+
+    etag = response.headers['ETag']
+    assert client.get('/doc').headers['ETag'] == etag
+
+    response = client.get('/doc', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+def test_doc_gzip(app):
+    client = app.test_client()
+
+    html = client.get('/doc').data
+    response = client.get('/doc', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == html
+
+    # Not the ETag of the uncompressed page
+    etag = response.headers['ETag']
+    assert etag != client.get('/doc').headers['ETag']
+    assert client.get('/doc', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}).status_code == 304
+
+def test_routes_version(app):
+    client = app.test_client()
+
+    etag = client.get('/doc').headers['ETag']
+
+    # Route updated after the page is rendered, e.g. by the route file reloader
+    new_menu_config = dict(MENU_CONFIG, name='Menu of the day')
+    assert app.route_loader.update_route_config(MENU_CONFIG, new_menu_config) is True
+
+    response = client.get('/doc', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert b'Menu of the day' in response.data
+
+def test_lazy_page(app):
+    html = app.test_client().get('/doc').get_data(as_text=True)
+
+    # Details are in fragments in lazy mode only
+    assert MENU_DOC_ID in html
+    assert ('Canteen ID' in html) is not app.route_loader.doc_lazy
+
+def test_lazy_fragment(lazy_app):
+    client = lazy_app.test_client()
+
+    response = client.get('/doc/routes/' + MENU_DOC_ID)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/html'
+    assert 'Canteen ID' in response.get_data(as_text=True)
+
+    etag = response.headers['ETag']
+    assert client.get('/doc/routes/' + MENU_DOC_ID, headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/doc/routes/' + CART_DOC_ID).headers['ETag'] != etag
+
+    assert client.get('/doc/routes/no-such-route').status_code == 404
+
+def test_lazy_fragment_reused(lazy_app):
+    client = lazy_app.test_client()
+
+    menu_etag = client.get('/doc/routes/' + MENU_DOC_ID).headers['ETag']
+    cart_etag = client.get('/doc/routes/' + CART_DOC_ID).headers['ETag']
+
+    new_cart_config = dict(CART_CONFIG, body={'dishId': {'$type': 'int', '$desc': 'ID of the dish'}})
+    assert lazy_app.route_loader.update_route_config(CART_CONFIG, new_cart_config) is True
+
+    # Only the fragment of the changed route is rendered again
+    assert client.get('/doc/routes/' + MENU_DOC_ID).headers['ETag'] == menu_etag
+
+    response = client.get('/doc/routes/' + CART_DOC_ID)
+    assert response.headers['ETag'] != cart_etag
+    assert 'ID of the dish' in response.get_data(as_text=True)
+
+def test_lazy_fragment_json(lazy_app):
+    client = lazy_app.test_client()
+
+    response = client.get('/doc/routes/' + MENU_DOC_ID + '?format=json')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/json'
+
+    data = response.get_json()
+    assert data['apiDocId'] == MENU_DOC_ID
+    assert data['method'] == 'get'
+    assert data['url'] == '/menu'
+    assert data['config']['query'] == MENU_CONFIG['query']
+    assert set(data['samples']['query']) == {'canteenId'}
+
+    assert client.get('/doc/routes/no-such-route?format=json').status_code == 404
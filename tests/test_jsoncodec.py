@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from flask import jsonify, g
+
+from pt_dcxt.jsoncodec import AVAILABLE_JSON_CODECS, JSONCodec, get_json_codec
+
+BIG_INT = 2 ** 64 + 1
+
+ITEM_CONFIG = {
+    'method': 'post',
+    'url'   : '/items',
+    'query': {
+        'tag': {'$matchRegExp': '^[a-z]+$'},
+    },
+    'body': {
+        'id'   : {'$type': 'int'},
+        'score': {'$type': 'float', '$isOptional': True},
+    },
+}
+
+@pytest.fixture(params=AVAILABLE_JSON_CODECS)
+def client(request, make_app):
+    app, route_loader = make_app(json_codec=request.param)
+
+    @route_loader.route(app, ITEM_CONFIG)
+    def post_item():
+        return jsonify({'id': str(g.body['id']), 'score': repr(g.body.get('score')), 'tag': g.query.get('tag')})
+
+    return app.test_client()
+
+def test_default_codec():
+    assert type(get_json_codec()) is JSONCodec
+
+def test_unavailable_codec():
+    with pytest.raises(ValueError):
+        get_json_codec('no-such-codec')
+
+@pytest.mark.parametrize('codec', AVAILABLE_JSON_CODECS)
+@pytest.mark.parametrize('data, expected', [
+    ('{"a": 1, "b": [1.5, "s", true, null]}', {'a': 1, 'b': [1.5, 's', True, None]}),
+    ('{"a": ' + str(BIG_INT) + '}',           {'a': BIG_INT}),
+    ('{"a": -' + str(BIG_INT) + '}',          {'a': -BIG_INT}),
+])
+def test_loads_fallback(codec, data, expected):
+    value = get_json_codec(codec).loads(data)
+    assert value == expected
+    assert type(value['a']) is type(expected['a'])
+
+@pytest.mark.parametrize('codec', AVAILABLE_JSON_CODECS)
+def test_loads_nan(codec):
+    value = get_json_codec(codec).loads('{"a": NaN}')
+    assert value['a'] != value['a']
+
+@pytest.mark.parametrize('codec', AVAILABLE_JSON_CODECS)
+def test_loads_invalid(codec):
+    with pytest.raises(ValueError):
+        get_json_codec(codec).loads('{"a": ')
+
+@pytest.mark.parametrize('codec', AVAILABLE_JSON_CODECS)
+def test_dumps_fallback(codec):
+    json_codec = get_json_codec(codec)
+    assert json_codec.loads(json_codec.dumps({'a': BIG_INT})) == {'a': BIG_INT}
+
+def test_body_and_query(client):
+    resp = client.post('/items?tag=new', data='{"id": 1, "score": 0.5}', content_type='application/json')
+    assert resp.status_code == 200
+    assert resp.get_json() == {'id': '1', 'score': '0.5', 'tag': 'new'}
+
+def test_big_int_body(client):
+    resp = client.post('/items', data='{"id": ' + str(BIG_INT) + '}', content_type='application/json')
+    assert resp.status_code == 200
+    assert resp.get_json()['id'] == str(BIG_INT)
+
+def test_nan_body(client):
+    resp = client.post('/items', data='{"id": 1, "score": NaN}', content_type='application/json')
+    assert resp.status_code == 200
+    assert resp.get_json()['score'] == 'nan'
+
+@pytest.mark.parametrize('data', ['{"id": ', '{"id": "1"}'])
+def test_bad_body(client, data):
+    resp = client.post('/items', data=data, content_type='application/json')
+    assert resp.status_code == 400
+
+def test_bad_query(client):
+    resp = client.post('/items?tag=NEW', data='{"id": 1}', content_type='application/json')
+    assert resp.status_code == 400
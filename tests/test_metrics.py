@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import shutil
+import json
+import os
+
+from pt_dcxt.metrics import RouteMetrics, get_file_pid
+
+CONFIG = {'method': 'get', 'url': '/menu'}
+
+def get_requests_total(metrics):
+    counters, _ = metrics.collect()
+    return sum(v for (name, _), v in counters.items() if name == 'requests_total')
+
+def test_collect_without_metrics_dir():
+    metrics = RouteMetrics()
+    metrics.observe_request(CONFIG, {'total': 0.01}, 200)
+    metrics.observe_request(CONFIG, {'total': 0.01}, 400, {'detail': {'type': 'invalid', 'checkerName': '$type'}})
+
+    assert get_requests_total(metrics) == 2
+    assert 'routeloader_rejections_total{route="/menu",method="GET",type="invalid",checker="$type"} 1' in metrics.export()
+
+def test_files_of_processes(tmpdir):
+    metrics_dir = str(tmpdir)
+    metrics = RouteMetrics(metrics_dir=metrics_dir)
+    metrics.observe_request(CONFIG, {'total': 0.01}, 200)
+    metrics.flush(force=True)
+
+    file_names = os.listdir(metrics_dir)
+    assert len(file_names) == 1
+    assert get_file_pid(file_names[0]) == os.getpid()
+
+    # File of an exited process
+    dead_dump = {'buckets': list(metrics.buckets), 'counters': [['requests_total', [['route', '/menu']], 3]], 'histograms': []}
+    with open(os.path.join(metrics_dir, 'metrics_999999999_0000.json'), 'w') as _f:
+        _f.write(json.dumps(dead_dump))
+
+    assert get_requests_total(metrics) == 4
+    assert 'metrics_999999999_0000.json' not in os.listdir(metrics_dir)
+    assert 'metrics_archive.json' in os.listdir(metrics_dir)
+    assert get_requests_total(metrics) == 4
+
+    # At exit
+    metrics.close()
+    metrics.observe_request(CONFIG, {'total': 0.01}, 200)
+    assert [n for n in os.listdir(metrics_dir) if get_file_pid(n) is not None] == []
+    assert get_requests_total(RouteMetrics(metrics_dir=metrics_dir)) == 4
+
+def test_concurrent_flush(tmpdir):
+    metrics_dir = str(tmpdir)
+    metrics = RouteMetrics(metrics_dir=metrics_dir, flush_interval=0)
+
+    errors = []
+    def observe():
+        try:
+            for _ in range(200):
+                metrics.observe_request(CONFIG, {'total': 0.01}, 200)
+                metrics.flush(force=True)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=observe) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert [n for n in os.listdir(metrics_dir) if n.endswith('.tmp')] == []
+    assert get_requests_total(metrics) == 1600
+
+def test_flush_error(tmpdir, caplog):
+    metrics_dir = str(tmpdir.join('metrics'))
+    metrics = RouteMetrics(metrics_dir=metrics_dir, flush_interval=0)
+    shutil.rmtree(metrics_dir)
+
+    # Not raised in the request path
+    metrics.observe_request(CONFIG, {'total': 0.01}, 200)
+    assert 'Failed to flush metrics' in caplog.text
+
+    metrics.close()
+    assert 'Failed to archive metrics' in caplog.text
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import re
+
+import pytest
+from flask import jsonify
+
+class Recorder(object):
+    # Middleware object with `before` and `after`, recording the call order
+    def __init__(self, name, calls, short_circuit=False):
+        self.__name__      = name
+        self.name          = name
+        self.calls         = calls
+        self.short_circuit = short_circuit
+
+    def before(self, config):
+        self.calls.append(self.name + '.before')
+        if self.short_circuit:
+            return jsonify({'shortCircuit': self.name}), 403
+
+    def after(self, config, response):
+        self.calls.append(self.name + '.after')
+        response.headers['X-After-' + self.name] = config['url']
+
+@pytest.fixture
+def calls():
+    return []
+
+@pytest.fixture
+def client(make_app, calls):
+    def global_middleware(config):
+        calls.append('global')
+
+    def replace_response(config, response):
+        calls.append('replace.after')
+        return jsonify({'replaced': response.get_json()})
+
+    replacer = type('Replacer', (object,), {'after': staticmethod(replace_response)})()
+
+    app, route_loader = make_app(middlewares=global_middleware, server_timing=True)
+
+    @route_loader.route(app, {'method': 'get', 'url': '/order'}, [Recorder('outer', calls), Recorder('inner', calls)])
+    def order():
+        calls.append('handler')
+        return jsonify({'ok': True})
+
+    @route_loader.route(app, {'method': 'get', 'url': '/short'}, [Recorder('outer', calls), Recorder('stop', calls, short_circuit=True), Recorder('inner', calls)])
+    def short():
+        calls.append('handler')
+        return jsonify({'ok': True})
+
+    @route_loader.route(app, {'method': 'get', 'url': '/replace'}, replacer)
+    def replace():
+        calls.append('handler')
+        return jsonify({'ok': True})
+
+    return app.test_client()
+
+def test_order(client, calls):
+    response = client.get('/order')
+    assert response.status_code == 200
+    assert calls == ['global', 'outer.before', 'inner.before', 'handler', 'inner.after', 'outer.after']
+    assert response.headers['X-After-outer'] == '/order'
+    assert response.headers['X-After-inner'] == '/order'
+
+def test_short_circuit(client, calls):
+    response = client.get('/short')
+    assert response.status_code == 403
+    assert response.get_json() == {'shortCircuit': 'stop'}
+    # Inner middlewares and handler are skipped, `after` of outer ones still run
+    assert calls == ['global', 'outer.before', 'stop.before', 'outer.after']
+    assert response.headers['X-After-outer'] == '/short'
+
+def test_replace_response(client, calls):
+    response = client.get('/replace')
+    assert response.get_json() == {'replaced': {'ok': True}}
+    assert calls == ['global', 'handler', 'replace.after']
+
+def test_server_timing(client):
+    response = client.get('/order')
+
+    timings = dict(re.match(r'^([\w.]+);dur=([0-9.]+)$', t).groups() for t in response.headers['Server-Timing'].split(', '))
+    for name in ('middleware.global_middleware', 'middleware.outer', 'middleware.outer.after', 'middleware.inner', 'handler'):
+        assert float(timings[name]) >= 0
+
+    response = client.get('/short')
+    assert 'handler' not in response.headers['Server-Timing']
+
+def test_no_server_timing(make_app):
+    app, route_loader = make_app()
+
+    @route_loader.route(app, {'method': 'get', 'url': '/'})
+    def index():
+        return 'ok'
+
+    response = app.test_client().get('/')
+    assert response.data == b'ok'
+    assert 'Server-Timing' not in response.headers
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+import random
+import copy
+
+import pytest
+
+from pt_dcxt.objectchecker import ObjectChecker, get_option_set, create_validation_budget
+
+OPTIONS = OrderedDict([
+    ('intField', {
+        '$type'    : 'int',
+        '$minValue': 1,
+        '$maxValue': 10,
+    }),
+    ('strField', {
+        '$type'       : 'string',
+        '$minLength'  : 1,
+        '$maxLength'  : 5,
+        '$matchRegExp': '^[a-z]+$',
+    }),
+    ('enumField', {
+        '$type'      : 'enum',
+        '$in'        : ['a', 'b', 'c'],
+        '$isOptional': True,
+    }),
+    ('commaField', {
+        '$type'        : 'commaArray',
+        '$commaArrayIn': ['a', 'b'],
+        '$isOptional'  : True,
+    }),
+    ('nullField', {
+        '$type'     : 'int',
+        '$allowNull': True,
+    }),
+    ('jsonField', {
+        '$type': 'json',
+        'a'    : {'$type': 'int'},
+    }),
+    ('anyField', {
+        '$type'      : 'any',
+        '$isOptional': True,
+    }),
+    ('arrayField', {
+        '$minLength': 0,
+        '$': {
+            'id'  : {'$type': 'int', '$minValue': 0},
+            'name': {'$type': 'string', '$notIn': ['x']},
+        },
+    }),
+    ('numbers', {
+        '$isOptional': True,
+        '$': {'$type': 'number', '$minValue': 0, '$maxValue': 100},
+    }),
+])
+
+SAMPLE = {
+    'intField'  : 5,
+    'strField'  : 'abc',
+    'enumField' : 'a',
+    'commaField': 'a,b',
+    'nullField' : None,
+    'jsonField' : {'a': 1, 'b': 2},
+    'anyField'  : [{'x': 1}],
+    'arrayField': [{'id': i, 'name': 'n{}'.format(i)} for i in range(40)],
+    'numbers'   : [i * 0.5 for i in range(40)],
+}
+
+VALUES = [None, 0, 1, 11, -3, 2.5, '', 'a', 'abc', 'a,x', 'x', 'ABCDEFG', True, [], [1, 2], {}, {'a': 'x'}, {'x': 1}]
+
+def mutate(obj, rand):
+    obj = copy.deepcopy(obj)
+
+    def walk(x):
+        if isinstance(x, dict):
+            for k in list(x):
+                r = rand.random()
+                if r < 0.05:
+                    del x[k]
+                elif r < 0.15:
+                    x[k] = rand.choice(VALUES)
+                else:
+                    walk(x[k])
+
+            if rand.random() < 0.02:
+                x['extra'] = 1
+
+        elif isinstance(x, list):
+            for i in range(len(x)):
+                if rand.random() < 0.02:
+                    x[i] = rand.choice(VALUES)
+                else:
+                    walk(x[i])
+
+    walk(obj)
+    return obj
+
+@pytest.mark.parametrize('default_required', [True, False])
+@pytest.mark.parametrize('batch_min_length', [0, 1, 32])
+def test_compiled_same_as_uncompiled(default_required, batch_min_length):
+    rand = random.Random(batch_min_length)
+    checker = ObjectChecker(default_required=default_required, batch_min_length=batch_min_length)
+    compiled_checker = checker.compile(OPTIONS)
+
+    for i in range(1500):
+        obj = mutate(SAMPLE, rand) if i else SAMPLE
+        assert compiled_checker.check(obj) == checker.check(obj, OPTIONS), obj
+
+def test_sample_is_valid():
+    checker = ObjectChecker()
+    assert checker.is_valid(SAMPLE, OPTIONS)
+    assert checker.compile(OPTIONS).is_valid(SAMPLE)
+
+@pytest.mark.parametrize('value', ['abc', 1, [1], None, True])
+def test_fields_of_non_object(value):
+    options = {'obj': {'a': {'$type': 'int'}}}
+    checker = ObjectChecker()
+
+    ret = checker.check({'obj': value}, options)
+    assert ret['isValid'] is False
+    assert ret['detail']['fieldName'] == 'obj'
+    assert ret['detail']['checkerName'] == '$type'
+    assert checker.compile(options).check({'obj': value}) == ret
+
+def test_fields_of_non_object_elements():
+    options = {'$': {'a': {'$type': 'int'}}}
+    checker = ObjectChecker(batch_min_length=1)
+
+    ret = checker.compile(options).check([{'a': 1}, 'abc'])
+    assert ret['isValid'] is False
+    assert ret['detail']['fieldName'] == 'obj[1]'
+    assert ret == checker.check([{'a': 1}, 'abc'], options)
+
+def test_comma_array_in():
+    options = {'$type': 'commaArray', '$commaArrayIn': ['a', 'b']}
+    checker = ObjectChecker()
+
+    for value, is_valid in [('a', True), ('a,b', True), ('b,a,a', True), ('a,c', False), ('', False)]:
+        assert checker.is_valid(value, options) is is_valid
+        assert checker.compile(options).is_valid(value) is is_valid
+
+def test_comma_array_in_option_set():
+    in_options = ['a', 'b']
+    options = {'$type': 'commaArray', '$commaArrayIn': in_options}
+    checker = ObjectChecker()
+
+    assert checker.is_valid('a,b', options)
+    option_set = get_option_set(in_options)
+    assert option_set == frozenset(in_options)
+    assert checker.is_valid('b', options)
+    assert get_option_set(in_options) is option_set
+    # Equal options of another route config are not mixed up by identity
+    assert get_option_set(['c']) == frozenset(['c'])
+
+def nest(depth):
+    obj = 1
+    for _ in range(depth):
+        obj = {'a': obj}
+
+    return obj
+
+@pytest.mark.parametrize('obj, checker_name, field_name', [
+    (nest(5)                                , '$maxDepth'       , 'a'),
+    ([[[[[1]]]]]                            , '$maxDepth'       , 'obj[0][0][0][0]'),
+    ({'a': list(range(11))}                 , '$maxArrayLength' , 'a'),
+    ({'a': {'b': 'x' * 11}}                 , '$maxStringLength', 'b'),
+    ('x' * 11                               , '$maxStringLength', 'obj'),
+    ({'a': [{'b': 1} for _ in range(10)]}   , '$maxNodes'       , 'a[1]'),
+])
+def test_budget(obj, checker_name, field_name):
+    budget = create_validation_budget({'maxDepth': 4, 'maxNodes': 20, 'maxArrayLength': 10, 'maxStringLength': 10})
+    compiled_checker = ObjectChecker().compile({'$type': 'any'}, budget)
+
+    ret = compiled_checker.check(obj)
+    assert ret['isValid'] is False
+    assert ret['detail']['type'] == 'overBudget'
+    assert ret['detail']['checkerName'] == checker_name
+    assert ret['detail']['fieldName'] == field_name
+
+def test_budget_of_described_values():
+    options = {
+        'a': {
+            '$type': 'json',
+            'b'    : {'$': {'$type': 'int'}},
+        },
+        'c': {'$type': 'string'},
+    }
+    budget = create_validation_budget({'maxDepth': 3, 'maxNodes': 20, 'maxArrayLength': 10, 'maxStringLength': 10})
+    compiled_checker = ObjectChecker(batch_min_length=1).compile(options, budget)
+
+    assert compiled_checker.is_valid({'a': {'b': [1, 2]}, 'c': 'x'})
+    assert compiled_checker.check({'a': {'b': list(range(11))}, 'c': 'x'})['detail']['checkerName'] == '$maxArrayLength'
+    assert compiled_checker.check({'a': {'b': [1]}, 'c': 'x' * 11})['detail']['checkerName'] == '$maxStringLength'
+    # Values not described by options count too
+    assert compiled_checker.check({'a': {'b': [1], 'd': {'e': [1]}}, 'c': 'x'})['detail']['checkerName'] == '$maxDepth'
+    assert compiled_checker.check({'a': {'b': [1], 'd': 'x' * 11}, 'c': 'x'})['detail']['checkerName'] == '$maxStringLength'
+    assert compiled_checker.check({'a': {'b': [1], 'd': list(range(20))}, 'c': 'x'})['detail']['checkerName'] == '$maxArrayLength'
+
+def test_budget_of_deeply_nested_payload():
+    budget = create_validation_budget({'maxDepth': 32})
+    compiled_checker = ObjectChecker().compile({'a': {'$type': 'any'}}, budget)
+
+    ret = compiled_checker.check({'a': nest(100000)})
+    assert ret['detail']['type'] == 'overBudget'
+    assert ret['detail']['checkerName'] == '$maxDepth'
+
+def test_budget_skipped():
+    budget = create_validation_budget({'maxStringLength': 1})
+    compiled_checker = ObjectChecker().compile({'$type': 'string'}, budget)
+
+    compiled_checker.verify('abc', check_budget=False)
+    assert compiled_checker.check('abc')['detail']['type'] == 'overBudget'
+
+@pytest.mark.parametrize('values, options', [
+    # Integers over 2 ** 53 mixed with floats
+    ([0.5] * 2000 + [2 ** 60 + 1]                       , {'$maxValue': 2 ** 60}),
+    ([0.5] * 2000 + [-2 ** 60 - 1]                      , {'$minValue': -2 ** 60}),
+    # An integer bound rounded up by float64
+    ([0.5] * 2000 + [float(2 ** 53 + 4)]                , {'$maxValue': 2 ** 53 + 3}),
+    ([0.5] * 2000 + [float('nan')]                      , {'$maxValue': 1}),
+])
+def test_batch_number_column(values, options):
+    options = {'$': dict(options, **{'$type': 'number'})}
+    checker = ObjectChecker(batch_min_length=1)
+
+    ret = checker.check(values, options)
+    assert ret['isValid'] is False
+    assert checker.compile(options).check(values) == ret
+
+    assert checker.compile(options).is_valid(values[:-1])
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import sqlite3
+import random
+
+import pytest
+from flask import jsonify, g
+
+from pt_dcxt.paging import CursorCodec
+
+ORDERS_CONFIG = {
+    'method': 'get',
+    'url'   : '/orders',
+    'paging': {
+        'key'         : ['createdAt', 'id'],
+        'order'       : 'desc',
+        'defaultLimit': 25,
+        'maxLimit'    : 50,
+    },
+    'query': {
+        'status': {'$type': 'enum', '$in': ['paid', 'new'], '$isOptional': True},
+    },
+}
+
+@pytest.fixture
+def client(make_app):
+    db = sqlite3.connect(':memory:', check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    db.execute('CREATE TABLE orders (id INTEGER PRIMARY KEY, created_at TEXT)')
+
+    rand = random.Random(1)
+    for i in range(1, 238):
+        db.execute('INSERT INTO orders VALUES (?, ?)', (i, '2026-01-{:02d}'.format(rand.randint(1, 28))))
+
+    app, route_loader = make_app(paging_secret='s3cret')
+
+    @route_loader.route(app, ORDERS_CONFIG)
+    def get_orders():
+        paging = g.paging
+        condition, values = paging.sql_condition(['created_at', 'id'])
+        rows = db.execute('SELECT id, created_at AS createdAt FROM orders WHERE ' + condition +
+            ' ORDER BY created_at DESC, id DESC LIMIT ?', values + [paging.fetch_limit]).fetchall()
+        return jsonify(paging.page([dict(r) for r in rows]))
+
+    @route_loader.route(app, {'method': 'get', 'url': '/items', 'paging': True, 'query': {'limit': {'$type': 'string'}}})
+    def get_items():
+        return jsonify({'limit': g.paging.limit})
+
+    @route_loader.route(app, {'method': 'get', 'url': '/other', 'paging': True})
+    def get_other():
+        return jsonify(g.paging.page([]))
+
+    client = app.test_client()
+    client.ids = [r[0] for r in db.execute('SELECT id FROM orders ORDER BY created_at DESC, id DESC')]
+    return client
+
+def test_pages(client):
+    ids = []
+    cursor = ''
+    while True:
+        response = client.get('/orders?cursor=' + cursor)
+        assert response.status_code == 200
+
+        ids += [item['id'] for item in response.json['items']]
+        cursor = response.json['nextCursor']
+        if not cursor:
+            break
+
+    assert ids == client.ids
+
+@pytest.mark.parametrize('query, checker_name', [
+    ('limit=51'        , '$maxValue'),
+    ('limit=0'         , '$minValue'),
+    ('limit=abc'       , '$matchRegExp'),
+    ('cursor=!!'       , '$matchRegExp'),
+    ('cursor=AAAA'     , '$signedCursor'),
+])
+def test_invalid_paging(client, query, checker_name):
+    response = client.get('/orders?' + query)
+    assert response.status_code == 400
+    assert response.json['detail']['checkerName'] == checker_name
+
+def test_cursor_of_other_route_or_secret(client):
+    cursor = client.get('/orders?limit=1').json['nextCursor']
+    assert client.get('/other?cursor=' + cursor).status_code == 400
+
+    # Tampered
+    assert client.get('/orders?cursor=' + cursor[:-2] + 'AA').status_code == 400
+
+    assert CursorCodec('s3cret').decode('GET /orders', cursor) is not None
+    assert CursorCodec('other').decode('GET /orders', cursor) is None
+
+@pytest.mark.parametrize('limit', ['abc', '1.5', ' '])
+def test_limit_declared_by_route(client, limit):
+    response = client.get('/items?limit=' + limit)
+    assert response.status_code == 400
+    assert response.json['detail']['fieldName'] == 'limit'
+    assert response.json['detail']['checkerName'] == '$type'
+
+    assert client.get('/items?limit=7').json == {'limit': 7}
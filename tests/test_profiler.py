@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import marshal
+
+import pytest
+
+TOKEN = 's3cret'
+
+@pytest.fixture
+def create_app(make_app):
+    return lambda *args, **kwargs: create_profiler_app(make_app, *args, **kwargs)
+
+def create_profiler_app(make_app, profile_dir, trigger_token=TOKEN, handler=None):
+    app, route_loader = make_app()
+
+    @route_loader.route(app, {'method': 'get', 'url': '/menu'})
+    def menu():
+        if handler is not None:
+            handler()
+
+        return 'menu'
+
+    route_loader.create_profiler(app, '/profiles', profile_dir=profile_dir, trigger_token=trigger_token)
+    return app, route_loader
+
+def test_profiles(create_app, tmpdir):
+    app, _ = create_app(str(tmpdir))
+    client = app.test_client()
+
+    assert client.get('/menu', headers={'X-Profile': TOKEN}).status_code == 200
+    assert client.get('/menu', headers={'X-Profile': 'wrong'}).status_code == 200
+
+    assert client.get('/profiles').status_code == 403
+    assert client.get('/profiles?token=wrong').status_code == 403
+
+    profiles = client.get('/profiles?token=' + TOKEN).json['profiles']
+    assert [(p['name'], p['files']) for p in profiles] == [('GET_menu', 1)]
+
+    response = client.get('/profiles/GET_menu', headers={'X-Profile': TOKEN})
+    assert response.status_code == 200
+    assert marshal.loads(response.data)
+
+    response = client.get('/profiles/GET_menu?format=text&token=' + TOKEN)
+    assert 'function calls' in response.data.decode('utf-8')
+    assert client.get('/profiles/GET_menu?format=text&sort=bad&token=' + TOKEN).status_code == 400
+    assert client.get('/profiles/..%2Fetc?token=' + TOKEN).status_code == 404
+
+    assert client.delete('/profiles/GET_menu').status_code == 403
+    assert client.delete('/profiles/GET_menu?token=' + TOKEN).status_code == 200
+    assert client.get('/profiles?token=' + TOKEN).json['profiles'] == []
+
+def test_profiles_disabled_without_token(create_app, tmpdir):
+    app, _ = create_app(str(tmpdir), trigger_token=None)
+    client = app.test_client()
+
+    assert client.get('/profiles').status_code == 404
+    assert client.get('/profiles/GET_menu').status_code == 404
+    assert client.delete('/profiles/GET_menu').status_code == 404
+
+def test_concurrent_profiles(create_app, tmpdir):
+    # The first request is profiled, the second one runs meanwhile without profiling
+    entered = threading.Event()
+    release = threading.Event()
+
+    def handler():
+        if not entered.is_set():
+            entered.set()
+            release.wait(5)
+
+    app, route_loader = create_app(str(tmpdir), handler=handler)
+    client = app.test_client()
+
+    status_codes = []
+    thread = threading.Thread(target=lambda: status_codes.append(client.get('/menu', headers={'X-Profile': TOKEN}).status_code))
+    thread.start()
+    assert entered.wait(5)
+
+    assert app.test_client().get('/menu', headers={'X-Profile': TOKEN}).status_code == 200
+
+    release.set()
+    thread.join(5)
+    assert status_codes == [200]
+
+    assert [p['name'] for p in route_loader.profiler.list_profiles()] == ['GET_menu']
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import io
+
+import pytest
+from flask import jsonify, g
+
+ORDER_CONFIG = {
+    'method'     : 'post',
+    'url'        : '/orders/<orderId>',
+    'maxBodySize': 64,
+    'contentType': 'application/json',
+    'headers': {
+        'X-Client': {'$in': ['app', 'web'], '$isRequired': True},
+    },
+    'params': {
+        'orderId': {'$matchRegExp': '^[0-9]+$'},
+    },
+    'query': {
+        'dryRun': {'$in': ['0', '1']},
+    },
+    'body': {
+        'note': {'$type': 'string', '$isOptional': True},
+    },
+}
+
+HEADERS = {'X-Client': 'app'}
+
+@pytest.fixture
+def client(make_app):
+    app, route_loader = make_app()
+
+    @route_loader.route(app, ORDER_CONFIG)
+    def post_order(orderId):
+        return jsonify({'orderId': orderId, 'body': g.body})
+
+    @route_loader.route(app, {'method': 'post', 'url': '/upload', 'maxBodySize': 64})
+    def upload():
+        return 'ok'
+
+    return app.test_client()
+
+def chunked(data):
+    # Without `Content-Length`, servers set `wsgi.input_terminated` for chunked bodies
+    return {'input_stream': io.BytesIO(data), 'environ_overrides': {'wsgi.input_terminated': True}}
+
+def test_valid(client):
+    response = client.post('/orders/1?dryRun=1', json={'note': 'x'}, headers=HEADERS)
+    assert response.status_code == 200
+    assert response.json == {'orderId': '1', 'body': {'note': 'x'}}
+
+@pytest.mark.parametrize('url, headers, field_name', [
+    ('/orders/1'         , {}                   , 'X-Client'),
+    ('/orders/1'         , {'X-Client': 'other'}, 'X-Client'),
+    ('/orders/x'         , HEADERS              , 'orderId'),
+    ('/orders/1?dryRun=2', HEADERS              , 'dryRun'),
+])
+def test_invalid_before_body(client, url, headers, field_name):
+    response = client.post(url, json={'note': 'x'}, headers=headers)
+    assert response.status_code == 400
+    assert response.json['detail']['fieldName'] == field_name
+
+def test_body_size(client):
+    response = client.post('/orders/1', json={'note': 'x' * 100}, headers=HEADERS)
+    assert response.status_code == 413
+    assert response.json['detail']['checkerName'] == '$maxBodySize'
+    assert response.json['detail']['fieldValue'] > 64
+
+    # Chunked bodies are cut off while reading
+    response = client.post('/orders/1', headers=dict(HEADERS, **{'Content-Type': 'application/json', 'Transfer-Encoding': 'chunked'}),
+        **chunked(b'{"note": "' + b'x' * 100 + b'"}'))
+    assert response.status_code == 413
+
+    # Routes without body checking
+    assert client.post('/upload', data=b'x' * 64).status_code == 200
+    assert client.post('/upload', data=b'x' * 65).status_code == 413
+    assert client.post('/upload', headers={'Transfer-Encoding': 'chunked'}, **chunked(b'x' * 64)).status_code == 200
+    assert client.post('/upload', headers={'Transfer-Encoding': 'chunked'}, **chunked(b'x' * 65)).status_code == 413
+
+def test_content_type(client):
+    response = client.post('/orders/1', data='note=x', headers=dict(HEADERS, **{'Content-Type': 'application/x-www-form-urlencoded'}))
+    assert response.status_code == 415
+    assert response.json['detail']['checkerName'] == '$contentType'
+    assert response.json['detail']['checkerOption'] == ['application/json']
+
+    # Without body
+    assert client.post('/orders/1', headers=HEADERS).status_code == 200
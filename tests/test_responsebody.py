@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+
+RESPONSE_BODY = {
+    'id'   : {'$type': 'int', '$isRequired': True},
+    'name' : {'$type': 'string'},
+    'items': {'$': {'n': {'$type': 'int'}}},
+    'extra': {'$type': 'any'},
+}
+
+@pytest.fixture
+def create_app(make_app):
+    return lambda data: create_dish_app(make_app, data)
+
+def create_dish_app(make_app, data):
+    app, route_loader = make_app(response_sample_rate=1.0)
+
+    @route_loader.route(app, {'method': 'get', 'url': '/dish', 'response': 'json', 'responseBody': RESPONSE_BODY})
+    def get_dish():
+        return data
+
+    route_loader.create_metrics(app)
+    return app
+
+def get_violations(client):
+    return [l for l in client.get('/metrics').data.decode('utf-8').splitlines() if l.startswith('routeloader_response_violations_total')]
+
+def test_projection(create_app):
+    data = {'secret': 'x', 'items': [{'n': 1, 'drop': 2}], 'name': 'Noodles', 'id': 1, 'extra': {'k': [1]}}
+    client = create_app(data).test_client()
+
+    response = client.get('/dish')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/json'
+    # Declared fields only, in declared order
+    assert list(json.loads(response.data).items()) == [('id', 1), ('name', 'Noodles'), ('items', [{'n': 1}]), ('extra', {'k': [1]})]
+
+    # Fields removed by the projection are not violations
+    assert get_violations(client) == []
+
+def test_violations(create_app):
+    client = create_app({'id': 'x', 'secret': 'x'}).test_client()
+
+    response = client.get('/dish')
+    assert response.status_code == 200
+    assert json.loads(response.data) == {'id': 'x'}
+    assert get_violations(client) == ['routeloader_response_violations_total{route="/dish",method="GET",type="invalid",checker="$type"} 1']
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from flask import jsonify
+
+from pt_dcxt.responsecache import MemoryCacheBackend, SQLiteCacheBackend
+
+MENU_CONFIG = {
+    'method': 'get',
+    'url'   : '/menu/<canteenId>',
+    'query': {
+        'lang': {'$in': ['en', 'zh']},
+    },
+    'cache': {
+        'ttl'        : 60,
+        'maxEntries' : 2,
+        'varyHeaders': ['Accept-Language'],
+    },
+}
+
+NEWS_CONFIG = {
+    'method': 'get',
+    'url'   : '/news',
+    'cache' : True,
+}
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def cache_backend(request, tmpdir):
+    if request.param == 'sqlite':
+        return SQLiteCacheBackend(str(tmpdir.join('cache.db')))
+
+    return MemoryCacheBackend()
+
+@pytest.fixture
+def app(make_app, cache_backend):
+    app, route_loader = make_app(cache_backend=cache_backend)
+    app.calls = []
+
+    @route_loader.route(app, MENU_CONFIG)
+    def menu(canteenId):
+        app.calls.append(canteenId)
+        return jsonify({'canteenId': canteenId, 'calls': len(app.calls)})
+
+    @route_loader.route(app, NEWS_CONFIG)
+    def news():
+        app.calls.append('news')
+        return jsonify({'calls': len(app.calls)})
+
+    @route_loader.route(app, {'method': 'get', 'url': '/cookie', 'cache': True})
+    def cookie():
+        app.calls.append('cookie')
+        response = jsonify({})
+        response.set_cookie('k', 'v')
+        return response
+
+    app.route_loader = route_loader
+    return app
+
+def test_miss_and_hit(app):
+    client = app.test_client()
+
+    response = client.get('/menu/1')
+    assert response.status_code == 200
+    assert response.headers['X-Cache'] == 'MISS'
+    assert response.headers['ETag']
+    assert response.headers['Last-Modified']
+    assert 'Accept-Language' in response.headers['Vary']
+
+    cached = client.get('/menu/1')
+    assert cached.headers['X-Cache'] == 'HIT'
+    assert cached.headers['ETag'] == response.headers['ETag']
+    assert cached.get_json() == response.get_json()
+    assert app.calls == ['1']
+
+def test_cache_key(app):
+    client = app.test_client()
+
+    # URL params, query and vary-on headers are parts of the key
+    assert client.get('/menu/1').headers['X-Cache'] == 'MISS'
+    assert client.get('/menu/2').headers['X-Cache'] == 'MISS'
+    assert client.get('/menu/1?lang=en').headers['X-Cache'] == 'MISS'
+    assert client.get('/menu/1?lang=en', headers={'Accept-Language': 'en'}).headers['X-Cache'] == 'MISS'
+    assert client.get('/menu/1?lang=en', headers={'Accept-Language': 'en'}).headers['X-Cache'] == 'HIT'
+    assert len(app.calls) == 4
+
+def test_max_entries(app):
+    client = app.test_client()
+
+    for canteen_id in ('1', '2', '3'):
+        client.get('/menu/' + canteen_id)
+
+    # Least recently used entry is removed
+    assert client.get('/menu/1').headers['X-Cache'] == 'MISS'
+    assert client.get('/menu/3').headers['X-Cache'] == 'HIT'
+
+def test_not_modified(app):
+    client = app.test_client()
+
+    etag = client.get('/menu/1').headers['ETag']
+
+    response = client.get('/menu/1', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['X-Cache'] == 'HIT'
+
+    assert client.get('/menu/1', headers={'If-None-Match': '"other"'}).status_code == 200
+    assert app.calls == ['1']
+
+def test_invalid_request_not_cached(app):
+    client = app.test_client()
+
+    assert client.get('/menu/1?lang=fr').status_code == 400
+    assert app.calls == []
+
+def test_uncacheable_response(app):
+    client = app.test_client()
+
+    assert 'X-Cache' not in client.get('/cookie').headers
+    client.get('/cookie')
+    assert app.calls == ['cookie', 'cookie']
+
+def test_invalidate_cache(app):
+    client = app.test_client()
+
+    client.get('/menu/1')
+    client.get('/news')
+
+    # Of a route
+    app.route_loader.invalidate_cache(MENU_CONFIG)
+    assert client.get('/menu/1').headers['X-Cache'] == 'MISS'
+    assert client.get('/news').headers['X-Cache'] == 'HIT'
+
+    # Of all routes
+    app.route_loader.invalidate_cache()
+    assert client.get('/menu/1').headers['X-Cache'] == 'MISS'
+    assert client.get('/news').headers['X-Cache'] == 'MISS'
+
+def test_sqlite_shared(tmpdir):
+    # Entries are shared by backends of the same file, e.g. in other processes
+    db_path = str(tmpdir.join('cache.db'))
+    entry = {'status': 200, 'headers': [], 'body': b'{}', 'etag': 'x', 'lastModified': 0}
+
+    SQLiteCacheBackend(db_path).set('GET /news', 'key', entry, 60, 10)
+    assert SQLiteCacheBackend(db_path).get('GET /news', 'key') == entry
+
+    SQLiteCacheBackend(db_path).set('GET /news', 'expired', entry, -1, 10)
+    assert SQLiteCacheBackend(db_path).get('GET /news', 'expired') is None
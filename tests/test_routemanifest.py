@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from pt_dcxt.routemanifest import load_route_manifest
+
+ROUTE_YAML = '''
+getMenu:
+  method: get
+  url   : /menu
+  query:
+    canteenId:
+      $type: int
+'''
+
+def test_manifest(tmpdir):
+    file_path = str(tmpdir.join('route.yaml'))
+    with open(file_path, 'w') as _f:
+        _f.write(ROUTE_YAML)
+
+    manifest = load_route_manifest(file_path)
+    assert manifest['routes']['getMenu']['url'] == '/menu'
+    assert [path for path, _ in manifest['flattenedParamConfigs']] == [('getMenu', 'query')]
+    assert os.path.exists(file_path + '.manifest')
+
+    # Cached
+    assert load_route_manifest(file_path) == manifest
+
+def test_manifest_of_changed_file_with_same_mtime(tmpdir):
+    file_path = str(tmpdir.join('route.yaml'))
+    with open(file_path, 'w') as _f:
+        _f.write(ROUTE_YAML)
+
+    load_route_manifest(file_path)
+    mtime = os.path.getmtime(file_path)
+
+    with open(file_path, 'w') as _f:
+        _f.write(ROUTE_YAML.replace('/menu', '/dishes'))
+
+    os.utime(file_path, (mtime, mtime))
+    assert load_route_manifest(file_path)['routes']['getMenu']['url'] == '/dishes'
+
+def test_manifest_of_touched_file(tmpdir):
+    file_path = str(tmpdir.join('route.yaml'))
+    with open(file_path, 'w') as _f:
+        _f.write(ROUTE_YAML)
+
+    load_route_manifest(file_path)
+    os.utime(file_path, (1, 1))
+
+    manifest = load_route_manifest(file_path)
+    assert manifest['mtime'] == 1
+    assert manifest['routes']['getMenu']['url'] == '/menu'
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+from flask import g, jsonify
+
+from pt_dcxt.routemanifest import load_route_manifest
+from pt_dcxt.routereloader import RouteReloader
+
+ROUTE_YAML = '''
+getMenu:
+  method: get
+  url   : /menu
+  query:
+    canteenId:
+      $type     : string
+      $maxLength: {}
+getDish:
+  method: get
+  url   : /dish
+  query:
+    dishId:
+      $type: string
+'''
+
+def write_route_file(file_path, max_length):
+    with open(file_path, 'w') as _f:
+        _f.write(ROUTE_YAML.format(max_length))
+
+def test_reload(make_app, tmpdir):
+    file_path = str(tmpdir.join('route.yaml'))
+    write_route_file(file_path, 2)
+
+    route_manifest = load_route_manifest(file_path)
+    routes = route_manifest['routes']
+
+    app, route_loader = make_app(route_manifest=route_manifest)
+
+    @route_loader.route(app, routes['getMenu'])
+    def get_menu():
+        return jsonify(g.query)
+
+    @route_loader.route(app, routes['getDish'])
+    def get_dish():
+        return jsonify(g.query)
+
+    route_reloader = RouteReloader(route_loader, file_path, route_manifest)
+    client = app.test_client()
+    assert client.get('/menu?canteenId=abc').status_code == 400
+
+    for max_length in range(3, 13):
+        write_route_file(file_path, max_length)
+        report = route_reloader.reload()
+        assert report['updated'] == ['getMenu']
+        assert report['unchanged'] == ['getDish']
+
+        assert client.get('/menu?canteenId=' + 'x' * max_length).status_code == 200
+        assert client.get('/menu?canteenId=' + 'x' * (max_length + 1)).status_code == 400
+
+    # Entries of the latest manifest, and of the registered routes, not of every reload
+    assert len(route_loader._flattened_param_configs) <= 4
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+
+import pytest
+from flask import jsonify, g
+
+from pt_dcxt.signin import MemorySessionBackend, SQLiteSessionBackend
+
+class CountingBackend(object):
+    def __init__(self, backend):
+        self.backend = backend
+        self.calls   = 0
+
+    def get_session(self, token):
+        self.calls += 1
+        return self.backend.get_session(token)
+
+    def delete_session(self, token):
+        return self.backend.delete_session(token)
+
+@pytest.fixture
+def create_app(make_app):
+    return lambda *args, **kwargs: create_sign_in_app(make_app, *args, **kwargs)
+
+def create_sign_in_app(make_app, sign_in_backend=None, **options):
+    app, route_loader = make_app()
+
+    @route_loader.route(app, {'method': 'get', 'url': '/me', 'requireSignIn': True})
+    def me():
+        return jsonify(g.session)
+
+    @route_loader.route(app, {'method': 'get', 'url': '/cached-me', 'requireSignIn': True, 'cache': {'ttl': 60}})
+    def cached_me():
+        return jsonify({'session': g.get('session'), 'time': time.time()})
+
+    @route_loader.route(app, {'method': 'get', 'url': '/public'})
+    def public():
+        return 'public'
+
+    if sign_in_backend is not None:
+        route_loader.create_sign_in(sign_in_backend, **options)
+
+    return app, route_loader
+
+def auth(token):
+    return {'Authorization': 'Bearer ' + token}
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def session_backend(request, tmpdir):
+    if request.param == 'memory':
+        return MemorySessionBackend()
+
+    return SQLiteSessionBackend(str(tmpdir.join('sessions.db')))
+
+def test_sign_in(create_app, session_backend):
+    backend = CountingBackend(session_backend)
+    app, _ = create_app(backend)
+    client = app.test_client()
+    token = session_backend.create_session({'userId': 7})
+
+    response = client.get('/me')
+    assert response.status_code == 401
+    assert response.headers['WWW-Authenticate'] == 'Bearer'
+    assert response.json['detail']['type'] == 'unauthorized'
+    assert response.json['detail']['checkerName'] == '$requireSignIn'
+
+    assert client.get('/public').status_code == 200
+
+    for _ in range(5):
+        response = client.get('/me', headers=auth(token))
+        assert response.json == {'userId': 7}
+
+    # Verified once, then cached
+    assert backend.calls == 1
+
+    client.set_cookie('session', token)
+    assert client.get('/me').status_code == 200
+    client.delete_cookie('session')
+
+    assert client.get('/me', headers=auth('bad')).status_code == 401
+    assert client.get('/me', headers={'Authorization': 'Basic ' + token}).status_code == 401
+
+def test_negative_cache_and_expiry(create_app):
+    session_backend = MemorySessionBackend()
+    backend = CountingBackend(session_backend)
+    app, _ = create_app(backend, cache_ttl=0.2, negative_ttl=0.2)
+    client = app.test_client()
+
+    for _ in range(5):
+        assert client.get('/me', headers=auth('bad')).status_code == 401
+    assert backend.calls == 1
+
+    time.sleep(0.25)
+    client.get('/me', headers=auth('bad'))
+    assert backend.calls == 2
+
+    # Never cached longer than the session
+    token = session_backend.create_session({'userId': 1}, ttl=0.1)
+    assert client.get('/me', headers=auth(token)).status_code == 200
+    time.sleep(0.15)
+    assert client.get('/me', headers=auth(token)).status_code == 401
+
+def test_logout(create_app):
+    session_backend = MemorySessionBackend()
+    app, route_loader = create_app(session_backend)
+    client = app.test_client()
+    token = session_backend.create_session({'userId': 1})
+
+    assert client.get('/me', headers=auth(token)).status_code == 200
+    with app.test_request_context(headers=auth(token)):
+        route_loader.sign_in.logout()
+
+    assert client.get('/me', headers=auth(token)).status_code == 401
+
+def test_cache_of_each_session(create_app):
+    session_backend = MemorySessionBackend()
+    app, _ = create_app(session_backend)
+    client = app.test_client()
+    token_a = session_backend.create_session({'userId': 1})
+    token_b = session_backend.create_session({'userId': 2})
+
+    response_a = client.get('/cached-me', headers=auth(token_a))
+    assert response_a.json['session'] == {'userId': 1}
+    assert response_a.headers['X-Cache'] == 'MISS'
+
+    response_b = client.get('/cached-me', headers=auth(token_b))
+    assert response_b.json['session'] == {'userId': 2}
+    assert response_b.headers['X-Cache'] == 'MISS'
+
+    response = client.get('/cached-me', headers=auth(token_a))
+    assert response.headers['X-Cache'] == 'HIT'
+    assert response.json == response_a.json
+
+    assert client.get('/cached-me').status_code == 401
+
+def test_sign_in_not_enabled(create_app, caplog):
+    app, _ = create_app()
+    client = app.test_client()
+
+    with caplog.at_level(logging.WARNING, logger='pt_dcxt.routeloader'):
+        client.get('/cached-me')
+        client.get('/cached-me')
+
+    warnings = [r for r in caplog.records if 'requireSignIn' in r.getMessage()]
+    assert len(warnings) == 1
+
+    # Responses of any user are not cached
+    response = client.get('/cached-me')
+    assert response.status_code == 200
+    assert 'X-Cache' not in response.headers
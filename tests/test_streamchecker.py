@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import random
+import json
+import io
+
+import pytest
+from flask import jsonify, request, g
+
+from pt_dcxt.objectchecker import ObjectChecker, create_validation_budget
+from pt_dcxt.streamchecker import StreamChecker, STREAM_MAX_DEPTH
+
+from test_objectchecker import OPTIONS, SAMPLE, mutate
+
+ijson = pytest.importorskip('ijson')
+
+def stream_check(options, body, budget=None, chunk_size=7):
+    stream_checker = StreamChecker(ObjectChecker().compile(options, budget), chunk_size=chunk_size)
+    return stream_checker.check(io.BytesIO(body))
+
+def test_stream_same_as_buffered():
+    rand = random.Random(0)
+    compiled_checker = ObjectChecker().compile(OPTIONS)
+    stream_checker = StreamChecker(compiled_checker, chunk_size=7)
+
+    for i in range(500):
+        obj = mutate(SAMPLE, rand) if i else SAMPLE
+        ret = compiled_checker.check(obj)
+
+        # The first error may differ, the stream checker stops at the first invalid event
+        stream_ret, stream_obj = stream_checker.check(io.BytesIO(json.dumps(obj).encode('utf-8')))
+        assert stream_ret['isValid'] == ret['isValid'], obj
+        if ret['isValid']:
+            assert stream_obj == obj
+
+@pytest.mark.parametrize('body', [
+    b'{"a": 1180591620717411303424}',
+    b'{"a": -1180591620717411303424}',
+    b'{"a": 1.5}',
+    b'{"a": 1e400}',
+    b'{"a": [1, 2.25, -0.0, 12345678901234567890123]}',
+])
+def test_numbers(body):
+    ret, obj = stream_check({'a': {'$type': 'any'}}, body)
+    assert ret['isValid'] is True
+    assert obj == json.loads(body)
+    assert json.dumps(obj) == json.dumps(json.loads(body))
+
+def test_big_int_checked():
+    ret, _ = stream_check({'a': {'$type': 'int', '$maxValue': 10}}, b'{"a": 1180591620717411303424}')
+    assert ret['isValid'] is False
+    assert ret['detail']['checkerName'] == '$maxValue'
+
+    ret, obj = stream_check({'a': {'$type': 'number'}}, b'{"a": 2.5}')
+    assert ret['isValid'] is True
+    assert type(obj['a']) is float
+
+def test_stream_budget():
+    budget = create_validation_budget({'maxDepth': 3, 'maxArrayLength': 10})
+
+    ret, _ = stream_check({'$type': 'any'}, b'[[[[1]]]]', budget)
+    assert ret['detail']['checkerName'] == '$maxDepth'
+
+    ret, _ = stream_check({'a': {'$type': 'any'}}, b'{"a": [' + b','.join([b'1'] * 11) + b']}', budget)
+    assert ret['detail']['checkerName'] == '$maxArrayLength'
+
+def test_invalid_json():
+    with pytest.raises(ValueError):
+        stream_check({'a': {'$type': 'any'}}, b'{"a": [1,')
+
+def test_empty_body():
+    ret, obj = stream_check({'a': {'$type': 'any'}}, b'')
+    assert ret['isValid'] is True
+
+def test_deep_nesting_over_budget():
+    ret, _ = stream_check({'$type': 'any'}, b'[' * 100000 + b']' * 100000)
+    assert ret['detail']['type'] == 'overBudget'
+    assert ret['detail']['checkerName'] == '$maxDepth'
+    assert ret['detail']['checkerOption'] == STREAM_MAX_DEPTH
+
+@pytest.mark.parametrize('count', [100, 1000, 5000])
+def test_request_stream(make_app, count):
+    # Through the werkzeug request stream, which raises on `read(0)`
+    app, route_loader = make_app()
+
+    @route_loader.route(app, {'method': 'post', 'url': '/items', 'streamBody': True, 'body': {'items': {'$': {'$type': 'int'}}}})
+    def items():
+        return jsonify({'count': len(g.body['items']), 'size': len(request.get_data())})
+
+    body = json.dumps({'items': list(range(10000, 10000 + count))}).encode('utf-8')
+    response = app.test_client().post('/items', data=body, content_type='application/json')
+    assert response.status_code == 200
+    assert response.json == {'count': count, 'size': len(body)}
+
+    response = app.test_client().post('/items', data=body[:-1], content_type='application/json')
+    assert response.status_code == 400